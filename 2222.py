@@ -1,9 +1,15 @@
 import json
 import os
 import math
+import argparse
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from bs4 import BeautifulSoup
-from datetime import datetime
+from sitemap_fix import update_sitemaps, INDEX_NAME
+from site_scan import scan
+from page_templates import PageTemplates, ads_fragment, TEMPLATE_VERSION
+import nb_metrics, nb_profile
 
 # ✅ 读取配置文件中的域名
 with open("config.json", "r", encoding="utf-8") as f:
@@ -38,7 +44,7 @@ def load_keywords(category):
         return []
 
 def get_category_folders():
-    return [d for d in os.listdir() if os.path.isdir(d) and not d.startswith('.') and d.lower() not in ['images', 'generator', 'keywords']]
+    return scan().category_dirs()
 
 def generate_description(keyword):
     return f"{keyword.capitalize()} themed portrait showcasing unique visual storytelling and visual composition."
@@ -50,43 +56,17 @@ def generate_paragraph(keyword):
         f"This gallery explores {keyword} concepts through styled visuals and thoughtful design."
     )
 
-def generate_pages_and_images():
-    categories = get_category_folders()
-    for cat in categories:
-        folder = Path(cat)
-        images = sorted([f for f in folder.glob('*.jpg')])
-        keywords = load_keywords(cat)
-        per_page = 20
-        total_pages = math.ceil(len(images) / per_page)
-        for page in range(total_pages):
-            start = page * per_page
-            end = start + per_page
-            imgs = images[start:end]
-            page_file = folder / f'page{page+1}.html'
-            with open(page_file, 'w', encoding='utf-8') as f:
-                desc = f"Browse {cat} images. Page {page+1} of curated {cat}-style portrait collection."
-                f.write(f'<html><head><title>{cat.capitalize()} - Page {page+1}</title><meta name="description" content="{desc}"></head><body>')
-                f.write(f'<h1>{cat.capitalize()} Gallery - Page {page+1}</h1><p>{desc}</p>')
-                for idx, img_path in enumerate(imgs):
-                    name = img_path.stem
-                    html_file = folder / f'{name}.html'
-                    kw_index = start + idx
-                    kw = keywords[kw_index] if kw_index < len(keywords) else cat
-                    prev_name = imgs[idx - 1].stem if idx > 0 else ""
-                    next_name = imgs[idx + 1].stem if idx < len(imgs) - 1 else ""
-
-                    with open(html_file, 'w', encoding='utf-8') as imgf:
-                        imgf.write(f'<html><head><title>{kw}</title>')
-                        imgf.write(f'<meta name="description" content="{generate_description(kw)}">')
-                        imgf.write(f'<meta name="keywords" content="{kw}">')
-                        schema_json = f"""
+def render_detail_dom(tpl_args):
+    """旧流程：f-string 拼出来，再用 BeautifulSoup 插广告和 canonical。只给模板没法等价输出的页面兜底。"""
+    cat, img, stem, kw, desc, para, prev_name, next_name, page_no = tpl_args
+    schema_json = f"""
 <script type="application/ld+json">
 {{
   "@context": "https://schema.org",
   "@type": "ImageObject",
   "name": "{kw}",
-  "contentUrl": "{domain}/{cat}/{img_path.name}",
-  "description": "{generate_description(kw)}",
+  "contentUrl": "{domain}/{cat}/{img}",
+  "description": "{desc}",
   "author": {{
     "@type": "Organization",
     "name": "{site_name}"
@@ -94,52 +74,197 @@ def generate_pages_and_images():
 }}
 </script>
 """
-                        imgf.write(schema_json)
-                        imgf.write('</head><body>')
-                        imgf.write(f'<h1>{kw}</h1><img src="{img_path.name}" alt="{kw}" style="max-width:100%"/><br>')
-                        imgf.write(f'<p>{generate_paragraph(kw)}</p><div>')
-                        if prev_name:
-                            imgf.write(f'<a href="{prev_name}.html">Previous</a> | ')
-                        if next_name:
-                            imgf.write(f'<a href="{next_name}.html">Next</a> | ')
-                        imgf.write(f'<a href="page{page+1}.html">Back to List</a> | <a href="../index.html">Home</a></div></body></html>')
-
-                    soup = BeautifulSoup(open(html_file, encoding='utf-8'), 'html.parser')
-                    insert_ads(soup)
-                    insert_canonical(soup, f"{domain}/{cat}/{name}.html")
-                    with open(html_file, 'w', encoding='utf-8') as imgf:
-                        imgf.write(str(soup))
-                    f.write(f'<a href="{name}.html"><img src="{img_path.name}" width="200"></a>\n')
-                f.write('<div style="margin-top:20px">')
-                if page > 0:
-                    f.write(f'<a href="page{page}.html">Previous</a> ')
-                f.write(f'<a href="../index.html">Home</a> ')
-                if page < total_pages - 1:
-                    f.write(f'<a href="page{page+2}.html">Next</a>')
-                f.write('</div></body></html>')
+    html = (f'<html><head><title>{kw}</title><meta name="description" content="{desc}">'
+            f'<meta name="keywords" content="{kw}">' + schema_json + '</head><body>'
+            f'<h1>{kw}</h1><img src="{img}" alt="{kw}" style="max-width:100%"/><br><p>{para}</p><div>')
+    if prev_name:
+        html += f'<a href="{prev_name}.html">Previous</a> | '
+    if next_name:
+        html += f'<a href="{next_name}.html">Next</a> | '
+    html += f'<a href="page{page_no}.html">Back to List</a> | <a href="../index.html">Home</a></div></body></html>'
+    m = nb_metrics.current()
+    with m.timer("parse"):
+        soup = BeautifulSoup(html, 'html.parser')
+    insert_ads(soup)
+    insert_canonical(soup, f"{domain}/{cat}/{stem}.html")
+    m.count("dom_fallback")
+    return str(soup)
+
+def render_detail(tpl, cat, img_path, kw, prev_name, next_name, page_no):
+    args = (cat, img_path.name, img_path.stem, kw, generate_description(kw), generate_paragraph(kw),
+            prev_name, next_name, page_no)
+    if tpl.detail_needs_dom(cat, img_path.name, kw):
+        return render_detail_dom(args)
+    return tpl.detail(*args)
+
+def write_page(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    nb_metrics.current().wrote(text)
+
+CHUNK_PAGES = 25   # 大分类按这么多列表页切块，交给进程池
+MANIFEST = ".nb_gen_manifest.json"
+
+_TPL = None
+
+def templates():
+    # 模板每个进程只编译一次：域名、站名、广告片段都已经填进去了，每页只填关键词和上下页
+    global _TPL
+    if _TPL is None:
+        _TPL = PageTemplates(domain, site_name, ads_fragment(insert_ads))
+    return _TPL
+
+# ===== 增量清单：图片哈希 + 关键词 + 上下页 + 模板版本，没变的页面不重写 =====
+def render_key():
+    """模板版本 + 会进页面的配置；任何一项变了，所有页面都得重渲染。"""
+    raw = json.dumps([TEMPLATE_VERSION, domain, site_name, config.get("ads_code", [])], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def load_manifest():
+    """{"key": render_key, "images": {rel: [mtime_ns, size, sha1]}, "pages": {rel: 指纹}}；读不了就当空的。"""
+    try:
+        with open(MANIFEST, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == 1:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"version": 1, "key": "", "images": {}, "pages": {}}
+
+def save_manifest(data):
+    tmp = MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, MANIFEST)
+
+def image_hash(rel, old):
+    """stat 没变就沿用旧哈希，不读图片。"""
+    st = os.stat(rel)
+    if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+        return old
+    with open(rel, "rb") as f:
+        return [st.st_mtime_ns, st.st_size, hashlib.sha1(f.read()).hexdigest()]
+
+def fingerprint(*parts):
+    return hashlib.sha1("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()[:16]
+
+def plan_jobs(manifest=None, full=False, chunk_pages=CHUNK_PAGES):
+    """
+    按分类切任务：(分类, 该块的图片名, 该块对应的关键词, 首个页码, 总页数, 旧指纹)。
+    每块只依赖自己的输入，谁先跑完都一样。旧指纹只带本块用得到的那部分。
+    """
+    per_page = 20
+    old_imgs, old_pages = {}, {}
+    if manifest and not full and manifest.get("key") == render_key():
+        old_imgs, old_pages = manifest["images"], manifest["pages"]
+    jobs = []
+    for cat in get_category_folders():
+        names = sorted(f.name for f in Path(cat).glob('*.jpg'))
+        keywords = load_keywords(cat)
+        total_pages = math.ceil(len(names) / per_page)
+        for first in range(0, total_pages, chunk_pages):
+            lo, hi = first * per_page, (first + chunk_pages) * per_page
+            rels = [f"{cat}/{n}" for n in names[lo:hi]]
+            pages = [f"{cat}/{n.rsplit('.', 1)[0]}.html" for n in names[lo:hi]]
+            pages += [f"{cat}/page{p}.html" for p in range(first + 1, min(first + chunk_pages, total_pages) + 1)]
+            old = ({r: old_imgs[r] for r in rels if r in old_imgs},
+                   {r: old_pages[r] for r in pages if r in old_pages})
+            jobs.append((cat, names[lo:hi], keywords[lo:hi], first + 1, total_pages, old))
+    return jobs
+
+def render_job(job):
+    """渲染一块；指纹没变且文件还在的页面跳过。返回本块的新清单 (images, pages)。"""
+    cat, names, keywords, first_page, total_pages, (old_imgs, old_pages) = job
+    folder = Path(cat)
+    tpl = templates()
+    m = nb_metrics.current()
+    imgs_out, pages_out = {}, {}
+
+    def emit(rel, fp, render):
+        pages_out[rel] = fp
+        if old_pages.get(rel) == fp and os.path.exists(rel):
+            m.skipped()
+            return
+        write_page(rel, render())
+
+    per_page = 20
+    for off in range(0, len(names), per_page):
+        page_no = first_page + off // per_page
+        imgs = [folder / n for n in names[off:off + per_page]]
+        for idx, img_path in enumerate(imgs):
+            rel = f"{cat}/{img_path.name}"
+            imgs_out[rel] = image_hash(rel, old_imgs.get(rel))
+            kw_index = off + idx
+            kw = keywords[kw_index] if kw_index < len(keywords) else cat
+            prev_name = imgs[idx - 1].stem if idx > 0 else ""
+            next_name = imgs[idx + 1].stem if idx < len(imgs) - 1 else ""
+            emit(f"{cat}/{img_path.stem}.html",
+                 fingerprint(imgs_out[rel][2], kw, prev_name, next_name, page_no),
+                 lambda: render_detail(tpl, cat, img_path, kw, prev_name, next_name, page_no))
+        items = [(p.stem, p.name) for p in imgs]
+        # 列表页只依赖本页图片、页码、有没有上一页/下一页
+        emit(f"{cat}/page{page_no}.html",
+             fingerprint(items, page_no, page_no < total_pages),
+             lambda: tpl.category_page(cat, page_no, total_pages, items))
+    return imgs_out, pages_out
+
+def _render_job_in_worker(job):
+    # 子进程各记各的，做完把计数交回主进程合并
+    m = nb_metrics.start("pages_2222", emit_at_exit=False)
+    result = render_job(job)
+    return result, m.to_dict()
+
+def generate_pages_and_images(workers=1, full=False):
+    """只渲染新增/变了的页面；清单里只留本轮还会生成的页面（图片删了对应条目就掉了）。"""
+    manifest = load_manifest()
+    jobs = plan_jobs(manifest, full)
+    new = {"version": 1, "key": render_key(), "images": {}, "pages": {}}
+
+    def collect(result):
+        imgs, pages = result
+        new["images"].update(imgs)
+        new["pages"].update(pages)
+
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            collect(render_job(job))
+    else:
+        metrics = nb_metrics.current()
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as ex:
+            for result, d in ex.map(_render_job_in_worker, jobs):
+                collect(result)
+                metrics.merge(d)
+    save_manifest(new)
 
 def generate_sitemap():
-    with open("sitemap.xml", "w", encoding="utf-8") as sm:
-        sm.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        sm.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
-        for cat in get_category_folders():
-            folder = Path(cat)
-            for file in folder.glob('*.html'):
-                file_path = folder / file.name
-                lastmod = datetime.utcfromtimestamp(file_path.stat().st_mtime).strftime('%Y-%m-%d')
-                sm.write(f'<url><loc>{domain}/{cat}/{file.name}</loc><lastmod>{lastmod}</lastmod></url>\n')
-        sm.write('</urlset>')
+    # 和 sitemap_fix 共用增量状态库：全站页面都进 sitemap，只重写内容变了的分片；
+    # 不再另写一份只含分类目录的全量 sitemap，把状态库记着的分片覆盖掉
+    update_sitemaps(os.getcwd(), domain)
 
 def generate_robots_txt():
     content = f"""User-agent: *
 Allow: /
-Sitemap: {domain}/sitemap.xml
+Sitemap: {domain}/{INDEX_NAME}
 """
     with open("robots.txt", "w", encoding="utf-8") as f:
         f.write(content)
 
-if __name__ == '__main__':
-    generate_pages_and_images()
-    generate_sitemap()
+def main():
+    ap = argparse.ArgumentParser(description="生成分类列表页 / 详情页 / sitemap / robots.txt")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="并行进程数（默认 1 串行；0 = CPU 核数）。按分类/每 25 个列表页切块，输出与串行逐字节一致")
+    ap.add_argument("--full", action="store_true",
+                    help=f"忽略 {MANIFEST}，所有页面重新渲染（默认只渲染新增/变了的图片及受影响的列表页、上下页）")
+    args = ap.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
+    metrics = nb_metrics.start("pages_2222")
+    with metrics.timer("pages"):
+        generate_pages_and_images(workers, args.full)
+    with metrics.timer("sitemap"):
+        generate_sitemap()
     generate_robots_txt()
     print("✅ 所有页面与SEO结构生成完毕，包括 canonical、ads、sitemap 和 robots.txt")
+
+if __name__ == '__main__':
+    nb_profile.run_main("pages_2222", main)
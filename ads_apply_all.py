@@ -6,22 +6,53 @@ ads_apply_all_inline.py
 - 新增支持：inner/home 下的 inline_banner（正文中部广告，非悬浮）
 - 如果配置里没有 floating，则自动清理历史悬浮条 .nb-bottombar-wrap / nb-has-bottom
 - 首次运行前建议备份站点文件
+- 单遍注入：一个合并正则扫一遍页面，拿到 <body>、</body>、inline 锚点、已有标记、历史悬浮条的位置，
+  算好各插入点的偏移后按切片一次拼出结果（不再每插一块就重新搜索、重建整页字符串）；
+  输出与逐块插入的老流程逐字节一致，少数没法等价的页面（见 Injector）自动退回老流程
+- --workers N：多进程并行处理页面，写回仍在主进程里走 PageWriter，顺序与串行一致
+- 块指纹：START 标记带上块内容的哈希（<!-- NB:AD-TOP START fp=1a2b3c4d -->）；
+  默认只补缺的块，已有的不动（不带指纹的老块同样算已有）；
+  --refresh 时指纹和当前配置对不上的块（含老块）原地换成新内容，配置里已删掉的块整段去掉，
+  指纹一致的页面内容不变、不会重写——换广告联盟 / 改 zone ID 只改到真正受影响的页面
+- 加载器去重（global.dedupe_loader）：各广告块里重复的 jads.js 加载脚本摘掉，每页只在 </body> 前放一个
+  async 加载器（NB:AD-LOADER 块），广告位只剩 <ins> 占位 + push zone ID；
+  global.lazy_slots 为 true 时中部/底部广告位进入视口（IntersectionObserver）才 push，不支持的浏览器立即 push；
+  老页面里自带加载脚本的块默认不动，--refresh 时一并换成去重后的写法
+- 广告块就是 nb_regions 的托管区块（AD-TOP / AD-INLINE / ...）；--refresh 走 nb_regions，
+  同一个广告位出现多份（手工改过 / 老脚本叠加）时只留第一份
+
+用法：
+python ads_apply_all.py [--workers N]
+python ads_apply_all.py --refresh          # 改了 ads_mapping.json 后，原地更新过期的广告块
 """
 
 import re
+import os
 import json
 import pathlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from site_scan import scan
+from page_writer import PageWriter
+import nb_metrics, nb_profile, nb_regions
 
 ROOT = pathlib.Path(".")
 CONF = ROOT / "ads_mapping.json"
 
-# —— 注入标记，避免重复 —— #
-MARKS = {
-    "top":    ("<!-- NB:AD-TOP START -->",    "<!-- NB:AD-TOP END -->"),
-    "bottom": ("<!-- NB:AD-BOTTOM START -->", "<!-- NB:AD-BOTTOM END -->"),
-    "inline": ("<!-- NB:AD-INLINE START -->", "<!-- NB:AD-INLINE END -->"),
-    "popup":  ("<!-- NB:AD-POPUP START -->",  "<!-- NB:AD-POPUP END -->"),
-}
+# —— 注入标记，避免重复（nb_regions 的托管区块，区块名 AD-TOP 等） —— #
+REGIONS = {k: f"AD-{k.upper()}" for k in ("top", "bottom", "inline", "popup", "loader")}
+MARKS = {k: nb_regions.markers(name) for k, name in REGIONS.items()}
+# START 标记可带 fp=块指纹；不带的是老格式
+MARK_RE = re.compile(r"<!-- NB:AD-(TOP|BOTTOM|INLINE|POPUP|LOADER) START(?: fp=([0-9a-f]+))? -->")
+_HAS = {k: re.compile(re.escape(s[:-4]) + r"(?: fp=[0-9a-f]+)? -->") for k, (s, _) in MARKS.items()}
+
+block_fp = nb_regions.fingerprint
+
+def start_mark(key: str, block: str) -> str:
+    return nb_regions.markers(REGIONS[key], block_fp(block))[0]
+
+def snippet(key: str, block: str) -> str:
+    return f"\n{nb_regions.wrap(REGIONS[key], block, fp=True)}\n"
 
 BODY_OPEN_RE  = re.compile(r"<body\b[^>]*>", re.I)
 BODY_CLOSE_RE = re.compile(r"</body\s*>", re.I)
@@ -50,37 +81,31 @@ def clean_legacy_floating(html: str) -> str:
     # 如果 body 没有 class 属性，也容错处理（无事发生）
     return s
 
-def already_has(mark_start: str, html: str) -> bool:
-    return mark_start in html
+def already_has(mark_key: str, html: str) -> bool:
+    return _HAS[mark_key].search(html) is not None
 
 def inject_after_body_open(html: str, block: str, mark_key: str) -> str:
     m = BODY_OPEN_RE.search(html)
     if not m: return html
-    start, end = m.span()
-    s, e = MARKS[mark_key]
-    snippet = f"\n{s}\n{block}\n{e}\n"
-    return html[:end] + snippet + html[end:]
+    end = m.end()
+    return html[:end] + snippet(mark_key, block) + html[end:]
 
 def inject_before_body_close(html: str, block: str, mark_key: str) -> str:
     m = BODY_CLOSE_RE.search(html)
     if not m: return html + block
-    s, e = MARKS[mark_key]
-    snippet = f"\n{s}\n{block}\n{e}\n"
     pos = m.start()
-    return html[:pos] + snippet + html[pos:]
+    return html[:pos] + snippet(mark_key, block) + html[pos:]
 
 def inject_inline(html: str, block: str) -> str:
-    s_mark, e_mark = MARKS["inline"]
-    snippet = f"\n{s_mark}\n{block}\n{e_mark}\n"
     # 1) 优先命中显式占位
-    if "<!-- NB:AD-INLINE START -->" in html:
+    if already_has("inline", html):
         # 已有则不重复
         return html
     for rex in INLINE_ANCHORS:
         m = rex.search(html)
         if m:
             pos = m.end()
-            return html[:pos] + snippet + html[pos:]
+            return html[:pos] + snippet("inline", block) + html[pos:]
     # 2) 如果都没命中，就放在 </body> 前（兜底，仍是非 fixed）
     return inject_before_body_close(html, block, "inline")
 
@@ -104,6 +129,48 @@ def wrap_popup_with_cooldown(code: str, hours: int = 6) -> str:
 """
     return wrapper.strip()
 
+# —— 加载器去重 / 懒加载 —— #
+LOADER_RE = re.compile(r'<script\b[^>]*\bsrc="((?:https?:)?//poweredby\.jads\.co/js/jads\.js)"[^>]*>\s*</script>', re.I)
+PUSH_RE = re.compile(r"<script\b[^>]*>\s*\(adsbyjuicy\s*=\s*window\.adsbyjuicy\s*\|\|\s*\[\]\)"
+                     r"\.push\(\{\s*'adzone'\s*:\s*(\d+)\s*\}\);?\s*</script>", re.I)
+SLOTS = ("top", "inline", "bottom")   # 依赖加载器的广告位
+LAZY_SLOTS = ("inline", "bottom")     # 首屏以下，可以等进视口再 push
+
+LAZY_JS = """<script>
+(function(){
+  var q = window.adsbyjuicy = window.adsbyjuicy || [];
+  var slots = document.querySelectorAll('ins[data-nb-zone]');
+  function push(el){ q.push({'adzone': +el.getAttribute('data-nb-zone')}); el.removeAttribute('data-nb-zone'); }
+  if (!('IntersectionObserver' in window)) { for (var i = 0; i < slots.length; i++) push(slots[i]); return; }
+  var io = new IntersectionObserver(function(es){
+    es.forEach(function(e){ if (e.isIntersecting) { io.unobserve(e.target); push(e.target); } });
+  }, {rootMargin: '200px'});
+  for (var j = 0; j < slots.length; j++) io.observe(slots[j]);
+})();
+</script>"""
+
+def split_loader(block: str):
+    """摘掉块里的 jads.js 加载脚本，返回 (剩下的块, 加载脚本 src；没有则 None)。"""
+    m = LOADER_RE.search(block)
+    if not m:
+        return block, None
+    return LOADER_RE.sub("", block), m.group(1)
+
+def lazy_slot(block: str) -> str:
+    """push 脚本去掉，zone ID 记到 <ins data-nb-zone> 上，由 LAZY_JS 进视口时再 push；认不出的块原样返回。"""
+    zones = PUSH_RE.findall(block)
+    rest = PUSH_RE.sub("", block)
+    for zone in zones:
+        tag = f'<ins id="{zone}"'
+        if tag not in rest:
+            return block
+        rest = rest.replace(tag, f'<ins data-nb-zone="{zone}" id="{zone}"', 1)
+    return rest
+
+def loader_block(src: str, lazy: bool) -> str:
+    tag = f'<script type="text/javascript" data-cfasync="false" async src="{src}"></script>'
+    return LAZY_JS + "\n" + tag if lazy else tag
+
 def pick_role(path: pathlib.Path) -> str:
     """简单区分首页/内页：文件名含 index/home 视为首页，其它为内页。"""
     name = path.name.lower()
@@ -111,65 +178,248 @@ def pick_role(path: pathlib.Path) -> str:
         return "home"
     return "inner"
 
+def apply_sequential(html: str, blocks: dict, clean_floating: bool) -> str:
+    """老流程：按 顶部 → 中部 → 底部 → 弹窗 → 加载器 → 清理悬浮 的顺序逐块插入。Injector 处理不了的页面走这里。"""
+    before = html
+    # 1) 顶部
+    if blocks["top"] and not already_has("top", html):
+        html = inject_after_body_open(html, blocks["top"], "top")
+
+    # 2) 中部（新的 inline_banner，非 fixed）
+    if blocks["inline"] and not already_has("inline", html):
+        html = inject_inline(html, blocks["inline"])
+
+    # 3) 底部
+    if blocks["bottom"] and not already_has("bottom", html):
+        html = inject_before_body_close(html, blocks["bottom"], "bottom")
+    slot_added = html != before
+
+    # 4) 弹窗（加冷却包装）
+    if blocks["popup"] and not already_has("popup", html):
+        html = inject_before_body_close(html, blocks["popup"], "popup")
+
+    # 5) 去重后的加载器：页面上有依赖它的广告位才放，自带加载脚本的老块不需要
+    if blocks["loader"] and not already_has("loader", html) and (slot_added or has_current_slot(html, blocks)):
+        html = inject_before_body_close(html, blocks["loader"], "loader")
+
+    # 6) 如果配置里没有 floating，就顺手清理历史悬浮（一次性清理/幂等）
+    if clean_floating:
+        html = clean_legacy_floating(html)
+    return html
+
+def has_current_slot(html: str, blocks: dict) -> bool:
+    """页面上已有按当前配置注入的广告位（去重后的块，自己不带加载脚本）。"""
+    return any(blocks[k] and start_mark(k, blocks[k]) in html for k in SLOTS)
+
+# —— 单遍扫描：所有插入点/标记/悬浮条一个正则找完 —— #
+# 各分支都以 < 开头，提到最前面让正则引擎直接跳到下一个 <（不然每个位置都要把所有分支试一遍）
+def _tail(pattern: str) -> str:
+    assert pattern.startswith("<")
+    return pattern[1:]
+
+LEGACY_RE = re.compile(r"nb-bottombar-wrap|nb-has-bottom", re.I)
+# clean_legacy_floating 两条规则能命中的前提（比原规则宽，宽了只会多退回老流程）
+LEGACY_BODY_RE = re.compile(r'<body\b[^>]*class="[^"]*nb-has-bottom', re.I)
+SCAN_RE = re.compile("<(?:" + "|".join(
+    [f"(?P<open>{_tail(BODY_OPEN_RE.pattern)})", f"(?P<close>{_tail(BODY_CLOSE_RE.pattern)})"]
+    + [f"(?P<a{i}>{_tail(rex.pattern)})" for i, rex in enumerate(INLINE_ANCHORS)]
+    # 标记区分大小写
+    + [r"(?P<mark>(?-i:!-- NB:AD-(?:TOP|BOTTOM|INLINE|POPUP|LOADER) START(?: fp=[0-9a-f]+)? -->))",
+       # 只吃掉 div 三个字，标签本身留给后面的分支
+       r'(?P<legacy>div(?=[^>]*class="[^"]*nb-bottombar-wrap))']) + ")", re.I)
+
+# 同一偏移上多块插入时的先后（与老流程逐块插入的结果一致）
+RANK = {"inline": 0, "top": 1, "inline_fallback": 2, "bottom": 3, "popup": 4, "loader": 5}
+
+def scan_points(html: str, clean_floating: bool):
+    """
+    扫一遍，返回 ({组名: 第一个 match}, 已有标记的 key 集合)；返回 None 表示这页单遍没法保证和老流程一致。
+    合并正则命中一段后从它结尾继续，只有 <body ...> 标签里还夹着 < 时才会吞掉别的命中。
+    """
+    first, marks = {}, set()
+    for m in SCAN_RE.finditer(html):
+        k = m.lastgroup
+        if k == "mark":
+            marks.add(m.group()[len("<!-- NB:AD-"):].split(" ", 1)[0].lower())
+        elif k == "legacy":
+            if clean_floating: return None
+        elif k == "open":
+            if "<" in m.group()[1:]: return None
+            if clean_floating and LEGACY_BODY_RE.match(html, m.start()): return None
+            first.setdefault(k, m)
+        else:
+            first.setdefault(k, m)
+    return first, marks
+
+class Injector:
+    """
+    一个角色（home / inner）的广告配置，块内容启动时拼好。
+    广告块本身如果含 <body>/</body>、注入标记、悬浮 class（顶部块还包括 inline 锚点），
+    插进去后会影响老流程后面几步的搜索结果，这种配置整体走 apply_sequential。
+    dedupe=True 时各广告位的加载脚本统一摘出来放进 loader 块；lazy=True 时中部/底部广告位进视口才 push。
+    """
+    def __init__(self, section: dict, clean_floating: bool, dedupe: bool = False, lazy: bool = False):
+        self.clean = clean_floating
+        blocks = {
+            "top": "\n".join(section.get("top_banner", [])),
+            "inline": "\n".join(section.get("inline_banner", [])),
+            "bottom": "\n".join(section.get("bottom_banner", [])),
+        }
+        pp = "\n".join(section.get("popup", []))
+        blocks["popup"] = wrap_popup_with_cooldown(pp, hours=1) if pp else ""
+        blocks["loader"] = ""
+        if dedupe:
+            src = None
+            for k in SLOTS:
+                blocks[k], found = split_loader(blocks[k])
+                src = src or found
+            if src:
+                if lazy:
+                    for k in LAZY_SLOTS:
+                        blocks[k] = lazy_slot(blocks[k])
+                blocks["loader"] = loader_block(src, lazy and any(
+                    "data-nb-zone=" in blocks[k] for k in LAZY_SLOTS))
+        self.blocks = blocks
+        self.inert = not any(
+            BODY_OPEN_RE.search(b) or BODY_CLOSE_RE.search(b) or LEGACY_RE.search(b)
+            or MARK_RE.search(b) or any(e in b for _, e in MARKS.values()) for b in blocks.values()
+        ) and not any(rex.search(blocks["top"]) for rex in INLINE_ANCHORS)
+
+    def apply(self, html: str) -> str:
+        found = scan_points(html, self.clean) if self.inert else None
+        if found is None:
+            nb_metrics.current().count("ads_sequential")
+            return apply_sequential(html, self.blocks, self.clean)
+        first, marks = found
+        b, end = self.blocks, len(html)
+        close = first.get("close")
+        ins = []   # (偏移, 先后, 文本)
+
+        def before_close(rank, key, block):
+            # 没有 </body> 时老流程直接把裸块接在末尾（不带标记）
+            if close: ins.append((close.start(), rank, snippet(key, block)))
+            else: ins.append((end, rank, block))
+
+        if b["top"] and "top" not in marks and "open" in first:
+            ins.append((first["open"].end(), RANK["top"], snippet("top", b["top"])))
+        if b["inline"] and "inline" not in marks:
+            anchor = next((first[f"a{i}"] for i in range(len(INLINE_ANCHORS)) if f"a{i}" in first), None)
+            if anchor: ins.append((anchor.end(), RANK["inline"], snippet("inline", b["inline"])))
+            else: before_close(RANK["inline_fallback"], "inline", b["inline"])
+        if b["bottom"] and "bottom" not in marks:
+            before_close(RANK["bottom"], "bottom", b["bottom"])
+        slot_added = bool(ins)
+        if b["popup"] and "popup" not in marks:
+            before_close(RANK["popup"], "popup", b["popup"])
+        if b["loader"] and "loader" not in marks and (slot_added or has_current_slot(html, b)):
+            before_close(RANK["loader"], "loader", b["loader"])
+        if not ins:
+            return html
+
+        ins.sort(key=lambda t: (t[0], t[1]))
+        out, last = [], 0
+        for pos, _, text in ins:
+            out.append(html[last:pos]); out.append(text)
+            last = pos
+        out.append(html[last:])
+        return "".join(out)
+
+    def refresh(self, html: str) -> str:
+        """
+        指纹与当前配置不一致的块（含不带指纹的老块）原地换成新块；配置里已经没有的块连同前后换行去掉；
+        同一广告位的重复块只留第一个。没有 END 的残块不动。
+        """
+        rg = nb_regions.Regions(html)
+        for key, name in REGIONS.items():
+            if not rg.has(name):
+                continue
+            if self.blocks[key]:
+                rg.set(name, self.blocks[key], fp=True)
+            else:
+                rg.remove(name)
+        if not rg.changed:
+            return html
+        nb_metrics.current().count("ads_refreshed")
+        return rg.render()
+
+def build_injectors(cfg: dict) -> dict:
+    """{角色: Injector}；被 global.enable_on_* 关掉的角色不在里面。"""
+    g = cfg.get("global", {})
+    # 是否存在 floating 配置（如果没有，顺手清理历史悬浮）
+    clean = not any("floating" in cfg.get(k, {}) for k in ("home", "inner"))
+    injectors = {}
+    opts = dict(dedupe=g.get("dedupe_loader", False), lazy=g.get("lazy_slots", False))
+    if g.get("enable_on_home", True): injectors["home"] = Injector(cfg.get("home", {}), clean, **opts)
+    if g.get("enable_on_inner", True): injectors["inner"] = Injector(cfg.get("inner", {}), clean, **opts)
+    return injectors
+
+def process_files(paths, injectors, refresh=False):
+    """返回 [(path, 新内容)]，只含要写回的页面。refresh=True 时先原地更新过期块，再补缺的块。"""
+    metrics = nb_metrics.current()
+    changed = []
+    for f in paths:
+        inj = injectors.get(pick_role(f))
+        if inj is None:
+            continue
+        html = f.read_text(encoding="utf-8", errors="ignore")
+        metrics.read(html)
+        new = inj.apply(inj.refresh(html) if refresh else html)
+        if new != html:
+            changed.append((f, new))
+        else:
+            metrics.skipped()
+    return changed
+
+_INJECTORS, _REFRESH = None, False
+
+def _init_worker(cfg, refresh):
+    global _INJECTORS, _REFRESH
+    _INJECTORS, _REFRESH = build_injectors(cfg), refresh
+
+def _process_in_worker(paths):
+    # 子进程各记各的，做完把计数交回主进程合并
+    m = nb_metrics.start("ads_apply_all", ROOT, emit_at_exit=False)
+    changed = process_files(paths, _INJECTORS, _REFRESH)
+    return changed, m.to_dict()
+
+BATCH = 200   # 每个子进程任务处理的页面数
+
 def main():
+    ap = argparse.ArgumentParser(description="按 ads_mapping.json 给全站页面注入广告位")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="并行进程数（默认 1 串行；0 = CPU 核数）。写回顺序与串行一致")
+    ap.add_argument("--refresh", action="store_true",
+                    help="指纹过期的广告块原地换成 ads_mapping.json 里的当前内容（默认已有块一律不动）")
+    args = ap.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
     if not CONF.exists():
         print("ads_mapping.json not found.")
         return
     cfg = json.loads(CONF.read_text(encoding="utf-8"))
 
-    enable_home  = cfg.get("global", {}).get("enable_on_home", True)
-    enable_inner = cfg.get("global", {}).get("enable_on_inner", True)
+    metrics = nb_metrics.start("ads_apply_all", ROOT)
+    files = [pathlib.Path(p) for p in scan(ROOT).page_paths()]
+    batches = [files[i:i + BATCH] for i in range(0, len(files), BATCH)]
+    # 写回走事务层：整轮结束才原子替换，内容没变的页面不重写
+    with PageWriter(ROOT, stage="ads_apply_all") as pw:
+        def commit(changed):
+            for f, html in changed:
+                pw.write(f, html)
+                print("updated:", f)
 
-    # 是否存在 floating 配置（如果没有，等会顺手清理历史悬浮）
-    has_floating_in_conf = any("floating" in cfg.get(k, {}) for k in ("home", "inner"))
-
-    files = list(ROOT.rglob("*.html"))
-    for f in files:
-        role = pick_role(f)
-        if role == "home" and not enable_home:
-            continue
-        if role == "inner" and not enable_inner:
-            continue
-
-        html = f.read_text(encoding="utf-8", errors="ignore")
-        original = html
-
-        section = cfg.get(role, {})
-
-        # 1) 顶部
-        tb_list = section.get("top_banner", [])
-        if tb_list and not already_has(MARKS["top"][0], html):
-            block = "\n".join(tb_list)
-            html = inject_after_body_open(html, block, "top")
-
-        # 2) 中部（新的 inline_banner，非 fixed）
-        inl_list = section.get("inline_banner", [])
-        if inl_list and not already_has(MARKS["inline"][0], html):
-            block = "\n".join(inl_list)
-            html = inject_inline(html, block)
-
-        # 3) 底部
-        bb_list = section.get("bottom_banner", [])
-        if bb_list and not already_has(MARKS["bottom"][0], html):
-            block = "\n".join(bb_list)
-            html = inject_before_body_close(html, block, "bottom")
-
-        # 4) 弹窗（加 6 小时冷却包装）
-        pp_list = section.get("popup", [])
-        if pp_list and not already_has(MARKS["popup"][0], html):
-            raw_code = "\n".join(pp_list)
-            wrapped = wrap_popup_with_cooldown(raw_code, hours=1)
-            html = inject_before_body_close(html, wrapped, "popup")
-
-        # 5) 如果配置里没有 floating，就顺手清理历史悬浮（一次性清理/幂等）
-        if not has_floating_in_conf:
-            html = clean_legacy_floating(html)
-
-        if html != original:
-            f.write_text(html, encoding="utf-8")
-            print("updated:", f)
+        if workers <= 1 or len(batches) <= 1:
+            injectors = build_injectors(cfg)
+            for batch in batches:
+                commit(process_files(batch, injectors, args.refresh))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(batches)),
+                                     initializer=_init_worker, initargs=(cfg, args.refresh)) as ex:
+                for changed, d in ex.map(_process_in_worker, batches):
+                    commit(changed)
+                    metrics.merge(d)
 
     print("done.")
 
 if __name__ == "__main__":
-    main()
+    nb_profile.run_main("ads_apply_all", main)
@@ -1,8 +1,28 @@
-import subprocess
-import time
+# -*- coding: utf-8 -*-
+"""
+auto_git_push.py —— 增量部署：只暂存真正变化的文件再推送
+- 默认 changed 模式：用 .deploy_manifest.json（路径 -> 内容哈希/mtime/size）对比上次部署，
+  只把新增/修改/删除的文件交给 git，不再 git add . 全站重新扫描+哈希
+- 备份产物（.bak / .broken / .bak_日期、.nb_backups、.nb_staging、临时文件）一律不部署
+- 推送失败按指数退避 + 随机抖动重试
+- --mode full 保留旧流程（git add . 全量）
 
-MAX_RETRIES = 3
-DELAY_SECONDS = 10
+用法：
+python auto_git_push.py                # 增量部署
+python auto_git_push.py --mode full    # 全量 git add .
+"""
+import os, json, time, random, hashlib, argparse, subprocess
+from site_scan import classify
+
+MAX_RETRIES = 3      # 旧流程（--mode full）的固定间隔重试次数
+BACKOFF_RETRIES = 5  # 增量部署的退避重试次数
+BASE_DELAY = 5       # 秒：第 n 次重试最多等 BASE_DELAY * 2^(n-1)
+MAX_DELAY = 120
+
+MANIFEST = ".deploy_manifest.json"
+SKIP_DIRS = {".git", ".nb_backups", ".nb_staging", "__pycache__"}
+SKIP_SUFFIXES = (".tmp", ".nbtmp", ".pyc")
+SKIP_FILES = {MANIFEST, ".sitemap_state.json"}
 
 def run_git_command(command):
     try:
@@ -13,12 +33,151 @@ def run_git_command(command):
         print("❌ 错误信息：", e.stderr.decode())
         return False
 
+def git(args, root, stdin=None, check=True):
+    """参数列表形式调用 git（不经 shell，路径里有空格/中文也安全）。"""
+    r = subprocess.run(["git"] + args, cwd=root, input=stdin,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if check and r.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} 失败：{r.stderr.decode(errors='ignore').strip()}")
+    return r
+
+# ===== 变更检测 =====
+def _blob_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def skip_file(rel, name):
+    """备份产物沿用 site_scan 的分类（.bak / .broken / .bak_日期），再加临时文件和本地状态文件。"""
+    if classify(rel) == "backup" or name.lower().endswith(SKIP_SUFFIXES):
+        return True
+    return "/" not in rel and name in SKIP_FILES
+
+def iter_deploy_files(root):
+    """os.scandir 遍历可部署文件，产出 (相对路径, DirEntry)。"""
+    stack = [("", root)]
+    while stack:
+        rel_dir, abs_dir = stack.pop()
+        with os.scandir(abs_dir) as it:
+            for d in it:
+                rel = f"{rel_dir}/{d.name}" if rel_dir else d.name
+                if d.is_dir(follow_symlinks=False):
+                    if d.name not in SKIP_DIRS:
+                        stack.append((rel, d.path))
+                elif not skip_file(rel, d.name):
+                    yield rel, d
+
+def load_manifest(root):
+    p = os.path.join(root, MANIFEST)
+    if os.path.exists(p):
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+def save_manifest(root, mp):
+    p = os.path.join(root, MANIFEST)
+    with open(p + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(mp, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(p + ".tmp", p)
+
+def detect_changes(root, manifest):
+    """返回 (changed, deleted, new_manifest)。stat 没变的文件不读内容。"""
+    changed, new = [], {}
+    for rel, d in iter_deploy_files(root):
+        st = d.stat()
+        old = manifest.get(rel)
+        if old and old[1] == st.st_mtime_ns and old[2] == st.st_size:
+            new[rel] = old
+            continue
+        h = _blob_hash(d.path)
+        new[rel] = [h, st.st_mtime_ns, st.st_size]
+        if not old or old[0] != h:
+            changed.append(rel)
+    deleted = [rel for rel in manifest if rel not in new]
+    return sorted(changed), sorted(deleted), new
+
+def _nul(paths):
+    return "".join(p + "\0" for p in paths).encode("utf-8")
+
+def stage_paths(root, changed, deleted):
+    """
+    只把变化的路径交给 git；被 .gitignore 忽略的路径先剔掉（否则 git add 会报错）。
+    路径按字面量传（--literal-pathspecs），文件名里的 * ? [ 或开头的 : 不会被当成通配 / magic。
+    """
+    if changed:
+        r = git(["check-ignore", "-z", "--stdin"], root, _nul(changed), check=False)
+        ignored = set(p for p in r.stdout.decode("utf-8").split("\0") if p)
+        changed = [p for p in changed if p not in ignored]
+    if changed:
+        git(["--literal-pathspecs", "add", "--pathspec-from-file=-", "--pathspec-file-nul"], root, _nul(changed))
+    if deleted:
+        git(["--literal-pathspecs", "rm", "--cached", "-q", "--ignore-unmatch",
+             "--pathspec-from-file=-", "--pathspec-file-nul"],
+            root, _nul(deleted))
+    return changed
+
+def has_staged(root):
+    return git(["diff", "--cached", "--quiet"], root, check=False).returncode == 1
+
+def ahead_of_upstream(root):
+    r = git(["rev-list", "--count", "@{u}..HEAD"], root, check=False)
+    if r.returncode != 0:
+        return True   # 没有上游分支（首次推送）也要推
+    return int(r.stdout.strip() or 0) > 0
+
+# ===== 推送（指数退避 + 抖动） =====
+def backoff_delay(attempt):
+    cap = min(MAX_DELAY, BASE_DELAY * (2 ** (attempt - 1)))
+    return random.uniform(cap / 2, cap)
+
+def push_with_backoff(root, retries=BACKOFF_RETRIES, sleep=time.sleep):
+    for attempt in range(1, retries + 1):
+        print(f"🚀 第 {attempt} 次尝试 git push...")
+        r = git(["push"], root, check=False)
+        if r.returncode == 0:
+            print("✅ 上传成功！")
+            return True
+        print("❌ 错误信息：", r.stderr.decode(errors="ignore").strip())
+        if attempt < retries:
+            delay = backoff_delay(attempt)
+            print(f"🔁 上传失败，{delay:.1f} 秒后重试...\n")
+            sleep(delay)
+    print("❌ 所有尝试都失败了，请检查网络或稍后再试。")
+    return False
+
+def deploy_changed(root=".", message="Auto update", push=True):
+    root = os.path.abspath(root)
+    print("📦 开始增量部署（只暂存变化的文件）...\n")
+    manifest = load_manifest(root)
+    changed, deleted, new_manifest = detect_changes(root, manifest)
+    print(f"[deploy] 变化 {len(changed)} 个，删除 {len(deleted)} 个（清单共 {len(new_manifest)} 个文件）")
+
+    staged = stage_paths(root, changed, deleted)
+    if has_staged(root):
+        git(["commit", "-q", "-m", message], root)
+        print(f"[deploy] 已提交 {len(staged)} 个变更 + {len(deleted)} 个删除")
+    else:
+        print("[deploy] 没有需要提交的变更")
+    # 提交成功后才落清单：推送失败时下次只需重推已有提交
+    save_manifest(root, new_manifest)
+
+    if push and ahead_of_upstream(root):
+        return push_with_backoff(root)
+    return True
+
 def push_with_retry():
+    """旧流程：git add . 全量提交，再固定间隔重试推送。"""
     print("📦 开始执行 Git 自动上传流程...\n")
-    
+
     subprocess.run("git add .", shell=True)
     subprocess.run('git commit -m "Auto update"', shell=True)
 
+    delay = 10
     for attempt in range(1, MAX_RETRIES + 1):
         print(f"🚀 第 {attempt} 次尝试 git push...")
         success = run_git_command("git push")
@@ -27,11 +186,25 @@ def push_with_retry():
             break
         else:
             if attempt < MAX_RETRIES:
-                print(f"🔁 上传失败，{DELAY_SECONDS} 秒后重试...\n")
-                time.sleep(DELAY_SECONDS)
-                DELAY_SECONDS += 10  # 每次多等10秒
+                print(f"🔁 上传失败，{delay} 秒后重试...\n")
+                time.sleep(delay)
+                delay += 10  # 每次多等10秒
             else:
                 print("❌ 所有尝试都失败了，请检查网络或稍后再试。")
 
+def main():
+    ap = argparse.ArgumentParser(description="Git 自动部署（默认只提交变化的文件）")
+    ap.add_argument("--root", default=".", help="站点根目录（git 仓库）")
+    ap.add_argument("--mode", choices=["changed", "full"], default="changed",
+                    help="changed=按清单增量暂存（默认）；full=旧的 git add . 全量")
+    ap.add_argument("--message", default="Auto update", help="提交说明")
+    ap.add_argument("--no-push", action="store_true", help="只提交不推送")
+    args = ap.parse_args()
+    if args.mode == "full":
+        push_with_retry()
+    else:
+        ok = deploy_changed(args.root, args.message, push=not args.no_push)
+        raise SystemExit(0 if ok else 1)
+
 if __name__ == "__main__":
-    push_with_retry()
+    main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+backup_store.py —— 内容寻址备份库（替代页面旁边的 .bak / .broken 副本）
+- 所有备份集中放在站点根目录的 .nb_backups/ 下（隐藏目录，site_scan 不会扫到，也不进 git）
+- objects/ab/cdef....gz ：按内容 sha256 去重，gzip 压缩；同一版本只存一份
+- journal/<run_id>.jsonl ：每次运行一本流水账，记下每个页面“改动前”的版本哈希
+- 还原：按某次运行把页面恢复到该次运行之前的样子；还原前会把当前版本也存一份（替代 .broken）
+
+用法：
+python backup_store.py list                          # 列出所有运行记录
+python backup_store.py restore                       # 还原最近一次运行改动过的页面
+python backup_store.py restore --run 20251019_120000_1234 --path bedroom/page1.html
+python backup_store.py import-legacy [--delete]      # 把现有 *.bak / *.broken 收进备份库（可选删除原文件）
+"""
+import os, re, sys, json, gzip, time, hashlib, argparse
+
+STORE_DIR = ".nb_backups"
+LEGACY_RE = re.compile(r"\.(bak|broken)$", re.I)
+
+def new_run_id():
+    # 编排器会通过环境变量 NB_RUN_ID 让同一轮构建的各阶段共用一本流水账
+    return os.environ.get("NB_RUN_ID") or time.strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+
+class BackupStore:
+    def __init__(self, root=".", run_id=None, stage=None):
+        self.root = os.path.abspath(root)
+        self.base = os.path.join(self.root, STORE_DIR)
+        self.run_id = run_id or new_run_id()
+        self.stage = stage
+        self._seen = set()     # 本次运行已备份过的相对路径：同一页只记改动前的第一版
+
+    # ----- 对象 -----
+    def _obj_path(self, h):
+        return os.path.join(self.base, "objects", h[:2], h[2:] + ".gz")
+
+    def put(self, data: bytes) -> str:
+        h = hashlib.sha256(data).hexdigest()
+        p = self._obj_path(h)
+        if not os.path.exists(p):
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            tmp = p + ".tmp"
+            with gzip.GzipFile(tmp, "wb", mtime=0) as f:
+                f.write(data)
+            os.replace(tmp, p)
+        return h
+
+    def get(self, h: str) -> bytes:
+        with gzip.open(self._obj_path(h), "rb") as f:
+            return f.read()
+
+    # ----- 流水账 -----
+    def rel(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root).replace("\\", "/")
+
+    def _journal(self, run_id):
+        return os.path.join(self.base, "journal", f"{run_id}.jsonl")
+
+    def _append(self, rec):
+        p = self._journal(self.run_id)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def save(self, path, data=None):
+        """
+        记录 path 改动前的版本（data 不传则读盘）。同一次运行里同一个页面只记第一次。
+        文件不存在时记为 hash=None（还原时会删除该文件，即“本次运行新建的页面”）。
+        """
+        rel = self.rel(path)
+        if rel in self._seen: return None
+        self._seen.add(rel)
+        if data is None:
+            try:
+                with open(path, "rb") as f: data = f.read()
+            except FileNotFoundError:
+                data = None
+        h = self.put(data) if data is not None else None
+        self._append({"path": rel, "hash": h, "size": len(data) if data is not None else 0,
+                      "ts": int(time.time()), "stage": self.stage})
+        return h
+
+    def runs(self):
+        d = os.path.join(self.base, "journal")
+        if not os.path.isdir(d): return []
+        return sorted(n[:-6] for n in os.listdir(d) if n.endswith(".jsonl"))
+
+    def entries(self, run_id):
+        out = {}
+        with open(self._journal(run_id), "r", encoding="utf-8") as f:
+            for ln in f:
+                if not ln.strip(): continue
+                rec = json.loads(ln)
+                out.setdefault(rec["path"], rec)   # 保留该次运行里最早的一条
+        return out
+
+    def restore(self, run_id, paths=None, dry_run=False):
+        """把 run_id 改过的页面恢复到改动前；当前版本先存进新的流水账（stage=restore）。"""
+        todo = self.entries(run_id)
+        if paths:
+            want = {self.rel(os.path.join(self.root, p)) for p in paths}
+            todo = {k: v for k, v in todo.items() if k in want}
+        guard = BackupStore(self.root, run_id=f"restore-{new_run_id()}", stage="restore")
+        n = 0
+        for rel, rec in sorted(todo.items()):
+            dst = os.path.join(self.root, rel)
+            print(("[DRY] " if dry_run else "") + f"restore {rel} <- {rec['hash'] and rec['hash'][:12]}")
+            if dry_run: continue
+            guard.save(dst)
+            if rec["hash"] is None:
+                if os.path.exists(dst): os.remove(dst)
+            else:
+                os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+                tmp = dst + ".nbtmp"
+                with open(tmp, "wb") as f: f.write(self.get(rec["hash"]))
+                os.replace(tmp, dst)
+            n += 1
+        return n
+
+    def import_legacy(self, delete=False):
+        """把站点里现存的 *.bak / *.broken 收进备份库：.bak 记到 legacy-bak，.broken 记到 legacy-broken。"""
+        books = {"bak": BackupStore(self.root, "legacy-bak", "legacy"),
+                 "broken": BackupStore(self.root, "legacy-broken", "legacy")}
+        n = 0
+        for dp, dn, fn in os.walk(self.root):
+            dn[:] = [d for d in dn if not d.startswith(".")]
+            for name in fn:
+                m = LEGACY_RE.search(name)
+                if not m: continue
+                src = os.path.join(dp, name)
+                with open(src, "rb") as f: data = f.read()
+                books[m.group(1).lower()].save(os.path.join(dp, name[:m.start()]), data)
+                if delete: os.remove(src)
+                n += 1
+        return n
+
+_DEFAULT = {}
+
+def get_store(root=".", stage=None):
+    """进程内共享一本流水账（同一个 root 只建一个 BackupStore）。"""
+    key = os.path.abspath(root)
+    if key not in _DEFAULT:
+        _DEFAULT[key] = BackupStore(key, stage=stage)
+    return _DEFAULT[key]
+
+def main():
+    ap = argparse.ArgumentParser(description="内容寻址备份库：列出 / 还原 / 导入旧 .bak")
+    ap.add_argument("--root", default=".", help="站点根目录（默认当前目录）")
+    sub = ap.add_subparsers(dest="cmd")
+    sub.add_parser("list", help="列出运行记录")
+    rp = sub.add_parser("restore", help="按运行记录还原页面（默认最近一次）")
+    rp.add_argument("--run", help="运行 ID（见 list），legacy-bak 即旧 .bak 副本")
+    rp.add_argument("--path", action="append", help="只还原指定页面（相对路径，可多次）")
+    rp.add_argument("--dry-run", action="store_true", help="只打印不写")
+    ip = sub.add_parser("import-legacy", help="导入现有 *.bak / *.broken")
+    ip.add_argument("--delete", action="store_true", help="导入后删除页面旁边的 .bak / .broken")
+    args = ap.parse_args()
+
+    store = BackupStore(args.root)
+    if args.cmd == "restore":
+        runs = [r for r in store.runs() if not r.startswith(("restore-", "legacy-"))]
+        run = args.run or (runs[-1] if runs else None)
+        if not run or run not in store.runs():
+            print(f"[FATAL] 找不到运行记录：{run}"); sys.exit(2)
+        n = store.restore(run, args.path, args.dry_run)
+        print(f"✅ 已还原 {n} 个页面（run={run}）")
+    elif args.cmd == "import-legacy":
+        n = store.import_legacy(args.delete)
+        print(f"✅ 已导入 {n} 个旧备份" + ("，并删除原文件" if args.delete else ""))
+    else:
+        for r in store.runs():
+            print(f"{r}\t{len(store.entries(r))} 个页面")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+farm_build.py —— 站群编排器：多站点并行构建（替代逐站 cd + 最新222.bat）
+- 读取 sites.txt（与 seo_error_checker.py 多站模式相同：--base 根目录 + 每行一个站点目录名/绝对路径）
+- 每个站点放进独立的工作进程，--jobs 控制同时构建的站点数
+- 站点隔离：各阶段以子进程运行，cwd=站点根目录，读的是该站自己的
+  config.json / ads_mapping.json / keywords/；同一站点的各阶段共用一个 NB_RUN_ID（一本备份流水账）
+- 阶段顺序与 最新222.bat 一致；站点目录里有同名脚本优先用站点的，否则用本脚本所在目录的
+- 增量：阶段按 stage_graph.py 的依赖图执行，输入（脚本/配置/词库/图片）内容没变的阶段直接跳过，
+  例如只改了 ads_mapping.json 时只重跑 ads 及其下游
+- 跨站去重词库（NB_USED_GLOBAL，默认 <base>/used_keywords_global.txt）所有站点共用：读写它的词库阶段
+  （kw_select / kw_persist）跨站串行，持文件锁运行，脚本启动时在锁内重新读取，--jobs > 1 也不会两站挑中同一个词
+- 每个阶段的输出写到 <站点>/logs/farm/<阶段>.log；结束后打印 站点×阶段 耗时/状态表，并写 JSON 报告
+  （报告里附带各阶段 nb_metrics 的计时/计数）
+
+用法：
+python farm_build.py                                   # D:/项目/sites.txt 里的全部站点
+python farm_build.py --base D:/项目/ --jobs 4
+python farm_build.py --site D:/项目/site_a --only ads,seo_fixer
+python farm_build.py --skip generator,deploy
+python farm_build.py --plan                            # 只看哪些阶段会跑、为什么
+python farm_build.py --force ads                       # 强制重跑 ads（及下游）；--full 全部重跑
+python farm_build.py --profile sample                  # 每个阶段输出折叠栈，找慢在哪
+"""
+import os, sys, json, time, argparse, subprocess, contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from stage_graph import Stage, StageGraph
+from nb_metrics import load_run
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASE = "D:/项目/"
+STAGE_TIMEOUT = 3600     # 单阶段超时（秒）
+GLOBAL_KW_STAGES = {"kw_select", "kw_persist"}   # 读写跨站去重词库的阶段
+
+@contextlib.contextmanager
+def file_lock(path):
+    """跨进程互斥锁（Windows msvcrt / 其它 fcntl），拿不到就一直等。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:      # LK_LOCK 自己重试 10 秒后放弃，接着等
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def merge_selected_keywords(site):
+    """最新222.bat 5.4：没有 keywords/selected.txt 时，用 selected_keywords/*.txt 合并生成（不覆盖已有文件）。"""
+    dst = os.path.join(site, "keywords", "selected.txt")
+    src_dir = os.path.join(site, "selected_keywords")
+    if os.path.exists(dst) or not os.path.isdir(src_dir):
+        return "skip"
+    parts = []
+    for name in sorted(os.listdir(src_dir)):
+        if name.lower().endswith(".txt"):
+            with open(os.path.join(src_dir, name), "r", encoding="utf-8", errors="ignore") as f:
+                parts.append(f.read())
+    if not parts:
+        return "skip"
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with open(dst, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+    return "ok"
+
+def inject_args(site):
+    # 首次注入带 --force，成功后打标记（与 bat 逻辑相同）
+    return [] if os.path.exists(os.path.join(site, ".nb_injected.flag")) else ["--force"]
+
+def inject_done(site, ok):
+    if ok:
+        open(os.path.join(site, ".nb_injected.flag"), "a").close()
+
+# 阶段依赖图：页面脚本都是原地改写，按 最新222.bat 的顺序串成一条链；词库阶段自成一支
+IMAGES = ["*/*.jpg", "*/*.jpeg", "*/*.png", "*/*.webp"]
+STAGES = [
+    # 图片生成走外部接口，是否有新图由它自己决定；新图作为 pages 的输入触发后续阶段
+    Stage("generator", "auto2_generate_fixed_loop_autopath.py", cwd="generator", always=True),
+    Stage("pages", "2222.py", required=True,
+          inputs=["config.json", "keywords/*.txt", "*template*.html"] + IMAGES, outputs=["*/page*.html"]),
+    Stage("rebuild_index", "rebuild_index.py", deps=["pages"],
+          inputs=["config.json", "custom_homepage_template.html"], outputs=["index.html"]),
+    Stage("patch_homepage", "patch_homepage.py", deps=["rebuild_index"], inputs=["config.json", "config_*.json"]),
+    Stage("struct_lastmod", "patch_struct_shuffle_and_lastmod.py", deps=["patch_homepage"], inputs=["config.json"]),
+    Stage("index_sections", "generate_index.py", deps=["struct_lastmod"]),
+    Stage("link_list", "generate_link_list.py", deps=["index_sections"],
+          inputs=["config.json"], outputs=["link_list.html"]),
+    Stage("enhance", "site_enhance_all.py", deps=["link_list"],
+          inputs=["config.json", "site_structure_config.json", "slogans.txt", "category_desc_templates.txt"]),
+    Stage("ads", "ads_apply_all.py", deps=["enhance"], inputs=["ads_mapping.json"]),
+    Stage("seo_fixer", "seo_fixer_v4.py", deps=["ads"], inputs=["config.json"]),
+    Stage("v4_patch", "v4_patch_single_site.py", deps=["seo_fixer"], inputs=["config.json", "keywords/*.txt"]),
+    Stage("kw_build", "keywords_builder_google_only.py", inputs=["seeds/*.txt", "kw_config.json"],
+          outputs=["keywords/*.txt"]),
+    Stage("kw_enrich", "enrich_keywords.py", deps=["kw_build"], outputs=["keywords_enriched/*"]),
+    Stage("kw_select", "select_keywords.py", deps=["kw_enrich"], outputs=["selected_keywords/*.txt"]),
+    Stage("kw_merge", builtin=merge_selected_keywords, deps=["kw_select"], inputs=["selected_keywords/*.txt"]),
+    Stage("kw_inject", "inject_keywords.py", args=inject_args, after=inject_done,
+          deps=["v4_patch", "kw_select"], inputs=["selected_keywords/*.txt"]),
+    Stage("kw_persist", "kw_persist_and_fill.py",
+          args=["--root", ".", "--pool", os.path.join("keywords", "selected.txt"),
+                "--min-words", "100", "--max-words", "180"],
+          deps=["kw_inject", "kw_merge"], inputs=["keywords/selected.txt"]),
+    Stage("sitemap", "sitemap_fix.py", deps=["kw_persist"], outputs=["sitemap_index.xml"]),
+    Stage("deploy", "auto_git_push.py", deps=["sitemap"], always=True, default_off=True),
+]
+GRAPH = StageGraph(STAGES)
+STAGE_NAMES = GRAPH.names()
+
+def read_sites(base, sites_file):
+    p = sites_file if os.path.isabs(sites_file) else os.path.join(base, sites_file)
+    if not os.path.exists(p):
+        print(f"[FATAL] 未找到站点列表：{p}"); sys.exit(2)
+    with open(p, "r", encoding="utf-8") as f:
+        names = [ln.strip() for ln in f if ln.strip() and not ln.lstrip().startswith("#")]
+    return [n if os.path.isabs(n) else os.path.join(base, n) for n in names]
+
+def resolve_script(site, st):
+    for d in (os.path.join(site, st.cwd), site, TOOL_DIR):
+        p = os.path.join(d, st.script)
+        if os.path.exists(p):
+            return p
+    return None
+
+def run_stage(site, st, env, timeout):
+    """
+    执行单个阶段，返回 {stage, status, seconds, rc, log}。status: ok / failed / timeout / skip。
+    GLOBAL_KW_STAGES 持跨站词库锁运行：脚本在锁内启动、读取词库、追加新用的词，各站依次进行。
+    """
+    if st.name in GLOBAL_KW_STAGES and env.get("NB_USED_GLOBAL"):
+        t0 = time.perf_counter()
+        with file_lock(env["NB_USED_GLOBAL"] + ".lock"):
+            waited = round(time.perf_counter() - t0, 3)
+            rec = _run_stage(site, st, env, timeout)
+        rec["lock_wait"] = waited
+        rec["seconds"] = round(rec["seconds"] + waited, 3)
+        return rec
+    return _run_stage(site, st, env, timeout)
+
+def _run_stage(site, st, env, timeout):
+    t0 = time.perf_counter()
+    rec = {"stage": st.name, "status": "ok", "seconds": 0.0, "rc": 0, "log": None}
+    if st.builtin:
+        try:
+            rec["status"] = st.builtin(site)
+        except Exception as e:
+            rec.update(status="failed", rc=1, error=str(e))
+        rec["seconds"] = round(time.perf_counter() - t0, 3)
+        return rec
+
+    script = resolve_script(site, st)
+    if not script:
+        rec.update(status="failed" if st.required else "skip", rc=None,
+                   error=f"未找到 {st.script}")
+        return rec
+    args = st.resolve_args(site)
+    cwd = os.path.join(site, st.cwd)
+    log_dir = os.path.join(site, "logs", "farm")
+    os.makedirs(log_dir, exist_ok=True)
+    rec["log"] = os.path.join(log_dir, st.name + ".log")
+    with open(rec["log"], "wb") as lf:
+        try:
+            r = subprocess.run([sys.executable, script] + args, cwd=cwd, env=env,
+                               stdin=subprocess.DEVNULL, stdout=lf, stderr=subprocess.STDOUT,
+                               timeout=timeout)
+            rec["rc"] = r.returncode
+            if r.returncode != 0: rec["status"] = "failed"
+        except subprocess.TimeoutExpired:
+            rec.update(status="timeout", rc=None)
+    if st.after:
+        st.after(site, rec["status"] == "ok")
+    rec["seconds"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+def build_site(site, stage_names, run_id, timeout, stop_on_error, force=(), incremental=True, profile=None):
+    """工作进程入口：按依赖图构建一个站点；输入没变的阶段跳过（incremental=False 则全部重跑）。"""
+    env = dict(os.environ)
+    env["NB_RUN_ID"] = run_id
+    env["PYTHONIOENCODING"] = "utf-8"
+    if profile:
+        env["NB_PROFILE"] = profile      # 各阶段入口经 nb_profile 读取，输出到 <站点>/logs/profile/<run_id>/
+    env.setdefault("NB_USED_GLOBAL", os.path.join(os.path.dirname(site.rstrip("/\\")), "used_keywords_global.txt"))
+    t0 = time.perf_counter()
+    report = {"site": site, "run_id": run_id, "status": "ok", "stages": []}
+    if not os.path.isdir(site):
+        report.update(status="missing", seconds=0.0)
+        return report
+    force = set(stage_names) if not incremental else set(force)
+    report["stages"] = GRAPH.run(site, lambda st: run_stage(site, st, env, timeout), resolve_script,
+                                 selected=set(stage_names), force=force, stop_on_error=stop_on_error)
+    if any(r["status"] in ("failed", "timeout") for r in report["stages"]):
+        report["status"] = "failed"
+    report["metrics"] = load_run(site, run_id)     # 各阶段 nb_metrics 埋点（同一 NB_RUN_ID）
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+def print_table(reports, stage_names):
+    short = {"ok": "", "skip": " -", "up-to-date": " =", "failed": " ✗", "timeout": " ⏱"}
+    names = [n for n in stage_names if any(r2["stage"] == n for r in reports for r2 in r["stages"])]
+    w = max([len(os.path.basename(r["site"].rstrip("/\\"))) for r in reports] + [4])
+    print("\n" + "site".ljust(w) + "".join(n[:12].rjust(13) for n in names) + "total".rjust(10) + "  status")
+    for r in reports:
+        by = {s["stage"]: s for s in r["stages"]}
+        cells = []
+        for n in names:
+            s = by.get(n)
+            cells.append(("" if s is None else f"{s['seconds']:.1f}{short.get(s['status'], '?')}").rjust(13))
+        print(os.path.basename(r["site"].rstrip("/\\")).ljust(w) + "".join(cells)
+              + f"{r.get('seconds', 0):.1f}".rjust(10) + "  " + r["status"])
+
+def pick_stages(only, skip, with_deploy):
+    if only:
+        names = [n.strip() for n in only.split(",") if n.strip()]
+    else:
+        names = [s.name for s in STAGES if with_deploy or not s.default_off]
+    drop = {n.strip() for n in (skip or "").split(",") if n.strip()}
+    bad = [n for n in set(names) | drop if n not in STAGE_NAMES]
+    if bad:
+        print(f"[FATAL] 未知阶段：{', '.join(bad)}；可选：{', '.join(STAGE_NAMES)}"); sys.exit(2)
+    return [n for n in STAGE_NAMES if n in names and n not in drop]
+
+def main():
+    ap = argparse.ArgumentParser(description="站群并行构建编排器")
+    ap.add_argument("--base", default=DEFAULT_BASE, help="多站根目录（默认 D:/项目/）")
+    ap.add_argument("--sites", default="sites.txt", help="站点列表文件（相对 --base）")
+    ap.add_argument("--site", action="append", help="直接指定站点目录（可多次，优先于 sites.txt）")
+    ap.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="同时构建的站点数")
+    ap.add_argument("--only", help="只跑这些阶段（逗号分隔）")
+    ap.add_argument("--skip", help="跳过这些阶段（逗号分隔）")
+    ap.add_argument("--deploy", action="store_true", help="最后执行 auto_git_push.py（默认不推送）")
+    ap.add_argument("--timeout", type=int, default=STAGE_TIMEOUT, help="单阶段超时秒数")
+    ap.add_argument("--stop-on-error", action="store_true", help="某阶段失败后不再跑该站点后续阶段")
+    ap.add_argument("--force", help="无视增量状态强制执行这些阶段（逗号分隔；下游会跟着重跑）")
+    ap.add_argument("--full", action="store_true", help="全部阶段重跑（忽略 .nb_stage_state.json）")
+    ap.add_argument("--plan", action="store_true", help="只打印每个站点哪些阶段会执行及原因，不构建")
+    ap.add_argument("--profile", choices=["cprofile", "sample"], help="给每个阶段开剖析（sample 开销低，可常开）")
+    ap.add_argument("--report", help="JSON 报告路径（默认 <base>/logs/farm_<时间>.json）")
+    args = ap.parse_args()
+
+    sites = [os.path.abspath(s) for s in args.site] if args.site else read_sites(args.base, args.sites)
+    stage_names = pick_stages(args.only, args.skip, args.deploy)
+    force = {n.strip() for n in (args.force or "").split(",") if n.strip()}
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    if args.plan:
+        for s in sites:
+            print(f"== {s}")
+            for n, why in GRAPH.plan(s, set(stage_names), force, resolve_script):
+                print(f"  {n:15s} {why or 'up-to-date'}")
+        return
+    print(f"[farm] {len(sites)} 个站点，{args.jobs} 路并行；阶段：{' → '.join(stage_names)}")
+
+    t0 = time.perf_counter()
+    reports = []
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+        futs = {ex.submit(build_site, s, stage_names, f"{stamp}_farm{i}", args.timeout, args.stop_on_error,
+                          force, not args.full, args.profile): s
+                for i, s in enumerate(sites)}
+        for fut in as_completed(futs):
+            try:
+                r = fut.result()
+            except Exception as e:
+                r = {"site": futs[fut], "status": "crashed", "error": str(e), "stages": [], "seconds": 0.0}
+            reports.append(r)
+            mark = "✅" if r["status"] == "ok" else "❌"
+            print(f"{mark} {r['site']}  {r['status']}  {r.get('seconds', 0):.1f}s")
+    reports.sort(key=lambda r: sites.index(r["site"]))
+    total = round(time.perf_counter() - t0, 3)
+
+    print_table(reports, stage_names)
+    out = args.report or os.path.join(args.base if not args.site else os.getcwd(), "logs", f"farm_{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"started": stamp, "seconds": total, "jobs": args.jobs, "stages": stage_names,
+                   "sites": reports}, f, ensure_ascii=False, indent=2)
+    failed = sum(1 for r in reports if r["status"] != "ok")
+    print(f"\n[farm] 完成：{len(reports) - failed}/{len(reports)} 成功，总耗时 {total:.1f}s ；报告 -> {out}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
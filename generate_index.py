@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from bs4 import BeautifulSoup
+from site_scan import scan
 
 def get_latest_images(category, count=4):
     folder = Path(category)
@@ -40,10 +41,7 @@ def generate_updated_index():
         return
 
     # 扫描所有分类目录
-    categories = [
-        d for d in os.listdir()
-        if os.path.isdir(d) and not d.startswith(".") and d not in ["images", "keywords", "generator"]
-    ]
+    categories = scan(".").category_dirs()
 
     all_blocks = ""
     for cat in sorted(categories):
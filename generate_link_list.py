@@ -1,11 +1,8 @@
 import os
-from pathlib import Path
+from site_scan import scan, PAGE_KINDS
 
 def get_category_folders():
-    return [
-        d for d in os.listdir()
-        if os.path.isdir(d) and not d.startswith(".") and d not in ["images", "generator", "keywords"]
-    ]
+    return scan(".").category_dirs()
 
 def generate_link_list():
     domain = ""
@@ -16,10 +13,10 @@ def generate_link_list():
             domain = config.get("domain", "").rstrip("/")
 
     links = []
+    inv = scan(".")
     for cat in get_category_folders():
-        folder = Path(cat)
-        for html_file in folder.glob("*.html"):
-            rel_path = f"{cat}/{html_file.name}"
+        for e in inv.in_dir(cat, *PAGE_KINDS):
+            rel_path = e.rel
             full_url = f"{domain}/{rel_path}" if domain else rel_path
             links.append(full_url)
 
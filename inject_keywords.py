@@ -1,12 +1,18 @@
 # inject_keywords.py — 多模板 + 可选H1补丁版
+# 单遍注入：一个正则扫一遍页面，拿到 title / meta description / 首图 / h1（或 main、body）/ </head> 的位置，
+# 按偏移一次拼出结果；几处改动互相重叠的怪页面退回逐步替换（set_title → … → 标记），两条路输出逐字节一致。
+# --workers N：按分类（大分类再按 CHUNK 页切块）多进程并行，写回仍在主进程里走 PageWriter，顺序与串行一致。
 from pathlib import Path
-import re, html, argparse, shutil, time, random
+import os, re, html, argparse, time, random
+from concurrent.futures import ProcessPoolExecutor
+from backup_store import get_store
+from page_writer import PageWriter
+import nb_metrics, nb_profile
 
 ROOT = Path(".")
 KW_DIR_PRI = ROOT / "selected_keywords"
 KW_DIR_FALLBACK = ROOT / "keywords"
 MARK_FLAG = "<!-- data-nb-key=\"1\" -->"
-BACKUP_SUFFIX = ".bak"
 
 CATEGORIES = [
     "bedroom","dark","fitness","luxury","mirror",
@@ -37,8 +43,8 @@ def log(msg): print(time.strftime("[%H:%M:%S] "), msg, flush=True)
 def read_text(p: Path) -> str: return p.read_text("utf-8", errors="ignore")
 def write_text(p: Path, s: str): p.write_text(s, encoding="utf-8")
 def backup_file(fp: Path):
-    bak = fp.with_suffix(fp.suffix + BACKUP_SUFFIX)
-    if not bak.exists(): shutil.copy2(fp, bak)
+    # 改动前版本进 .nb_backups（去重压缩 + 本次运行流水账），不再在页面旁边留 .bak
+    get_store(ROOT, stage="inject_keywords").save(fp)
 def list_html_files(cat_dir: Path):
     return sorted([p for p in cat_dir.glob("*.html") if p.is_file()])
 
@@ -57,39 +63,46 @@ def load_keywords_for(cat: str):
     return [], None
 
 # ===== HTML helpers =====
+_TITLE_RE = re.compile(r"<title>.*?</title>", re.I|re.S)
+_META_RE = re.compile(r'<meta\s+name=["\']description["\']\s+content=["\'].*?["\']\s*/?>', re.I|re.S)
+_IMG_RE = re.compile(r'(<img\b[^>]*?)(?:\s+alt="[^"]*")?([^>]*>)', re.I)
+_ALT_RE = re.compile(r'\s+alt="[^"]*"', re.I)
+_H1_RE = re.compile(r"<h1[^>]*>.*?</h1>", re.I|re.S)
+_MAIN_RE = re.compile(r"(<main[^>]*>)", re.I)
+_BODY_RE = re.compile(r"(<body[^>]*>)", re.I)
+_HEAD_END_RE = re.compile(r"</head>", re.I)
+
 def set_title(html_text: str, new_title: str) -> str:
     esc = html.escape(new_title, quote=False)
-    if re.search(r"<title>.*?</title>", html_text, flags=re.I|re.S):
-        return re.sub(r"<title>.*?</title>", f"<title>{esc}</title>", html_text, count=1, flags=re.I|re.S)
-    return re.sub(r"</head>", f"<title>{esc}</title>\n</head>", html_text, count=1, flags=re.I)
+    if _TITLE_RE.search(html_text):
+        return _TITLE_RE.sub(f"<title>{esc}</title>", html_text, count=1)
+    return _HEAD_END_RE.sub(f"<title>{esc}</title>\n</head>", html_text, count=1)
 
 def set_meta_desc(html_text: str, new_desc: str) -> str:
     esc = html.escape(new_desc, quote=True)
-    if re.search(r'<meta\s+name=["\']description["\']\s+content=["\'].*?["\']\s*/?>', html_text, flags=re.I|re.S):
-        return re.sub(r'<meta\s+name=["\']description["\']\s+content=["\'].*?["\']\s*/?>',
-                      f'<meta name="description" content="{esc}" />',
-                      html_text, count=1, flags=re.I|re.S)
-    return re.sub(r"</head>", f'<meta name="description" content="{esc}" />\n</head>',
-                  html_text, count=1, flags=re.I)
+    if _META_RE.search(html_text):
+        return _META_RE.sub(f'<meta name="description" content="{esc}" />', html_text, count=1)
+    return _HEAD_END_RE.sub(f'<meta name="description" content="{esc}" />\n</head>', html_text, count=1)
 
-def set_first_img_alt(html_text: str, new_alt: str) -> str:
-    esc = html.escape(new_alt, quote=True)
-    pat = re.compile(r'(<img\b[^>]*?)(?:\s+alt="[^"]*")?([^>]*>)', re.I)
+def _alt_repl(esc: str):
     def repl(m: re.Match) -> str:
-        before = re.sub(r'\s+alt="[^"]*"', '', m.group(1), flags=re.I)
+        before = _ALT_RE.sub('', m.group(1))
         if not before.endswith(' '): before += ' '
         return f'{before}alt="{esc}"{m.group(2)}'
-    return pat.sub(repl, html_text, count=1)
+    return repl
+
+def set_first_img_alt(html_text: str, new_alt: str) -> str:
+    return _IMG_RE.sub(_alt_repl(html.escape(new_alt, quote=True)), html_text, count=1)
 
 def set_h1(html_text: str, kw: str) -> str:
     esc = html.escape(kw, quote=False)
     # 覆盖第一个 <h1>…</h1>
-    if re.search(r"<h1[^>]*>.*?</h1>", html_text, flags=re.I|re.S):
-        return re.sub(r"<h1[^>]*>.*?</h1>", f"<h1>{esc}</h1>", html_text, count=1, flags=re.I|re.S)
+    if _H1_RE.search(html_text):
+        return _H1_RE.sub(f"<h1>{esc}</h1>", html_text, count=1)
     # 没有 <h1> 的话，优先插在 <main> 里；没有 <main> 就在 <body> 开头
-    if re.search(r"<main[^>]*>", html_text, flags=re.I):
-        return re.sub(r"(<main[^>]*>)", r"\1\n<h1>"+esc+"</h1>", html_text, count=1, flags=re.I)
-    return re.sub(r"(<body[^>]*>)", r"\1\n<h1>"+esc+"</h1>", html_text, count=1, flags=re.I)
+    if _MAIN_RE.search(html_text):
+        return _MAIN_RE.sub(r"\1\n<h1>"+esc+"</h1>", html_text, count=1)
+    return _BODY_RE.sub(r"\1\n<h1>"+esc+"</h1>", html_text, count=1)
 
 def page_has_mark(html_text: str) -> bool:
     return MARK_FLAG in html_text
@@ -103,11 +116,8 @@ def build_title_desc(cat: str, kw: str, seed_idx: int=0):
     desc  = d.format(kw=kw, cat=cat)
     return title, desc
 
-def inject_for_page(html_path: Path, cat: str, kw: str, force: bool=False, idx: int=0) -> str:
-    html_text = read_text(html_path)
-    if (not force) and page_has_mark(html_text):
-        return "skip(marked)"
-    title, desc = build_title_desc(cat, kw, seed_idx=idx)
+def inject_sequential(html_text: str, title: str, desc: str, kw: str) -> str:
+    """逐步替换：每步都在上一步的结果上重新搜索。plan_edits 处理不了的页面走这里。"""
     html_new = set_title(html_text, title)
     html_new = set_meta_desc(html_new, desc)
     html_new = set_first_img_alt(html_new, kw)
@@ -115,15 +125,133 @@ def inject_for_page(html_path: Path, cat: str, kw: str, force: bool=False, idx:
         html_new = set_h1(html_new, kw)
 
     if "<head" in html_new.lower():
-        html_new = re.sub(r"</head>", f"{MARK_FLAG}\n</head>", html_new, count=1, flags=re.I)
+        html_new = _HEAD_END_RE.sub(f"{MARK_FLAG}\n</head>", html_new, count=1)
     else:
         html_new = MARK_FLAG + "\n" + html_new
+    return html_new
+
+# ===== 单遍：一次扫描拿到所有改动位置 =====
+# 各目标的起始标签；meta 要逐个试完整规则，其它只要第一个（第一个不成立，后面的也不会成立）
+_TOKEN_RE = re.compile(r"<(?:(?P<title>title>)|(?P<meta>meta\s)|(?P<img>img\b)|(?P<h1>h1)|(?P<main>main)"
+                       r"|(?P<body>body)|(?P<ehead>/head>)|(?P<head>head))", re.I)
+
+# re.sub 会把替换串当模板解析（关键词里的反斜杠也算），这里照样解析；没有反斜杠时模板就是字面量，省掉解析
+def _sub_text(template: str) -> str:
+    return template if "\\" not in template else _HEAD_END_RE.sub(template, "</head>", count=1)
 
-    backup_file(html_path)
-    write_text(html_path, html_new)
+def _expand(m: re.Match, template: str) -> str:
+    return template if "\\" not in template else m.expand(template)
+
+def plan_edits(html_text: str, title: str, desc: str, kw: str):
+    """
+    返回按偏移排好的 [(start, end, 替换文本)]，与 inject_sequential 的结果等价；
+    几处改动互相重叠（比如首图藏在 <title> 里），逐步替换会找到别的位置，这时返回 None。
+    """
+    first, meta = {}, None
+    for m in _TOKEN_RE.finditer(html_text):
+        k = m.lastgroup
+        if k == "meta":
+            if meta is None:
+                meta = _META_RE.match(html_text, m.start())
+        elif k not in first:
+            first[k] = m.start()
+
+    edits, head_parts = [], []
+    def match(rex, key):
+        return rex.match(html_text, first[key]) if key in first else None
+
+    t_esc = html.escape(title, quote=False)
+    m = match(_TITLE_RE, "title")
+    if m: edits.append((m.start(), m.end(), _expand(m, f"<title>{t_esc}</title>")))
+    else: head_parts.append(_sub_text(f"<title>{t_esc}</title>\n</head>")[:-7])
+
+    d_esc = html.escape(desc, quote=True)
+    if meta: edits.append((meta.start(), meta.end(), _expand(meta, f'<meta name="description" content="{d_esc}" />')))
+    else: head_parts.append(_sub_text(f'<meta name="description" content="{d_esc}" />\n</head>')[:-7])
+
+    m = match(_IMG_RE, "img")
+    if m: edits.append((m.start(), m.end(), _alt_repl(html.escape(kw, quote=True))(m)))
+
+    if INJECT_H1:
+        h_esc = html.escape(kw, quote=False)
+        m = match(_H1_RE, "h1")
+        if m: edits.append((m.start(), m.end(), _expand(m, f"<h1>{h_esc}</h1>")))
+        else:
+            m = match(_MAIN_RE, "main") or match(_BODY_RE, "body")
+            if m: edits.append((m.start(), m.end(), m.group(1) + _expand(m, "\n<h1>"+h_esc+"</h1>")))
+
+    head = first.get("head")
+    if head is not None and any(s <= head < e for s, e, _ in edits):
+        return None
+    if head is not None:
+        head_parts.append(f"{MARK_FLAG}\n")
+    else:
+        edits.append((0, 0, MARK_FLAG + "\n"))
+    # 标题 / 描述 / 标记都插在同一个 </head> 前（逐步替换时它每次都被换成小写的 </head>）
+    if "ehead" in first and head_parts:
+        h = first["ehead"]
+        edits.append((h, h + 7, "".join(head_parts) + "</head>"))
+
+    edits.sort(key=lambda t: (t[0], t[1]))
+    for (_, e1, _), (s2, _, _) in zip(edits, edits[1:]):
+        if s2 < e1:
+            return None
+    return edits
+
+def render_page(html_text: str, cat: str, kw: str, idx: int = 0) -> str:
+    title, desc = build_title_desc(cat, kw, seed_idx=idx)
+    edits = plan_edits(html_text, title, desc, kw)
+    if edits is None:
+        nb_metrics.current().count("inject_sequential")
+        return inject_sequential(html_text, title, desc, kw)
+    out, last = [], 0
+    for s, e, text in edits:
+        out.append(html_text[last:s]); out.append(text)
+        last = e
+    out.append(html_text[last:])
+    return "".join(out)
+
+def inject_for_page(html_path: Path, cat: str, kw: str, force: bool=False, idx: int=0, pw=None) -> str:
+    m = nb_metrics.current()
+    html_text = read_text(html_path)
+    m.read(html_text)
+    if (not force) and page_has_mark(html_text):
+        m.skipped()
+        return "skip(marked)"
+    html_new = render_page(html_text, cat, kw, idx)
+
+    if pw is not None:
+        pw.write(html_path, html_new)   # 事务层自带备份（.nb_backups）
+    else:
+        backup_file(html_path)
+        write_text(html_path, html_new)
     return "ok"
 
-def run(force: bool=False):
+# ===== 并行：按分类 / 每 CHUNK 页切块，子进程只算新内容，写回留在主进程 =====
+CHUNK = 200
+
+def render_chunk(job):
+    """job = (cat, [(path, kw, idx)], force)；返回 [(path, kw, 状态, 新内容或 None)]。"""
+    cat, items, force = job
+    m = nb_metrics.current()
+    out = []
+    for html_fp, kw, idx in items:
+        html_text = read_text(html_fp)
+        m.read(html_text)
+        if (not force) and page_has_mark(html_text):
+            m.skipped()
+            out.append((html_fp, kw, "skip(marked)", None))
+            continue
+        out.append((html_fp, kw, "ok", render_page(html_text, cat, kw, idx)))
+    return out
+
+def _render_chunk_in_worker(job):
+    # 子进程各记各的，做完把计数交回主进程合并
+    m = nb_metrics.start("inject_keywords", ROOT, emit_at_exit=False)
+    result = render_chunk(job)
+    return result, m.to_dict()
+
+def run(force: bool=False, workers: int=1):
     cat_dirs = []
     for c in CATEGORIES:
         p = ROOT / c
@@ -131,6 +259,7 @@ def run(force: bool=False):
             cat_dirs.append((c, p))
     log(f"[cfg] category_dirs -> {[c for c,_ in cat_dirs]}")
 
+    jobs = []
     for cat, cat_dir in cat_dirs:
         kws, src = load_keywords_for(cat)
         if not kws:
@@ -144,15 +273,36 @@ def run(force: bool=False):
             continue
 
         # 逐页注入：每页关键词唯一 + 模板轮换
-        for i, html_fp in enumerate(files):
-            kw = kws[i % len(kws)]
-            status = inject_for_page(html_fp, cat, kw, force=force, idx=i)
-            log(f"[{status}] {cat} :: {kw} -> {html_fp.relative_to(ROOT)}")
+        items = [(html_fp, kws[i % len(kws)], i) for i, html_fp in enumerate(files)]
+        jobs += [(cat, items[i:i + CHUNK], force) for i in range(0, len(items), CHUNK)]
+
+    with PageWriter(ROOT, stage="inject_keywords") as pw:
+        def commit(cat, result):
+            for html_fp, kw, status, html_new in result:
+                if html_new is not None:
+                    pw.write(html_fp, html_new)   # 事务层自带备份（.nb_backups）
+                log(f"[{status}] {cat} :: {kw} -> {html_fp.relative_to(ROOT)}")
+
+        if workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                commit(job[0], render_chunk(job))
+        else:
+            metrics = nb_metrics.current()
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as ex:
+                for job, (result, d) in zip(jobs, ex.map(_render_chunk_in_worker, jobs)):
+                    commit(job[0], result)
+                    metrics.merge(d)
 
     log("✅ all done.")
 
-if __name__ == "__main__":
+def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--force", action="store_true", help="忽略标记，强制覆盖注入")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="并行进程数（默认 1 串行；0 = CPU 核数）。按分类切块，输出与串行一致")
     args = ap.parse_args()
-    run(force=args.force)
+    nb_metrics.start("inject_keywords", ROOT)
+    run(force=args.force, workers=args.workers or os.cpu_count() or 1)
+
+if __name__ == "__main__":
+    nb_profile.run_main("inject_keywords", main, ROOT)
@@ -2,23 +2,31 @@
 """
 kw_persist_and_fill.py
 功能：
-1) 为每个页面生成/复用 1 个稳定关键词，并持久化到 .kw_map.json（url->keyword）。
-2) 自动为分类页/单图页插入 80-200 词正文段落（带标记，二次运行可覆盖更新，不重复叠加）。
+1) 为每个页面生成/复用 1 个稳定关键词，并持久化到 .kw_map.sqlite（url->keyword，见 kw_store.py），
+   每轮有改动就导出进 git 的 .kw_map.csv；库不存在时从 .kw_map.csv（没有则旧的 .kw_map.json）重建。
+2) 自动为分类页/单图页插入 80-200 词正文段落（nb_regions 托管区块 AUTO-DESC，二次运行原地更新，不重复叠加）。
 3) 如首张 <img> 缺失 alt，则用该关键词补上（仅在 alt 为空时才写，避免与其他脚本冲突）。
+4) 分两步走：先按扫描顺序（目录内按名字排序）串行给所有新页面分配关键词，
+   再把“读页面 → 生成描述 → 注入”交给进程池（--workers），写回仍在主进程里按原顺序走 PageWriter，
+   结果与 --workers 1 逐字节一致。
 
 使用：
-python kw_persist_and_fill.py --root . --pool keywords\\selected.txt --min-words 100 --max-words 180
+python kw_persist_and_fill.py --root . --pool keywords\\selected.txt --min-words 100 --max-words 180 [--workers 0]
 参数说明见 main() 下方 argparse。
 """
-import os, re, json, random, hashlib, argparse
-
-# ----------- 可按需忽略的目录/文件 -----------
-SKIP_DIRS = {'.git', 'assets', 'static', 'vendor', 'node_modules', '.venv', 'venv'}
+import os, re, argparse
+from concurrent.futures import ProcessPoolExecutor
+from site_scan import scan
+from page_writer import PageWriter
+from kw_store import KwMapStore, CSV_FILE
+import nb_metrics, nb_profile, nb_regions
+import nb_textgen as tg
+
+# ----------- 跳过的目录/文件统一由 site_scan.SkipPolicy 决定 -----------
 HTML_EXTS = {'.html', '.htm'}
 
-MAP_FILE = '.kw_map.json'   # 持久化映射：{"rel/url.html": "keyword"}
-DESC_START = '<!--AUTO_DESC_START-->'
-DESC_END   = '<!--AUTO_DESC_END-->'
+DESC_REGION = 'AUTO-DESC'   # <!--AUTO_DESC_START--> ... <!--AUTO_DESC_END-->
+DESC_START, DESC_END = nb_regions.markers(DESC_REGION)
 
 def is_html(path):
     return os.path.splitext(path)[1].lower() in HTML_EXTS
@@ -27,18 +35,6 @@ def rel_url(root, path):
     rel = os.path.relpath(path, root).replace('\\','/')
     return rel
 
-def load_kw_map(root):
-    p = os.path.join(root, MAP_FILE)
-    if os.path.exists(p):
-        with open(p, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
-def save_kw_map(root, mp):
-    p = os.path.join(root, MAP_FILE)
-    with open(p, 'w', encoding='utf-8') as f:
-        json.dump(mp, f, ensure_ascii=False, indent=2)
-
 def load_pool(pool_file):
     if pool_file and os.path.exists(pool_file):
         with open(pool_file, 'r', encoding='utf-8') as f:
@@ -59,20 +55,34 @@ def append_global_used(global_path, keyword):
     with open(global_path, 'a', encoding='utf-8') as f:
         f.write(keyword.strip() + '\n')
 
-def pick_keyword(url, kw_map, pool, used_global):
-    """为 url 挑一个关键词：优先复用 kw_map；否则从 pool 里按顺序挑一个未被 used_global 使用过的。"""
-    if url in kw_map and kw_map[url]:
-        return kw_map[url], False  # False = 不是新分配
-    for kw in pool:
-        if kw not in used_global and kw not in kw_map.values():
-            kw_map[url] = kw
-            return kw, True
-    # 如果池子空了，就退而求其次：用文件名派生一个关键词，避免空
-    fallback = os.path.splitext(os.path.basename(url))[0].replace('_',' ').replace('-',' ')
-    if not fallback:
-        fallback = 'photo gallery'
-    kw_map[url] = fallback
-    return fallback, True
+class KeywordPicker:
+    """
+    为 url 挑一个关键词：优先复用映射库里的；否则从 pool 里按顺序挑一个未被 used_global 使用、也没分给别的页面的。
+    一轮里“已用”的词只增不减，排在游标前面的词不会再变回可用，所以游标只往前走，
+    不必像原来那样每个新页面都从头扫池子、再对整个映射的 values() 逐个比对。
+    """
+    def __init__(self, store, pool, used_global):
+        self.store = store
+        self.pool = pool
+        self.used_global = used_global
+        self.pos = 0
+
+    def pick(self, url):
+        kw = self.store.get(url)
+        if kw:
+            return kw, False  # False = 不是新分配
+        while self.pos < len(self.pool):
+            kw = self.pool[self.pos]
+            self.pos += 1
+            if kw not in self.used_global and not self.store.has_keyword(kw):
+                self.store.put(url, kw)
+                return kw, True
+        # 如果池子空了，就退而求其次：用文件名派生一个关键词，避免空
+        fallback = os.path.splitext(os.path.basename(url))[0].replace('_',' ').replace('-',' ')
+        if not fallback:
+            fallback = 'photo gallery'
+        self.store.put(url, fallback)
+        return fallback, True
 
 def detect_page_type(url):
     """
@@ -87,75 +97,30 @@ def detect_page_type(url):
 def seeded_random_text(seed_str, keyword, ptype, min_words=100, max_words=180):
     """
     用稳定随机（基于 url 的 hash 做种子）生成 100~180 词之间的段落，包含 keyword。
-    这样同一 url 每次生成的文本一致；不同 url 则不同。
+    这样同一 url 每次生成的文本一致；不同 url 则不同。模板片段池在 nb_textgen 里。
     """
-    seed = int(hashlib.md5(seed_str.encode('utf-8')).hexdigest(), 16) % (2**32)
-    rnd = random.Random(seed)
-
-    # 几个模板片段池（你可以按站点风格扩充）
-    intros = [
-        f"This page explores {keyword} with a practical focus on visual detail and browsing experience.",
-        f"Here we highlight {keyword}, aiming for clean structure, quick scanning, and useful context.",
-        f"Designed for readers looking into {keyword}, this page emphasizes clarity and consistency."
-    ]
-    bodies_cat = [
-        "You will find a concise introduction to the theme, suggestions for discovery, and guidance to navigate related sections. The layout balances thumbnails and text so each visit feels lightweight but informative. Frequent updates keep the collection fresh.",
-        "We group similar items to reduce repetition while preserving variety. This structure helps search engines understand relationships and helps visitors jump between related pages with minimal friction.",
-        "Short descriptive blurbs add context to images, improving accessibility and search relevance without overwhelming the visuals. Internal links further tie categories together."
-    ]
-    bodies_img = [
-        "The image aims to deliver a straightforward visual impression while keeping the file lightweight. A brief explanation clarifies the subject and lighting so visitors can quickly decide where to go next.",
-        "Alt text and headings are optimized to make the content accessible and to provide consistent cues across the site. Subtle differences in wording help avoid duplication across similar pages.",
-        "Internal navigation leads to related items with comparable tone or composition. This reduces bounce and supports exploration within the same theme."
-    ]
-    closings = [
-        "If you are comparing alternatives, keep an eye on subtle differences in framing, contrast, and color balance.",
-        "For more context, browse related entries linked nearby; each page offers a slightly different angle to limit overlap.",
-        "Bookmark the page if it’s useful; updates aim to improve clarity, speed, and overall structure over time."
-    ]
-
-    targets = rnd.randint(min_words, max_words)
-    parts = [rnd.choice(intros)]
-    pool = bodies_cat if ptype == 'category' else bodies_img
-    while len(" ".join(parts).split()) < targets:
-        parts.append(rnd.choice(pool))
-        if rnd.random() < 0.5:
-            parts.append(rnd.choice(closings))
-    text = " ".join(parts)
-
-    # 保证 keyword 至少出现一次
-    if keyword.lower() not in text.lower():
-        text = f"{keyword}. " + text
-    return text
+    return tg.long_text(seed_str, keyword, ptype, min_words, max_words)
 
 def inject_auto_desc(html, desc_html):
     """
     在 HTML 中插入/更新自动描述块：
-    - 若存在 <!--AUTO_DESC_START-->...<!--AUTO_DESC_END--> 则替换；
-    - 否则优先插到 </main> 前；没有 <main> 就插到 </body> 前。
+    - 若存在 <!--AUTO_DESC_START-->...<!--AUTO_DESC_END--> 则原地替换（整个 <section>，多出来的重复块删掉）；
+    - 否则优先插到 </main> 前；没有 <main> 就插到 </body> 前；都没有就追加到末尾。
+    块写成 bs4 序列化后的样子（不缩进），seo_fixer / v4_patch 重新输出后下一轮比较时仍一致。
     """
-    if DESC_START in html and DESC_END in html:
-        pattern = re.compile(re.escape(DESC_START) + r'.*?' + re.escape(DESC_END), re.S | re.I)
-        return pattern.sub(DESC_START + '\n' + desc_html + '\n' + DESC_END, html)
-
-    block = f"""{DESC_START}
-<section class="auto-desc" style="max-width:900px;margin:1rem auto;line-height:1.6;">
-  {desc_html}
-</section>
-{DESC_END}"""
-
-    # 优先放在 </main> 之前
-    m = re.search(r'</main\s*>', html, flags=re.I)
+    section = f'<section class="auto-desc" style="max-width:900px;margin:1rem auto;line-height:1.6;">\n{desc_html}\n</section>'
+    rg = nb_regions.Regions(html)
+    if rg.has(DESC_REGION):
+        rg.set(DESC_REGION, section)
+        return rg.render()
+
+    # 优先放在 </main> 之前，其次 </body> 之前
+    m = re.search(r'</main\s*>', html, flags=re.I) or re.search(r'</body\s*>', html, flags=re.I)
     if m:
-        idx = m.start()
-        return html[:idx] + block + html[idx:]
-    # 其次放在 </body> 之前
-    m = re.search(r'</body\s*>', html, flags=re.I)
-    if m:
-        idx = m.start()
-        return html[:idx] + block + html[idx:]
-    # 都没有就直接追加
-    return html + "\n" + block + "\n"
+        rg.set(DESC_REGION, section, at=m.start())
+    else:
+        rg.set(DESC_REGION, section, at=len(html), sep="\n")
+    return rg.render()
 
 def ensure_first_img_alt(html, keyword):
     """
@@ -172,27 +137,34 @@ def ensure_first_img_alt(html, keyword):
 
     return re.sub(r'<img\b[^>]*?>', repl, html, count=1, flags=re.I|re.S)
 
-def process_page(root, path, kw_map, pool, used_global, global_path, min_words, max_words):
-    url = rel_url(root, path)
-    ptype = detect_page_type(url)
-    keyword, is_new = pick_keyword(url, kw_map, pool, used_global)
-
-    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-        html = f.read()
-
+def render_page(html, url, keyword, min_words, max_words):
+    """纯函数：给定页面内容和已分配的关键词，返回注入后的内容（没变就原样返回）。"""
     # 生成稳定描述文本（按 url 作为随机种子，保证每次一致）
-    desc_txt = seeded_random_text(url, keyword, ptype, min_words, max_words)
-    desc_html = f"<p>{desc_txt}</p>"
+    desc_txt = seeded_random_text(url, keyword, detect_page_type(url), min_words, max_words)
+    desc_html = f"<p>{nb_regions.esc_text(desc_txt)}</p>"
 
     # 注入描述块
     html2 = inject_auto_desc(html, desc_html)
 
     # 如首图 alt 为空则补上
-    html2 = ensure_first_img_alt(html2, keyword)
+    return ensure_first_img_alt(html2, keyword)
+
+def process_page(root, path, picker, global_path, min_words, max_words, pw=None):
+    """单页一把做完（分配 + 注入 + 写回），给外部脚本逐页调用；main() 走下面的两步流程。"""
+    url = rel_url(root, path)
+    keyword, is_new = picker.pick(url)
 
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        html = f.read()
+    nb_metrics.current().read(html)
+
+    html2 = render_page(html, url, keyword, min_words, max_words)
     if html2 != html:
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(html2)
+        if pw is not None:
+            pw.write(path, html2)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(html2)
 
     # 新分配的关键词写入全局去重库
     if is_new and global_path:
@@ -200,6 +172,40 @@ def process_page(root, path, kw_map, pool, used_global, global_path, min_words,
 
     return keyword, is_new
 
+# ===== 第一步：串行分配关键词（谁先分到哪个词只取决于扫描顺序，和并行无关） =====
+def allocate(root, paths, picker, global_path):
+    """返回 [(path, url, keyword, is_new)]；新分配的词按顺序追加进全局去重库。"""
+    out = []
+    for path in paths:
+        url = rel_url(root, path)
+        keyword, is_new = picker.pick(url)
+        if is_new and global_path:
+            append_global_used(global_path, keyword)
+        out.append((path, url, keyword, is_new))
+    return out
+
+# ===== 第二步：按 CHUNK 页切块渲染，子进程只算新内容，写回留在主进程 =====
+CHUNK = 200
+
+def render_chunk(job):
+    """job = (root, [(path, url, keyword)], min_words, max_words)；返回 [(path, 新内容或 None)]。"""
+    _root, items, min_words, max_words = job
+    m = nb_metrics.current()
+    out = []
+    for path, url, keyword in items:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            html = f.read()
+        m.read(html)
+        html2 = render_page(html, url, keyword, min_words, max_words)
+        out.append((path, html2 if html2 != html else None))
+    return out
+
+def _render_chunk_in_worker(job):
+    # 子进程各记各的，做完把计数交回主进程合并
+    m = nb_metrics.start("kw_persist_and_fill", job[0], emit_at_exit=False)
+    result = render_chunk(job)
+    return result, m.to_dict()
+
 def main():
     ap = argparse.ArgumentParser(description="Persist url→keyword mapping and fill 80–200 word descriptions.")
     ap.add_argument('--root', default='.', help='站点根目录（默认当前目录）')
@@ -209,47 +215,65 @@ def main():
                     help='跨站去重词库文件（默认读取环境变量 NB_USED_GLOBAL，否则 D:\\project\\used_keywords_global.txt）')
     ap.add_argument('--min-words', type=int, default=100, help='描述最小词数（默认100）')
     ap.add_argument('--max-words', type=int, default=180, help='描述最大词数（默认180）')
+    ap.add_argument('--workers', type=int, default=1,
+                    help='并行进程数（默认 1 串行；0 = CPU 核数）。关键词先串行分配好，输出与串行逐字节一致')
     args = ap.parse_args()
 
     root = os.path.abspath(args.root)
-    kw_map = load_kw_map(root)
+    metrics = nb_metrics.start("kw_persist_and_fill", root)
+    store = KwMapStore(root)
     pool = load_pool(os.path.join(root, args.pool)) if not os.path.isabs(args.pool) else load_pool(args.pool)
-    used_global = load_global_used(args.global_used)
+    picker = KeywordPicker(store, pool, load_global_used(args.global_used))
 
     changed = 0
     assigned_new = 0
     total = 0
 
-    for dirpath, dirnames, filenames in os.walk(root):
-        # 跳过部分目录
-        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
-        for fn in filenames:
-            fp = os.path.join(dirpath, fn)
-            if not is_html(fp): continue
+    workers = args.workers or os.cpu_count() or 1
+
+    with store, PageWriter(root, stage="kw_persist_and_fill") as pw:
+        with metrics.timer("allocate"):
+            plan = allocate(root, scan(root).page_paths(), picker, args.global_used)
+        store.flush()
+        for _path, _url, _kw, is_new in plan:
             total += 1
-            kw, is_new = process_page(root, fp, kw_map, pool, used_global, args.global_used,
-                                      args.min_words, args.max_words)
             if is_new:
                 assigned_new += 1
+                metrics.count("keywords_assigned")
+            metrics.cache("kw_map", not is_new)
             changed += 1
 
-    save_kw_map(root, kw_map)
-
-    # 额外导出 csv 方便你或其他脚本使用
-    try:
-        out_csv = os.path.join(root, '.kw_map.csv')
-        with open(out_csv, 'w', encoding='utf-8') as f:
-            f.write('url,keyword\n')
-            for u, k in kw_map.items():
-                f.write(f'{u},{k}\n')
-    except Exception:
-        pass
+        items = [(path, url, kw) for path, url, kw, _new in plan]
+        jobs = [(root, items[i:i + CHUNK], args.min_words, args.max_words)
+                for i in range(0, len(items), CHUNK)]
+
+        def commit(result):
+            for path, html2 in result:
+                if html2 is not None:
+                    pw.write(path, html2)
+
+        if workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                commit(render_chunk(job))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as ex:
+                for result, d in ex.map(_render_chunk_in_worker, jobs):
+                    commit(result)
+                    metrics.merge(d)
+
+        # 额外导出 csv 方便你或其他脚本使用（本轮映射没变就不重写）
+        out_csv = os.path.join(root, CSV_FILE)
+        try:
+            with metrics.timer("csv"):
+                store.export_csv(out_csv)
+        except OSError:
+            pass
 
     print(f'[OK] processed pages: {total}, changed: {changed}, new_assigned: {assigned_new}')
-    print(f'[OK] kw map saved: {os.path.join(root, MAP_FILE)}')
-    print(f'[OK] csv exported: {os.path.join(root, ".kw_map.csv")}')
+    print(f'[OK] kw map saved: {store.path}')
+    print(f'[OK] csv exported: {out_csv}')
     if args.global_used:
         print(f'[OK] global used file: {args.global_used}')
 
 if __name__ == '__main__':
-    main()
+    nb_profile.run_main("kw_persist_and_fill", main)
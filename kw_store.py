@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+kw_store.py —— 页面关键词映射库（url -> keyword，替代每次整份读写的 .kw_map.json）
+- SQLite 单文件 .kw_map.sqlite（站点根目录，不进 git）；url 主键 + keyword 索引，按 url 查、按词查都是点查
+- 写入先攒在内存里，每 batch 条一个事务批量 upsert；启动不再整份解析，保存只写本轮新增/改动的条目
+- .kw_map.csv 是进 git 的持久记录（库文件不进 git）：库不存在时（新克隆 / 换机器）自动从它重建，
+  没有 CSV 才退回旧的 .kw_map.json；两种文件里有 git 合并冲突标记也能按行救回来，原文件原样保留
+- 库里（kw_meta 表）记着上次导入 / 导出时 CSV 的大小+mtime 和 sha1：打开时 CSV 对不上（git pull / 手改过）
+  就重新导入一遍，CSV 里的条目以 CSV 为准，免得随后的 export_csv 拿库里的旧映射把它覆盖掉；
+  只有 mtime 变了（checkout 碰过）但内容一样的不导入，只更新记录
+- CSV 导出流式写（.tmp + 原子替换），按首次分配的顺序，格式与原来的 .kw_map.csv 相同（值里有逗号/引号时按 CSV 规则加引号）；
+  本轮没改动就不重写
+
+用法：
+from kw_store import KwMapStore
+with KwMapStore(root) as store:
+    store.get("bedroom/a.html"); store.has_keyword("sunset"); store.put("bedroom/a.html", "sunset")
+    store.export_csv(os.path.join(root, ".kw_map.csv"))
+
+python kw_store.py [--root .] stats                 # 条目数 / 文件大小
+python kw_store.py [--root .] export [--csv PATH]   # 导出 CSV
+python kw_store.py [--root .] migrate [--json PATH | --csv PATH]   # 手动（重新）导入，已有条目以导入文件为准
+"""
+import os, re, csv, json, hashlib, sqlite3, argparse
+
+DB_FILE = ".kw_map.sqlite"
+LEGACY_JSON = ".kw_map.json"
+CSV_FILE = ".kw_map.csv"
+
+_CONFLICT = ("<<<<<<<", "=======", ">>>>>>>")
+_JSON_PAIR = re.compile(r'^\s*("(?:[^"\\]|\\.)*")\s*:\s*("(?:[^"\\]|\\.)*")\s*,?\s*$')
+
+def read_legacy_json(path):
+    """
+    读旧的 {url: keyword} JSON，返回 (dict, 是否按行恢复)。
+    整份解析失败（典型是 <<<<<<< / ======= / >>>>>>> 冲突标记）时逐行捡 "url": "keyword"，
+    冲突两边都收，同一 url 以后出现的为准（与 json.load 的重复键规则一致）。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return {str(k): str(v) for k, v in data.items()}, False
+    except ValueError:
+        pass
+    out = {}
+    for line in text.splitlines():
+        m = _JSON_PAIR.match(line)
+        if m:
+            out[json.loads(m.group(1))] = json.loads(m.group(2))
+    return out, True
+
+def read_csv(path):
+    """
+    读导出的 url,keyword CSV，返回 (dict, 是否跳过了冲突标记 / 坏行)。同一 url 以后出现的为准。
+    老版本导出时不加引号，keyword 里的逗号会把一行拆成多列，这里把第二列之后的拼回去。
+    """
+    out, salvaged = {}, False
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for i, row in enumerate(csv.reader(f)):
+            if i == 0 and row == ["url", "keyword"]:
+                continue
+            if len(row) < 2 or row[0].startswith(_CONFLICT):
+                salvaged = salvaged or bool(row)
+                continue
+            out[row[0]] = ",".join(row[1:])
+    return out, salvaged
+
+def _file_sig(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class KwMapStore:
+    def __init__(self, root=".", path=None, batch=1000, migrate=True):
+        self.root = os.path.abspath(root)
+        self.path = path or os.path.join(self.root, DB_FILE)
+        self.batch = batch
+        fresh = not os.path.exists(self.path)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS kw_map (url TEXT PRIMARY KEY, keyword TEXT NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS kw_map_keyword ON kw_map(keyword)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS kw_meta (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+        self.db.commit()
+        self._pending = {}        # url -> keyword，还没落库
+        self._pending_kws = set()
+        self.dirty = False        # 本轮是否改过映射（决定要不要重新导出 CSV）
+        self.tracked = os.path.join(self.root, CSV_FILE)
+        if migrate:
+            # 进 git 的 CSV 是最新的持久记录；.kw_map.json 只有从没导出过 CSV 的老站点才用得上
+            legacy = os.path.join(self.root, LEGACY_JSON)
+            if os.path.exists(self.tracked):
+                self._sync_tracked()
+            elif fresh and os.path.exists(legacy):
+                self.import_json(legacy)
+
+    # ----- 进 git 的 CSV 记录 -----
+    def _meta(self, k):
+        row = self.db.execute("SELECT v FROM kw_meta WHERE k = ?", (k,)).fetchone()
+        return row[0] if row else None
+
+    def _remember_tracked(self, sha1=None):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO kw_meta (k, v) VALUES (?, ?)",
+                                [("csv_sig", _file_sig(self.tracked)),
+                                 ("csv_sha1", sha1 or _file_sha1(self.tracked))])
+
+    def _sync_tracked(self):
+        """CSV 跟上次导入 / 导出时不一样就重新导入；返回是否导入了。"""
+        if _file_sig(self.tracked) == self._meta("csv_sig"):
+            return False
+        sha1 = _file_sha1(self.tracked)
+        changed = sha1 != self._meta("csv_sha1")
+        if changed:
+            self.import_csv(self.tracked)
+        self._remember_tracked(sha1)
+        return changed
+
+    # ----- 迁移 -----
+    def import_json(self, path):
+        data, salvaged = read_legacy_json(path)
+        if salvaged:
+            print(f"[WARN] {path} 不是合法 JSON（疑似合并冲突标记），按行恢复 {len(data)} 条")
+        return self._import(path, data)
+
+    def import_csv(self, path):
+        data, salvaged = read_csv(path)
+        if salvaged:
+            print(f"[WARN] {path} 里有合并冲突标记 / 坏行，已跳过，恢复 {len(data)} 条")
+        return self._import(path, data)
+
+    def _import(self, path, data):
+        self.flush()
+        with self.db:
+            self._upsert(data.items())
+        self.dirty = True
+        print(f"[OK] 从 {path} 导入 {len(data)} 条 -> {self.path}")
+        return len(data)
+
+    # ----- 查询 -----
+    def get(self, url):
+        if url in self._pending:
+            return self._pending[url]
+        row = self.db.execute("SELECT keyword FROM kw_map WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def has_keyword(self, keyword):
+        if keyword in self._pending_kws:
+            return True
+        return self.db.execute("SELECT 1 FROM kw_map WHERE keyword = ? LIMIT 1", (keyword,)).fetchone() is not None
+
+    def __len__(self):
+        self.flush()
+        return self.db.execute("SELECT COUNT(*) FROM kw_map").fetchone()[0]
+
+    def items(self):
+        """按首次写入顺序流式返回 (url, keyword)。"""
+        self.flush()
+        yield from self.db.execute("SELECT url, keyword FROM kw_map ORDER BY rowid")
+
+    # ----- 写入 -----
+    def put(self, url, keyword):
+        # 同一 url 被改写时旧词不从 _pending_kws 里删：只会让 has_keyword 偏保守，本轮内无所谓
+        self._pending[url] = keyword
+        self._pending_kws.add(keyword)
+        self.dirty = True
+        if len(self._pending) >= self.batch:
+            self.flush()
+
+    def _upsert(self, pairs):
+        # 已有的 url 原地更新（rowid 不变，导出顺序仍按首次分配）
+        self.db.executemany(
+            "INSERT INTO kw_map (url, keyword) VALUES (?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET keyword = excluded.keyword", pairs)
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self.db:
+            self._upsert(self._pending.items())
+        self._pending.clear()
+        self._pending_kws.clear()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- 导出 -----
+    def export_csv(self, path=None, force=False):
+        """流式写 url,keyword；本轮没改动且文件已在就跳过。返回是否写了。"""
+        path = path or os.path.join(self.root, CSV_FILE)
+        if not (force or self.dirty or not os.path.exists(path)):
+            return False
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f, lineterminator="\n")
+            w.writerow(("url", "keyword"))
+            w.writerows(self.items())
+        os.replace(tmp, path)
+        if os.path.abspath(path) == self.tracked:
+            self._remember_tracked()
+        return True
+
+def main():
+    ap = argparse.ArgumentParser(description="页面关键词映射库（.kw_map.sqlite）")
+    ap.add_argument("--root", default=".")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    p = sub.add_parser("export"); p.add_argument("--csv", default=None)
+    p = sub.add_parser("migrate")
+    g = p.add_mutually_exclusive_group()
+    g.add_argument("--json", default=None)
+    g.add_argument("--csv", default=None)
+    args = ap.parse_args()
+
+    with KwMapStore(args.root, migrate=False) as store:
+        if args.cmd == "stats":
+            size = os.path.getsize(store.path)
+            print(f"[OK] {store.path}: {len(store)} 条, {size / 1024:.1f} KB")
+        elif args.cmd == "export":
+            store.export_csv(args.csv, force=True)
+            print(f"[OK] csv exported: {args.csv or os.path.join(store.root, CSV_FILE)}")
+        elif args.cmd == "migrate":
+            if args.csv:
+                store.import_csv(args.csv)
+            else:
+                store.import_json(args.json or os.path.join(store.root, LEGACY_JSON))
+
+if __name__ == "__main__":
+    main()
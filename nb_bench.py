@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+nb_bench.py —— 合成站点 + 页面处理阶段基准测试
+- 按我们站点的形状合成 N 页的站：分类目录、20250817_090303_01.html 详情页 + 配图、pageN.html 列表页、
+  index.html、keywords/ 词池、config.json、ads_mapping.json（优先复制本目录的那份）
+- 按流水线顺序在同一棵树上依次跑各阶段（ads → seo_fixer → v4_patch → nb_variants → kw_persist → sitemap），
+  每个阶段单独子进程：记录耗时、退出码、峰值内存（POSIX 下按子进程统计），并收集该阶段的 nb_metrics
+- 结果存 JSON；--compare 指定旧结果时打印逐阶段的耗时/内存变化，用于回归对比
+- 同样的 --seed 合成出的站点逐字节相同
+
+用法：
+python nb_bench.py                                  # 默认 1000 页
+python nb_bench.py --scales 1000,10000,100000 --out logs/bench/base.json
+python nb_bench.py --scales 10000 --stages seo_fixer,v4_patch --compare logs/bench/base.json
+python nb_bench.py --synth-only --scales 1000 --keep # 只合成站点（留给手工调试）
+"""
+import os, sys, json, time, random, shutil, argparse, platform, subprocess
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = ".nb_bench"
+PER_PAGE = 20
+BASE_TS = 1735689600      # 2025-01-01 00:00:00 UTC
+CATEGORIES = ["bedroom", "dark", "fitness", "luxury", "mirror", "office", "redroom", "shower", "soft", "uniform"]
+WORDS = ("soft light portrait studio elegant classic modern vintage golden evening morning window "
+         "silk lace mood shadow color tone style pose scene gallery artistic natural urban calm").split()
+# 最小合法 JPEG（1x1），只为让目录里真有图片文件
+TINY_JPG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f141d1a1f1e1d1a1c1c"
+    "20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b080001000101011100ffc4001f000001050101010101010000"
+    "0000000000000102030405060708090a0bffda0008010100003f00d2cf20ffd9")
+
+# 阶段名 -> (脚本, 参数)；cwd 一律为合成站点根目录
+STAGES = [
+    ("ads",         "ads_apply_all.py",         []),
+    ("seo_fixer",   "seo_fixer_v4.py",          []),
+    ("v4_patch",    "v4_patch_single_site.py",  ["--root", "."]),
+    ("nb_variants", "patch_nb_variants.py",     ["--site-root", "."]),
+    ("kw_persist",  "kw_persist_and_fill.py",   ["--root", ".", "--pool", os.path.join("keywords", "selected.txt"),
+                                                 "--global-used", os.path.join("logs", "used_keywords_global.txt")]),
+    ("sitemap",     "sitemap_fix.py",           ["--root", "."]),
+]
+STAGE_NAMES = [s[0] for s in STAGES]
+
+# ===== 合成 =====
+def _phrase(rnd, n):
+    return " ".join(rnd.choice(WORDS) for _ in range(n))
+
+def detail_html(domain, cat, name, kw, prev_name, next_name, page_no):
+    nav = ""
+    if prev_name: nav += f'<a href="{prev_name}.html">Previous</a> | '
+    if next_name: nav += f'<a href="{next_name}.html">Next</a> | '
+    return (
+        f'<html><head><title>{kw}</title>'
+        f'<meta name="description" content="{kw.capitalize()} themed portrait showcasing unique visual storytelling.">'
+        f'<meta name="keywords" content="{kw}">'
+        f'<script type="application/ld+json">{{"@context": "https://schema.org", "@type": "ImageObject", '
+        f'"name": "{kw}", "contentUrl": "{domain}/{cat}/{name}.jpg"}}</script>'
+        f'<link href="{domain}/{cat}/{name}.html" rel="canonical"/></head><body>'
+        f'<h1>{kw}</h1><img alt="{kw}" src="{name}.jpg" style="max-width:100%"/><br/>'
+        f'<p>This portrait highlights the theme of {kw}, combining aesthetic elements, lighting, and emotional resonance.</p>'
+        f'<div>{nav}<a href="page{page_no}.html">Back to List</a> | <a href="../index.html">Home</a></div></body></html>\n')
+
+def listing_html(cat, page_no, total_pages, names):
+    items = "".join(f'<a href="{n}.html"><img src="{n}.jpg" width="200"></a>\n' for n in names)
+    nav = (f'<a href="page{page_no - 1}.html">Previous</a> ' if page_no > 1 else "") + '<a href="../index.html">Home</a> ' \
+          + (f'<a href="page{page_no + 1}.html">Next</a>' if page_no < total_pages else "")
+    desc = f"Browse {cat} images. Page {page_no} of curated {cat}-style portrait collection."
+    return (f'<html><head><title>{cat.capitalize()} - Page {page_no}</title><meta name="description" content="{desc}">'
+            f'</head><body><h1>{cat.capitalize()} Gallery - Page {page_no}</h1><p>{desc}</p>{items}'
+            f'<div style="margin-top:20px">{nav}</div></body></html>\n')
+
+def synth_site(dest, pages, seed=1, domain="https://bench.example.com"):
+    """合成一个约 pages 个 HTML 的站点；返回实际 HTML 数。"""
+    rnd = random.Random(seed)
+    if os.path.exists(dest): shutil.rmtree(dest)
+    os.makedirs(os.path.join(dest, "keywords"))
+    with open(os.path.join(dest, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"site_name": "BenchSite", "domain": domain, "ads_code": []}, f, indent=2)
+    ads_src = os.path.join(TOOL_DIR, "ads_mapping.json")
+    if os.path.exists(ads_src):
+        shutil.copy(ads_src, os.path.join(dest, "ads_mapping.json"))
+
+    n_cats = min(len(CATEGORIES), max(1, pages // 100))
+    cats = CATEGORIES[:n_cats]
+    # 每 21 个页面里 20 个详情页 + 1 个列表页
+    n_detail = max(1, (pages - 1) * PER_PAGE // (PER_PAGE + 1))
+    selected = []
+    for ci, cat in enumerate(cats):
+        kws = [f"{cat} {_phrase(rnd, 2)} {i}" for i in range(400)]
+        selected += kws[:50]
+        with open(os.path.join(dest, "keywords", f"{cat}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(kws) + "\n")
+        os.makedirs(os.path.join(dest, cat))
+        count = n_detail // n_cats + (1 if ci < n_detail % n_cats else 0)
+        # 20250101_000000_01 起每张图隔 37 秒，保证文件名唯一且符合详情页命名
+        names = [time.strftime("%Y%m%d_%H%M%S", time.gmtime(BASE_TS + i * 37)) + f"_{ci + 1:02d}"
+                 for i in range(count)]
+        total_pages = max(1, -(-count // PER_PAGE))
+        for p in range(total_pages):
+            chunk = names[p * PER_PAGE:(p + 1) * PER_PAGE]
+            with open(os.path.join(dest, cat, f"page{p + 1}.html"), "w", encoding="utf-8") as f:
+                f.write(listing_html(cat, p + 1, total_pages, chunk))
+            for j, name in enumerate(chunk):
+                kw = kws[(p * PER_PAGE + j) % len(kws)]
+                prev_name = chunk[j - 1] if j > 0 else ""
+                next_name = chunk[j + 1] if j < len(chunk) - 1 else ""
+                with open(os.path.join(dest, cat, f"{name}.html"), "w", encoding="utf-8") as f:
+                    f.write(detail_html(domain, cat, name, kw, prev_name, next_name, p + 1))
+                with open(os.path.join(dest, cat, f"{name}.jpg"), "wb") as f:
+                    f.write(TINY_JPG)
+    with open(os.path.join(dest, "keywords", "selected.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(selected) + "\n")
+    links = "".join(f'<a href="{c}/page1.html">{c}</a>\n' for c in cats)
+    with open(os.path.join(dest, "index.html"), "w", encoding="utf-8") as f:
+        f.write(f"<html><head><title>BenchSite</title></head><body><h1>BenchSite</h1>{links}</body></html>\n")
+    return sum(1 for _, _, fs in os.walk(dest) for n in fs if n.endswith(".html"))
+
+# ===== 计时 =====
+def run_stage(site, name, script, args, run_id, timeout):
+    """子进程跑一个阶段；POSIX 下用 wait4 拿到该子进程自己的峰值 RSS。"""
+    env = dict(os.environ, NB_RUN_ID=run_id, PYTHONIOENCODING="utf-8")
+    log = os.path.join(site, "logs", f"bench_{name}.log")
+    os.makedirs(os.path.dirname(log), exist_ok=True)
+    t0 = time.perf_counter()
+    with open(log, "wb") as lf:
+        p = subprocess.Popen([sys.executable, os.path.join(TOOL_DIR, script)] + args, cwd=site, env=env,
+                             stdin=subprocess.DEVNULL, stdout=lf, stderr=subprocess.STDOUT)
+        rss_mb = None
+        if hasattr(os, "wait4"):
+            _, status, ru = os.wait4(p.pid, 0)
+            p.returncode = os.waitstatus_to_exitcode(status)
+            # Linux 的 ru_maxrss 单位是 KB，macOS 是字节
+            rss_mb = round(ru.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+        else:
+            p.wait(timeout=timeout)
+    secs = round(time.perf_counter() - t0, 3)
+    metrics = None
+    mp = os.path.join(site, "logs", "metrics", run_id)
+    if os.path.isdir(mp):
+        for fn in os.listdir(mp):
+            with open(os.path.join(mp, fn), "r", encoding="utf-8") as f:
+                metrics = json.load(f)
+    return {"seconds": secs, "rc": p.returncode, "max_rss_mb": rss_mb, "log": log, "metrics": metrics}
+
+def bench_scale(pages, stages, seed, keep, timeout, work_dir):
+    site = os.path.join(work_dir, f"site_{pages}")
+    t0 = time.perf_counter()
+    n_html = synth_site(site, pages, seed)
+    synth_s = round(time.perf_counter() - t0, 2)
+    print(f"[bench] {pages}: 合成 {n_html} 个 HTML（{synth_s}s） -> {site}")
+    out = {"pages": n_html, "synth_seconds": synth_s, "stages": {}}
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    for name, script, args in STAGES:
+        if name not in stages: continue
+        r = run_stage(site, name, script, args, f"bench_{stamp}_{pages}_{name}", timeout)
+        out["stages"][name] = r
+        flag = "" if r["rc"] == 0 else f"  ❌ rc={r['rc']}（见 {r['log']}）"
+        print(f"  {name:12s} {r['seconds']:9.2f}s  rss={r['max_rss_mb']}MB{flag}")
+    if not keep:
+        shutil.rmtree(site, ignore_errors=True)
+    return out
+
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TOOL_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip() or None
+    except OSError:
+        return None
+
+def compare(cur, old_path):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\n[compare] 对比 {old_path}（rev={old.get('rev')}）")
+    for scale, res in cur["scales"].items():
+        base = old.get("scales", {}).get(scale)
+        if not base: continue
+        for name, r in res["stages"].items():
+            b = base["stages"].get(name)
+            if not b: continue
+            dt = (r["seconds"] - b["seconds"]) / b["seconds"] * 100 if b["seconds"] else 0.0
+            rss = ""
+            if r.get("max_rss_mb") and b.get("max_rss_mb"):
+                rss = f"  rss {b['max_rss_mb']}→{r['max_rss_mb']}MB"
+            print(f"  {scale:>7s} {name:12s} {b['seconds']:8.2f}s → {r['seconds']:8.2f}s  ({dt:+.1f}%){rss}")
+
+def main():
+    ap = argparse.ArgumentParser(description="合成站点上的页面处理阶段基准测试")
+    ap.add_argument("--scales", default="1000", help="页面规模，逗号分隔（如 1000,10000,100000）")
+    ap.add_argument("--stages", default=",".join(STAGE_NAMES), help="要测的阶段，逗号分隔")
+    ap.add_argument("--seed", type=int, default=1, help="合成随机种子")
+    ap.add_argument("--work-dir", default=WORK_DIR, help="合成站点放哪（默认 .nb_bench/）")
+    ap.add_argument("--keep", action="store_true", help="测完保留合成站点")
+    ap.add_argument("--synth-only", action="store_true", help="只合成，不跑阶段")
+    ap.add_argument("--timeout", type=int, default=7200, help="单阶段超时秒数（仅非 POSIX）")
+    ap.add_argument("--out", help="结果 JSON（默认 logs/bench/bench_<时间>.json）")
+    ap.add_argument("--compare", help="与旧结果 JSON 对比")
+    args = ap.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    bad = [s for s in stages if s not in STAGE_NAMES]
+    if bad:
+        print(f"[FATAL] 未知阶段：{bad}；可选：{STAGE_NAMES}"); sys.exit(2)
+    work_dir = os.path.abspath(args.work_dir)
+
+    if args.synth_only:
+        for n in scales:
+            site = os.path.join(work_dir, f"site_{n}")
+            print(f"[bench] 合成 {synth_site(site, n, args.seed)} 个 HTML -> {site}")
+        return
+
+    res = {"started": time.strftime("%Y-%m-%d %H:%M:%S"), "rev": git_rev(), "python": platform.python_version(),
+           "platform": platform.platform(), "cpu_count": os.cpu_count(), "seed": args.seed, "scales": {}}
+    for n in scales:
+        res["scales"][str(n)] = bench_scale(n, stages, args.seed, args.keep, args.timeout, work_dir)
+
+    out = args.out or os.path.join("logs", "bench", f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(res, f, ensure_ascii=False, indent=2)
+    print(f"\n[bench] 结果 -> {out}")
+    if args.compare:
+        compare(res, args.compare)
+    if any(r["rc"] != 0 for s in res["scales"].values() for r in s["stages"].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+nb_metrics.py —— 各阶段共用的计时 / 计数埋点
+- timer(name)：上下文计时器，同名累加（秒数 + 次数）
+- 计数器：files_read / files_parsed / files_written / files_skipped / bytes_in / bytes_out，
+  缓存命中记 cache.<名字>.hit / cache.<名字>.miss，其它自定义计数随意 count("xxx")
+- 阶段结束（进程退出）自动写 logs/metrics/<run_id>/<stage>.json 并打印摘要表；
+  run_id 取 NB_RUN_ID（farm_build 给同一站点的各阶段设同一个），没有则按时间生成
+- page_writer 会自动把写回/跳过/字节数记到当前阶段上
+- 进程池：子进程里 start(stage, emit_at_exit=False)，把 to_dict() 交回主进程 merge() 累加
+
+用法：
+import nb_metrics
+m = nb_metrics.start("seo_fixer_v4", root)       # 进程内当前阶段
+with m.timer("parse"): soup = BeautifulSoup(html, "html.parser")
+m.read(html); m.count("files_parsed")
+
+python nb_metrics.py [--root .] [--run RUN_ID]    # 汇总某次运行各阶段耗时（默认最近一次）
+"""
+import os, sys, json, time, atexit, argparse
+from contextlib import contextmanager
+from backup_store import new_run_id
+
+METRICS_DIR = os.path.join("logs", "metrics")
+
+class Metrics:
+    def __init__(self, stage, root=".", run_id=None):
+        self.stage = stage
+        self.root = os.path.abspath(root)
+        self.run_id = run_id or new_run_id()
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.timers = {}       # name -> [秒, 次数]
+        self.counters = {}
+        self.emitted = False
+
+    @contextmanager
+    def timer(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            rec = self.timers.setdefault(name, [0.0, 0])
+            rec[0] += time.perf_counter() - t0
+            rec[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @staticmethod
+    def _size(data):
+        # 可传字节数，也可直接传读到的 str / bytes
+        if isinstance(data, int): return data
+        return len(data.encode("utf-8", "ignore")) if isinstance(data, str) else len(data)
+
+    def read(self, data=0):
+        self.count("files_read"); self.count("bytes_in", self._size(data))
+
+    def wrote(self, data=0):
+        self.count("files_written"); self.count("bytes_out", self._size(data))
+
+    def skipped(self, n=1):
+        self.count("files_skipped", n)
+
+    def cache(self, name, hit):
+        self.count(f"cache.{name}.{'hit' if hit else 'miss'}")
+
+    def merge(self, d):
+        """并入另一个 Metrics.to_dict()（进程池子进程交回来的）：计时、计数都累加。"""
+        for k, v in d.get("timers", {}).items():
+            rec = self.timers.setdefault(k, [0.0, 0])
+            rec[0] += v["seconds"]; rec[1] += v["calls"]
+        for k, n in d.get("counters", {}).items():
+            self.count(k, n)
+
+    def to_dict(self):
+        return {
+            "stage": self.stage, "run_id": self.run_id, "root": self.root, "pid": os.getpid(),
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": round(time.perf_counter() - self._t0, 4),
+            "timers": {k: {"seconds": round(v[0], 4), "calls": v[1]} for k, v in self.timers.items()},
+            "counters": dict(self.counters),
+        }
+
+    def path(self):
+        return os.path.join(self.root, METRICS_DIR, self.run_id, f"{self.stage}.json")
+
+    def emit(self, quiet=False):
+        """写 JSON 并打印摘要；同一个对象只写一次。"""
+        if self.emitted: return None
+        self.emitted = True
+        d = self.to_dict()
+        p = self.path()
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(d, f, ensure_ascii=False, indent=2)
+        if not quiet:
+            print(format_stage(d))
+            print(f"[METRICS] -> {p}")
+        return p
+
+def _fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024.0
+
+def format_stage(d):
+    lines = [f"[METRICS] {d['stage']}  {d['wall_seconds']:.2f}s"]
+    for k, v in sorted(d["timers"].items(), key=lambda kv: -kv[1]["seconds"]):
+        share = v["seconds"] / d["wall_seconds"] * 100 if d["wall_seconds"] else 0
+        lines.append(f"  {k:24s} {v['seconds']:9.3f}s  {share:5.1f}%  x{v['calls']}")
+    for k, v in sorted(d["counters"].items()):
+        lines.append(f"  {k:24s} {_fmt_bytes(v) if k.startswith('bytes_') else v:>10}")
+    return "\n".join(lines)
+
+# ===== 进程内当前阶段 =====
+_CURRENT = None
+
+def start(stage, root=".", emit_at_exit=True):
+    """开始一个阶段的埋点；进程退出时自动落盘。"""
+    global _CURRENT
+    _CURRENT = Metrics(stage, root, run_id=os.environ.get("NB_RUN_ID"))
+    if emit_at_exit:
+        atexit.register(_CURRENT.emit)
+    return _CURRENT
+
+def current():
+    """当前阶段；没人调过 start() 时返回一个不会落盘的空对象，埋点代码无需判断。"""
+    global _CURRENT
+    if _CURRENT is None:
+        _CURRENT = Metrics("adhoc")
+        _CURRENT.emitted = True
+    return _CURRENT
+
+# ===== 汇总 =====
+def load_run(root, run_id):
+    d = os.path.join(os.path.abspath(root), METRICS_DIR, run_id)
+    out = []
+    if os.path.isdir(d):
+        for name in sorted(os.listdir(d)):
+            if name.endswith(".json"):
+                with open(os.path.join(d, name), "r", encoding="utf-8") as f:
+                    out.append(json.load(f))
+    return out
+
+def summary_table(stages):
+    total = sum(s["wall_seconds"] for s in stages) or 1.0
+    head = f"{'stage':24s} {'seconds':>9s} {'share':>6s} {'read':>7s} {'written':>8s} {'skipped':>8s} {'in':>9s} {'out':>9s}"
+    lines = [head, "-" * len(head)]
+    for s in sorted(stages, key=lambda s: -s["wall_seconds"]):
+        c = s["counters"]
+        lines.append(f"{s['stage']:24s} {s['wall_seconds']:9.2f} {s['wall_seconds'] / total * 100:5.1f}% "
+                     f"{c.get('files_read', 0):7d} {c.get('files_written', 0):8d} {c.get('files_skipped', 0):8d} "
+                     f"{_fmt_bytes(c.get('bytes_in', 0)):>9s} {_fmt_bytes(c.get('bytes_out', 0)):>9s}")
+    lines.append(f"{'TOTAL':24s} {sum(s['wall_seconds'] for s in stages):9.2f}")
+    return "\n".join(lines)
+
+def main():
+    ap = argparse.ArgumentParser(description="汇总一次运行里各阶段的耗时与计数")
+    ap.add_argument("--root", default=".", help="站点根目录")
+    ap.add_argument("--run", help="运行 ID（logs/metrics/ 下的目录名），默认最近一次")
+    args = ap.parse_args()
+    base = os.path.join(os.path.abspath(args.root), METRICS_DIR)
+    runs = sorted(os.listdir(base), key=lambda r: os.path.getmtime(os.path.join(base, r))) if os.path.isdir(base) else []
+    run = args.run or (runs[-1] if runs else None)
+    stages = load_run(args.root, run) if run else []
+    if not stages:
+        print(f"[FATAL] 没有找到运行记录：{run}"); sys.exit(2)
+    print(f"[METRICS] run={run} ; {len(stages)} 个阶段")
+    print(summary_table(stages))
+
+if __name__ == "__main__":
+    main()
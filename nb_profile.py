@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+nb_profile.py —— 各阶段入口共用的 --profile 开关
+- --profile / --profile cprofile ：cProfile 全量剖析，输出 <stage>.prof（可用 snakeviz 打开）
+  + <stage>.txt（pstats 按累计耗时排序）+ <stage>.collapsed（采样线程得到的折叠栈，可直接喂 flamegraph.pl / speedscope）
+- --profile sample ：只开采样线程（默认每 10ms 抓一次主线程调用栈），开销很低，线上构建也能开
+  输出 <stage>.collapsed + <stage>.txt（按采样数统计的热点函数）
+- 不加参数时也可用环境变量 NB_PROFILE=cprofile|sample 打开（farm_build --profile 就是这么传给各阶段的）
+- 输出目录：<root>/logs/profile/<run_id>/
+
+用法：
+if __name__ == "__main__":
+    nb_profile.run_main("seo_fixer_v4", main)     # 先摘掉 --profile* 参数，再跑脚本原来的 main()
+python seo_fixer_v4.py --profile               # cProfile
+python v4_patch_single_site.py --profile sample --sample-ms 5
+"""
+import os, sys, time, pstats, argparse, cProfile, threading
+from contextlib import contextmanager
+from collections import Counter
+from backup_store import new_run_id
+
+PROFILE_DIR = os.path.join("logs", "profile")
+MODES = ("cprofile", "sample")
+
+def add_arguments(ap):
+    ap.add_argument("--profile", nargs="?", const="cprofile", choices=MODES,
+                    default=os.environ.get("NB_PROFILE") or None,
+                    help="剖析本阶段：cprofile（默认，全量）或 sample（低开销采样）")
+    ap.add_argument("--profile-dir", default=None, help="剖析输出目录（默认 <root>/logs/profile/<run_id>/）")
+    ap.add_argument("--sample-ms", type=float, default=float(os.environ.get("NB_PROFILE_SAMPLE_MS") or 10),
+                    help="采样间隔毫秒（默认 10）")
+    return ap
+
+class StackSampler(threading.Thread):
+    """后台线程定时抓目标线程的调用栈，累计成折叠栈计数。"""
+    def __init__(self, interval=0.01, thread_id=None):
+        super().__init__(name="nb-sampler", daemon=True)
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.stacks = Counter()
+        self._halt = threading.Event()
+
+    @staticmethod
+    def _frame_key(code):
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            f = sys._current_frames().get(self.thread_id)
+            parts = []
+            while f is not None:
+                parts.append(self._frame_key(f.f_code))
+                f = f.f_back
+            if parts:
+                self.stacks[";".join(reversed(parts))] += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def hot_functions(self, top=40):
+        """按“栈顶”（自身耗时）和“出现在栈里”（含子调用）两种口径统计。"""
+        own, incl = Counter(), Counter()
+        for stack, n in self.stacks.items():
+            parts = stack.split(";")
+            own[parts[-1]] += n
+            for p in set(parts):
+                incl[p] += n
+        total = sum(self.stacks.values()) or 1
+        lines = [f"samples={total} interval={self.interval * 1000:.1f}ms",
+                 "", f"{'self%':>7s} {'total%':>7s}  function"]
+        for fn, n in own.most_common(top):
+            lines.append(f"{n / total * 100:6.1f}% {incl[fn] / total * 100:6.1f}%  {fn}")
+        return "\n".join(lines) + "\n"
+
+def _out_dir(root, out_dir):
+    d = out_dir or os.path.join(os.path.abspath(root), PROFILE_DIR, new_run_id())
+    os.makedirs(d, exist_ok=True)
+    return d
+
+@contextmanager
+def profiled(stage, args=None, root=".", mode=None, out_dir=None, interval=None):
+    """按 args.profile（或 mode）剖析 with 块；没开就什么都不做。"""
+    mode = mode or getattr(args, "profile", None)
+    if not mode:
+        yield None
+        return
+    out_dir = _out_dir(root, out_dir or getattr(args, "profile_dir", None))
+    interval = interval or getattr(args, "sample_ms", 10) / 1000.0
+    base = os.path.join(out_dir, stage)
+    sampler = StackSampler(interval)
+    prof = cProfile.Profile() if mode == "cprofile" else None
+    t0 = time.perf_counter()
+    # 采样线程要等主线程让出 GIL 才能抓栈；调小切换间隔，避免样本都落在 I/O 调用上
+    old_si = sys.getswitchinterval()
+    sys.setswitchinterval(min(old_si, interval / 4))
+    sampler.start()
+    if prof: prof.enable()
+    try:
+        yield sampler
+    finally:
+        if prof: prof.disable()
+        sampler.stop()
+        sys.setswitchinterval(old_si)
+        wall = time.perf_counter() - t0
+        sampler.write_collapsed(base + ".collapsed")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"stage={stage} mode={mode} wall={wall:.3f}s\n\n")
+            if prof:
+                prof.dump_stats(base + ".prof")
+                st = pstats.Stats(prof, stream=f)
+                st.sort_stats("cumulative").print_stats(60)
+                st.sort_stats("tottime").print_stats(30)
+            else:
+                f.write(sampler.hot_functions())
+        print(f"[PROFILE] {stage} ({mode}, {wall:.2f}s) -> {base}.*")
+
+def run_main(stage, fn, root="."):
+    """
+    阶段入口统一包装：从 sys.argv 里摘掉 --profile / --profile-dir / --sample-ms，
+    其余参数原样留给脚本自己的 argparse，然后在剖析下执行 fn()。
+    """
+    ap = add_arguments(argparse.ArgumentParser(add_help=False))
+    args, rest = ap.parse_known_args(sys.argv[1:])
+    sys.argv[1:] = rest
+    with profiled(stage, args, root):
+        return fn()
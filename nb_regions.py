@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+nb_regions.py —— 页面“托管区块”：各注入脚本往页面里写的东西都包在具名的 START/END 标记里
+- 标记统一格式：<!-- NB:名字 START [fp=内容指纹] --> ... <!-- NB:名字 END -->（广告块 NB:AD-TOP 等本来就是这个格式）；
+  老的 <!--AUTO_DESC_START-->/<!--AUTO_DESC_END--> 作为 AUTO-DESC 登记在 CUSTOM 里，已有页面不用改
+- 一个合并正则扫一遍页面，建好 {名字: [区块位置]} 索引；改动（替换 / 插入 / 删除）先记下来，
+  最后按偏移一次拼出新页面，不再每改一处就重新搜索、重建整页字符串
+- set() 幂等：有同名区块就原地换成新内容（内容没变就不动），重复的同名区块顺手删掉；没有才插入
+- 老版本没带标记的注入块（seo_fixer_v4 每轮追加的“More related:”、随机长文本段，patch_nb_variants 的 .nb-box）
+  在 LEGACY 里登记了样子：第一个（或第一串相邻的）就地包上标记收编，其余当重复删掉
+- 清理模式：整站扫一遍，重复的同名区块只留第一个、老的无标记块收编/去重，不生成任何新内容
+- 区块内容要写成 bs4 序列化后的样子（属性按字母序、<img .../>、文本用 esc_text/esc_attr 转义、标签之间不缩进），
+  后面的阶段（seo_fixer_v4、v4_patch）解析再输出时原样不变，set() 下一轮才比得上；
+  插入时 sep 和两侧已有的空白在标签之间连成一段的，按 bs4 的规矩并成一个换行（两块插在同一位置也不留空行）
+
+用法：
+import nb_regions
+rg = nb_regions.Regions(html)
+rg.set("SEO-RELATED", "<div>...</div>", at=rg.body_close, sep="\\n")   # 有就替换，没有就插到 </body> 前
+rg.remove("AD-POPUP")
+html = rg.render()
+html = nb_regions.cleanup(html)            # 只去重 + 收编老块
+
+python nb_regions.py [--root .] [--names SEO-RELATED,VARIANTS] [--dry-run]   # 整站清理已经叠加的重复块
+"""
+import re, hashlib, argparse
+from typing import NamedTuple
+from site_scan import iter_pages
+from page_writer import PageWriter
+import nb_metrics, nb_profile
+
+# 标记不是 NB: 格式的老区块：名字 -> (START, END)
+CUSTOM = {
+    "AUTO-DESC": ("<!--AUTO_DESC_START-->", "<!--AUTO_DESC_END-->"),
+}
+
+# 老版本不带标记写进页面的块：名字 -> (正则, 相邻的几块算不算一组)
+LEGACY = {
+    # seo_fixer_v4.add_internal_links（bs4 序列化后的样子）
+    "SEO-RELATED": (re.compile(r'<div>More related: (?:<a href="[^"]*">[^<]*</a> \| )*</div>'), False),
+    # seo_fixer_v4.generate_random_text：两句模板
+    "SEO-TEXT": (re.compile(
+        r"<p>(?:(?:This [^<]*? gallery explores [^<]*? in depth, offering fresh perspectives\."
+        r"|Our [^<]*? collection integrates [^<]*?, frequently updated with new visuals\."
+        r"|High-quality [^<]*? images connected with [^<]*? for diverse inspiration\."
+        r"|Explore this [^<]*? showcase, combining [^<]*? to enrich user experience\.) ?){2}</p>"), False),
+    # seo_fixer_v4.add_category_text
+    "SEO-CAT-TEXT": (re.compile(
+        r"<p>This is page\d+, part of our curated gallery collection\. Each page highlights unique themes, "
+        r"aesthetics, and visual styles, helping visitors explore different categories with richer context "
+        r"and inspiration\.</p>"), False),
+    # patch_nb_variants：每页 1..N 个模块挨着插
+    "VARIANTS": (re.compile(r'<section class="nb-box nb-[a-z]+">[\s\S]*?</section>'), True),
+}
+
+BODY_CLOSE_RE = re.compile(r"</body\s*>", re.I)
+
+def esc_text(s):
+    # 与 bs4 序列化文本时的转义一致，下一轮解析再输出不会变
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def esc_attr(s):
+    return esc_text(s).replace('"', "&quot;")
+
+_WS = " \t\n\r\f"
+
+def _squash_ws(html, pos):
+    """
+    pos 两侧的空白在两个标签之间自成一段（bs4 眼里的纯空白文本节点）时，照 bs4 并成一个换行 / 空格；
+    返回 (新页面, 段首)。
+    """
+    s, e = pos, pos
+    while s > 0 and html[s - 1] in _WS: s -= 1
+    while e < len(html) and html[e] in _WS: e += 1
+    if s == e or (s > 0 and html[s - 1] != ">") or (e < len(html) and html[e] != "<"):
+        return html, s
+    ws = "\n" if "\n" in html[s:e] else " "
+    return (html if html[s:e] == ws else html[:s] + ws + html[e:]), s
+
+def fingerprint(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:8]
+
+def markers(name: str, fp: str = None):
+    """(START, END)；fp 只有 NB: 格式的标记能带。"""
+    if name in CUSTOM:
+        return CUSTOM[name]
+    return (f"<!-- NB:{name} START{f' fp={fp}' if fp else ''} -->", f"<!-- NB:{name} END -->")
+
+def wrap(name: str, content: str, fp: bool = False) -> str:
+    start, end = markers(name, fingerprint(content) if fp else None)
+    return f"{start}\n{content}\n{end}"
+
+def _build_scan_re():
+    alts = [r" NB:(?P<nb>[A-Z0-9][A-Z0-9-]*) (?P<kind>START|END)(?: fp=(?P<fp>[0-9a-f]+))? "]
+    for i, (start, end) in enumerate(CUSTOM.values()):
+        assert start.startswith("<!--") and start.endswith("-->") and end.startswith("<!--") and end.endswith("-->")
+        alts.append(f"(?P<c{i}s>{re.escape(start[4:-3])})|(?P<c{i}e>{re.escape(end[4:-3])})")
+    return re.compile("<!--(?:" + "|".join(alts) + ")-->")
+
+SCAN_RE = _build_scan_re()
+_CUSTOM_GROUPS = {}
+for _i, _name in enumerate(CUSTOM):
+    _CUSTOM_GROUPS[f"c{_i}s"] = (_name, "START")
+    _CUSTOM_GROUPS[f"c{_i}e"] = (_name, "END")
+
+class Region(NamedTuple):
+    name: str
+    start: int      # 含 START 标记
+    end: int        # 含 END 标记
+    fp: str         # START 标记上的指纹，没有就是 None
+
+def index(html: str):
+    """扫一遍：{名字: [Region]}，按出现顺序。START 配其后第一个同名 END；没有 END 的残块不算。"""
+    found, open_ = {}, {}
+    for m in SCAN_RE.finditer(html):
+        if m.group("nb"):
+            name, kind, fp = m.group("nb"), m.group("kind"), m.group("fp")
+        else:
+            (name, kind), fp = _CUSTOM_GROUPS[m.lastgroup], None
+        if kind == "START":
+            open_.setdefault(name, (m.start(), fp))
+        elif name in open_:
+            s, fp = open_.pop(name)
+            found.setdefault(name, []).append(Region(name, s, m.end(), fp))
+    return found
+
+class Regions:
+    """一页的托管区块。改动先记下来，render() 时按偏移一次拼好；互相重叠的改动只做先到的那个。"""
+    def __init__(self, html: str):
+        self.html = html
+        self.found = index(html)
+        self._edits = []   # (start, end, 序号, 新文本, 删除时是否带走两侧换行)
+
+    @property
+    def changed(self):
+        return bool(self._edits)
+
+    @property
+    def body_close(self):
+        """</body> 的位置；没有就是页尾。"""
+        m = BODY_CLOSE_RE.search(self.html)
+        return m.start() if m else len(self.html)
+
+    def has(self, name):
+        return name in self.found
+
+    def get(self, name):
+        regs = self.found.get(name)
+        return regs[0] if regs else None
+
+    def content(self, region):
+        """区块标记中间的内容（去掉 wrap() 加的换行）。"""
+        s = self.html.index("-->", region.start) + 3
+        e = self.html.rindex("<!--", s, region.end)
+        body = self.html[s:e]
+        if body.startswith("\n"): body = body[1:]
+        if body.endswith("\n"): body = body[:-1]
+        return body
+
+    def _edit(self, start, end, text, trim=False):
+        self._edits.append((start, end, len(self._edits), text, trim))
+
+    def set(self, name, content, at=None, fp=False, sep=""):
+        """
+        有同名区块：第一个换成新内容（内容没变 / fp=True 时指纹一致就不动），其余删掉；
+        没有：给了 at 就在 at 插入 sep + 区块 + sep，没给就什么都不做。返回这一步有没有改动。
+        """
+        regs = self.found.get(name)
+        if not regs:
+            if at is None:
+                return False
+            self.insert(name, content, at, fp, sep)
+            return True
+        new = wrap(name, content, fp)
+        n = len(self._edits)
+        first = regs[0]
+        if fp and first.fp == fingerprint(content):
+            pass
+        elif self.html[first.start:first.end] != new:
+            self._edit(first.start, first.end, new)
+        for r in regs[1:]:
+            self._edit(r.start, r.end, "", trim=True)
+        return len(self._edits) > n
+
+    def insert(self, name, content, at, fp=False, sep=""):
+        """不管有没有同名区块，在 at 插一个（配合 remove() 把区块挪位置）。"""
+        self._edit(at, at, sep + wrap(name, content, fp) + sep)
+
+    def remove(self, name):
+        for r in self.found.get(name, ()):
+            self._edit(r.start, r.end, "", trim=True)
+        return name in self.found
+
+    def collapse(self, names=None):
+        """同名区块只留第一个。返回删掉的个数。"""
+        n = 0
+        for name, regs in self.found.items():
+            if names is not None and name not in names:
+                continue
+            for r in regs[1:]:
+                self._edit(r.start, r.end, "", trim=True)
+                n += 1
+        return n
+
+    def adopt(self, name, legacy=None):
+        """
+        收编老的无标记块（不在任何区块里的才算）：页面上还没有这个区块时，第一个（或第一串相邻的）
+        就地包上标记，其余删掉；已经有区块了就全当重复删掉。返回 (收编, 删掉) 个数。
+        """
+        rex, group = legacy or LEGACY[name]
+        spans = [r for regs in self.found.values() for r in regs]
+        runs = []
+        for m in rex.finditer(self.html):
+            s, e = m.span()
+            if any(r.start <= s < r.end for r in spans):
+                continue
+            if group and runs and not self.html[runs[-1][1]:s].strip():
+                runs[-1][1] = e
+            else:
+                runs.append([s, e])
+        if not runs:
+            return 0, 0
+        adopted = 0
+        if name not in self.found:
+            s, e = runs.pop(0)
+            self._edit(s, e, wrap(name, self.html[s:e]))
+            adopted = 1
+        for s, e in runs:
+            self._edit(s, e, "", trim=True)
+        return adopted, len(runs)
+
+    def render(self):
+        if not self._edits:
+            return self.html
+        html = self.html
+        # 同一偏移上插入排在删除/替换前面，同类按记下的先后
+        edits = sorted(self._edits, key=lambda t: (t[0], t[0] != t[1], t[2]))
+        out, last, size, seams = [], 0, 0, []
+        for i, (s, e, _, text, trim) in enumerate(edits):
+            if s < last:
+                continue
+            if trim:
+                nxt = edits[i + 1][0] if i + 1 < len(edits) else len(html) + 1
+                if s > last and html[s - 1] == "\n": s -= 1
+                if html.startswith("\n", e) and e < nxt: e += 1
+            out.append(html[last:s]); out.append(text)
+            size += s - last
+            if s == e and text:     # 插入：两头都可能和原有空白连成一段
+                seams += [size, size + len(text)]
+            size += len(text)
+            last = e
+        out.append(html[last:])
+        html = "".join(out)
+        floor = len(html) + 1
+        for pos in sorted(set(seams), reverse=True):
+            if pos < floor:          # 同一段空白只并一次
+                html, floor = _squash_ws(html, pos)
+        return html
+
+def cleanup(html: str, names=None):
+    """去重 + 收编老块，不生成新内容；没有要改的就原样返回。names 为空表示所有区块。"""
+    rg = Regions(html)
+    m = nb_metrics.current()
+    n = rg.collapse(names)
+    if n: m.count("regions_collapsed", n)
+    for name in LEGACY:
+        if names is None or name in names:
+            adopted, dropped = rg.adopt(name)
+            if adopted: m.count("regions_adopted", adopted)
+            if dropped: m.count("regions_collapsed", dropped)
+    return rg.render()
+
+def main():
+    ap = argparse.ArgumentParser(description="整站清理托管区块：重复的同名区块只留一个，老的无标记注入块收编/去重")
+    ap.add_argument("--root", default=".", help="站点根目录（默认当前目录）")
+    ap.add_argument("--names", default="", help="只处理这些区块（逗号分隔，如 SEO-RELATED,VARIANTS）；默认全部")
+    ap.add_argument("--dry-run", action="store_true", help="只统计，不写回")
+    args = ap.parse_args()
+    names = {n.strip() for n in args.names.split(",") if n.strip()} or None
+
+    metrics = nb_metrics.start("nb_regions", args.root)
+    changed = 0
+    with PageWriter(args.root, stage="nb_regions", dry_run=args.dry_run) as pw:
+        for e in iter_pages(args.root):
+            with open(e.path, "r", encoding="utf-8", errors="ignore") as f:
+                html = f.read()
+            metrics.read(html)
+            new = cleanup(html, names)
+            if new != html:
+                pw.write(e.path, new)
+                changed += 1
+            else:
+                metrics.skipped()
+    print(f"[OK] pages cleaned: {changed}{' (dry-run)' if args.dry_run else ''}")
+
+if __name__ == "__main__":
+    nb_profile.run_main("nb_regions", main)
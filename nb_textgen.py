@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+nb_textgen.py —— 页面文案生成（v4_patch_single_site 的 title / description / 正文段，kw_persist 的自动描述）
+- 模板预编译成模块级元组：先用 RNG 选下标，只格式化选中的那一条（旧写法每次把所有候选 f-string 全拼一遍）
+- title / desc / para 各用 t:: / d:: / p:: 前缀的随机流
+  （合成一条流会让所有已生成页面的文案全部变掉，增量构建就全废了）
+- 长文本按片段累加词数（片段词数预先算好），不再每加一段就把整段 join + split 一遍
+- 不做结果缓存：种子是页面路径 / url，一轮里每页只算一次，缓存永远命中不了
+- 输出与原来各脚本里的实现逐字节一致（随机流的种子、抽取顺序都没变），已生成的页面不会因此改写
+
+用法：
+import nb_textgen as tg
+tg.title(kw, brand, seed); tg.desc(kw, seed); tg.para(kw, seed)   # seed 一般是页面路径
+tg.long_text(url, kw, "image", 100, 180)
+"""
+import hashlib, random
+
+# ===== 槽位词池 =====
+STYLES = ["modern","vintage","minimal","urban","cinematic","natural","studio","retro"]
+MOODS  = ["elegant","playful","moody","romantic","calm","bold","warm","cool"]
+LIGHTS = ["soft lighting","golden-hour glow","window light","neon lights","backlight","overcast"]
+COMPS  = ["close-up","rule-of-thirds","symmetry","leading lines","wide shot"]
+WEARS  = ["casual","streetwear","office","evening dress","sporty","retro"]
+BACKS  = ["urban backdrop","nature scene","indoor studio","minimal set","bedroom scene"]
+
+# ===== 预编译模板 =====
+TITLES = (
+    "{kw} {style} portraits | {brand}",
+    "{kw} gallery — {mood} tone | {brand}",
+    "{kw} photos, {light} | {brand}",
+    "High-quality {kw} images — {comp} | {brand}",
+    "{kw} {mood} lookbook | {brand}",
+)
+DESC = ("Explore {kw} in {style} style with {mood} vibe, "
+        "{light}, and {comp} framing. Curated images on a fast, clean page.")
+DESC_PADS = (
+    None,   # 第一条是 "{wear} looks and {back}"，依赖本页槽位，运行时再拼
+    "Simple navigation helps discovery",
+    "Mobile-friendly layout for smooth viewing",
+    "Short notes keep context clear",
+    "Clean typography keeps focus on the visuals",
+)
+PARA = ("This set explores {kw} through {style} aesthetics and {mood} tone under {light}. "
+        "Compositions use {comp} with {back}, keeping focus clear and tidy. "
+        "Details like {wear} styling and balanced colors make browsing easy.")
+PARA_TAIL = " Pages load quickly and related links help deeper viewing."
+
+def _counted(*texts):
+    return tuple((t, len(t.split())) for t in texts)
+
+INTROS = (
+    "This page explores {kw} with a practical focus on visual detail and browsing experience.",
+    "Here we highlight {kw}, aiming for clean structure, quick scanning, and useful context.",
+    "Designed for readers looking into {kw}, this page emphasizes clarity and consistency.",
+)
+BODIES_CAT = _counted(
+    "You will find a concise introduction to the theme, suggestions for discovery, and guidance to navigate related sections. The layout balances thumbnails and text so each visit feels lightweight but informative. Frequent updates keep the collection fresh.",
+    "We group similar items to reduce repetition while preserving variety. This structure helps search engines understand relationships and helps visitors jump between related pages with minimal friction.",
+    "Short descriptive blurbs add context to images, improving accessibility and search relevance without overwhelming the visuals. Internal links further tie categories together.",
+)
+BODIES_IMG = _counted(
+    "The image aims to deliver a straightforward visual impression while keeping the file lightweight. A brief explanation clarifies the subject and lighting so visitors can quickly decide where to go next.",
+    "Alt text and headings are optimized to make the content accessible and to provide consistent cues across the site. Subtle differences in wording help avoid duplication across similar pages.",
+    "Internal navigation leads to related items with comparable tone or composition. This reduces bounce and supports exploration within the same theme.",
+)
+CLOSINGS = _counted(
+    "If you are comparing alternatives, keep an eye on subtle differences in framing, contrast, and color balance.",
+    "For more context, browse related entries linked nearby; each page offers a slightly different angle to limit overlap.",
+    "Bookmark the page if it’s useful; updates aim to improve clarity, speed, and overall structure over time.",
+)
+
+# ===== 小工具 =====
+def md5_rng(seed: str):
+    """md5(seed) 取前 8 位十六进制做种子（v4 的写法）。"""
+    return random.Random(int(hashlib.md5(seed.encode("utf-8")).hexdigest()[:8], 16))
+
+def facets(r):
+    return dict(style=r.choice(STYLES), mood=r.choice(MOODS), light=r.choice(LIGHTS),
+                comp=r.choice(COMPS), wear=r.choice(WEARS), back=r.choice(BACKS))
+
+def clamp(s: str, mx: int):
+    if len(s) <= mx: return s
+    cut = s[:mx].rsplit(" ", 1)[0]
+    return cut if len(cut) >= int(mx*0.8) else s[:mx]
+
+def pad_to(s: str, mn: int, r, pads: list):
+    t = s
+    while len(t) < mn and pads:
+        t += " — " + r.choice(pads); pads.pop(0)
+    return t
+
+# ===== title / description / 正文段 =====
+def title(keyword: str, brand: str, seed: str, lo: int = 45, hi: int = 60):
+    r = md5_rng("t::"+seed); f = facets(r)
+    t = r.choice(TITLES).format(kw=keyword, brand=brand, **f)
+    if len(t) < lo: t += f" — {f['mood']} {f['style']}"
+    return clamp(t, hi)
+
+def desc(keyword: str, seed: str, lo: int = 130, hi: int = 155):
+    r = md5_rng("d::"+seed); f = facets(r)
+    base = DESC.format(kw=keyword, **f)
+    pads = [f"{f['wear']} looks and {f['back']}"] + list(DESC_PADS[1:])
+    return clamp(pad_to(base, lo, r, pads), hi)
+
+def para(keyword: str, seed: str, min_len: int = 200, hi: int = 300):
+    r = md5_rng("p::"+seed); f = facets(r)
+    s = PARA.format(kw=keyword, **f)
+    if len(s) < min_len:
+        s += PARA_TAIL
+    return clamp(s, hi)
+
+# ===== 自动描述长文本（kw_persist_and_fill） =====
+def long_text(seed_str: str, keyword: str, ptype: str, min_words: int = 100, max_words: int = 180):
+    """
+    稳定随机（基于 url 的 md5 做种子）生成 min_words~max_words 词的段落，包含 keyword。
+    同一 url 每次生成的文本一致；不同 url 则不同。
+    """
+    seed = int(hashlib.md5(seed_str.encode('utf-8')).hexdigest(), 16) % (2**32)
+    rnd = random.Random(seed)
+
+    target = rnd.randint(min_words, max_words)
+    intro = rnd.choice(INTROS).format(kw=keyword)
+    parts, words = [intro], len(intro.split())
+    pool = BODIES_CAT if ptype == 'category' else BODIES_IMG
+    while words < target:
+        s, n = rnd.choice(pool)
+        parts.append(s); words += n
+        if rnd.random() < 0.5:
+            s, n = rnd.choice(CLOSINGS)
+            parts.append(s); words += n
+    text = " ".join(parts)
+
+    # 保证 keyword 至少出现一次
+    if keyword.lower() not in text.lower():
+        text = f"{keyword}. " + text
+    return text
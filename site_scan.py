@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+site_scan.py —— 全站单次遍历 + 统一跳过规则 + 文件分类（各生成器/补丁共用）
+- 基于 os.scandir 走一遍目录树，不再每个脚本各自 rglob / os.walk
+- 一套跳过规则（SkipPolicy）：隐藏目录、generator/keywords/logs 等工具目录、*template*.html、临时文件
+  可在 config.json 里追加：{"scan": {"skip_dirs": ["xxx"], "skip_files": ["*.draft.html"]}}
+- 文件分类：
+    category  分类页：子目录里的 pageN.html / index.html
+    detail    详情页：20250817_090303_01.html
+    landing   其它 HTML（根目录页面、landing_b/、tags/ 等）
+    asset     图片 / css / js / 字体
+    backup    .bak / .broken / .bak_20250905_140906 之类的备份
+    other     其它（py/json/txt...）
+- 同一进程内按 (root, policy) 缓存扫描结果；有脚本增删了文件就调 invalidate(root)
+- 大站流式处理：iter_pages() 惰性产出页面，DirPages 只缓存最近几个目录的列表，sample_pages() 蓄水池抽样
+
+用法：
+from site_scan import scan
+inv = scan(".")
+for e in inv.pages(): ...          # 全部 HTML 页面（category + detail + landing）
+inv.category_dirs()                 # 顶层分类目录名
+"""
+import os, re, json, fnmatch
+
+DEFAULT_SKIP_DIRS = (
+    "generator", "keywords", "keywords_enriched", "selected_keywords", "seeds", "words",
+    "logs", "__pycache__", "node_modules", "venv", "assets", "static", "vendor", "原脚本。",
+)
+DEFAULT_SKIP_FILES = ("*template*.html", "*template*.htm", "*.tmp", "*.nbtmp")
+
+HTML_EXTS  = (".html", ".htm")
+ASSET_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".svg", ".ico",
+              ".css", ".js", ".woff", ".woff2", ".ttf")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+DETAIL_RE   = re.compile(r"^\d{8}_\d{6}_\d+\.html?$", re.I)
+CATEGORY_RE = re.compile(r"^(page\d*|index)\.html?$", re.I)
+BACKUP_RE   = re.compile(r"\.(bak|broken)(_\d{8}_\d{6})?$", re.I)
+
+class SkipPolicy:
+    """统一跳过规则。skip_dirs 按目录名匹配（任意层级），skip_files 为 fnmatch 通配（小写比较）。"""
+    def __init__(self, skip_dirs=DEFAULT_SKIP_DIRS, skip_files=DEFAULT_SKIP_FILES, skip_hidden=True):
+        self.skip_dirs = frozenset(d.lower() for d in skip_dirs)
+        self.skip_files = tuple(p.lower() for p in skip_files)
+        self.skip_hidden = skip_hidden
+
+    @classmethod
+    def for_site(cls, root):
+        """默认规则 + config.json 里 "scan" 段的追加项。"""
+        dirs, files = list(DEFAULT_SKIP_DIRS), list(DEFAULT_SKIP_FILES)
+        cfg = os.path.join(root, "config.json")
+        if os.path.exists(cfg):
+            try:
+                with open(cfg, "r", encoding="utf-8") as f:
+                    extra = json.load(f).get("scan") or {}
+                dirs += extra.get("skip_dirs", [])
+                files += extra.get("skip_files", [])
+            except Exception:
+                pass
+        return cls(dirs, files)
+
+    def key(self):
+        return (self.skip_dirs, self.skip_files, self.skip_hidden)
+
+    def skip_dir(self, name):
+        n = name.lower()
+        return (self.skip_hidden and n.startswith(".")) or n in self.skip_dirs
+
+    def skip_file(self, name):
+        n = name.lower()
+        return any(fnmatch.fnmatchcase(n, p) for p in self.skip_files)
+
+def classify(rel):
+    """按相对路径（/ 分隔）给文件分类。"""
+    name = rel.rsplit("/", 1)[-1]
+    low = name.lower()
+    if BACKUP_RE.search(low):
+        return "backup"
+    ext = os.path.splitext(low)[1]
+    if ext in HTML_EXTS:
+        if DETAIL_RE.match(name): return "detail"
+        if "/" in rel and CATEGORY_RE.match(name): return "category"
+        return "landing"
+    if ext in ASSET_EXTS:
+        return "asset"
+    return "other"
+
+class Entry:
+    __slots__ = ("rel", "path", "kind")
+    def __init__(self, rel, path, kind):
+        self.rel, self.path, self.kind = rel, path, kind
+
+    @property
+    def name(self):
+        return self.rel.rsplit("/", 1)[-1]
+
+    @property
+    def top(self):
+        """顶层目录名；根目录文件返回 ""。"""
+        return self.rel.split("/", 1)[0] if "/" in self.rel else ""
+
+    def __repr__(self):
+        return f"Entry({self.rel!r}, {self.kind!r})"
+
+PAGE_KINDS = ("category", "detail", "landing")
+
+class Inventory:
+    def __init__(self, root, entries):
+        self.root = root
+        self.entries = entries      # 遍历顺序：目录内按名字排序，顺序稳定
+
+    def by_kind(self, *kinds):
+        return [e for e in self.entries if e.kind in kinds]
+
+    def pages(self):
+        return self.by_kind(*PAGE_KINDS)
+
+    def page_paths(self):
+        return [e.path for e in self.entries if e.kind in PAGE_KINDS]
+
+    def category_dirs(self):
+        """顶层分类目录：含分类页 / 详情页 / 详情图片的子目录。"""
+        dirs = set()
+        for e in self.entries:
+            if not e.top: continue
+            if e.kind in ("category", "detail"):
+                dirs.add(e.top)
+            elif e.kind == "asset" and e.name.lower().endswith(IMAGE_EXTS) \
+                    and re.match(r"\d{8}_\d{6}_", e.name):
+                dirs.add(e.top)
+        return sorted(dirs)
+
+    def in_dir(self, rel_dir, *kinds):
+        """某目录下（不含子目录）的条目。"""
+        prefix = rel_dir.strip("/") + "/" if rel_dir.strip("/.") else ""
+        out = []
+        for e in self.entries:
+            if not e.rel.startswith(prefix) or "/" in e.rel[len(prefix):]: continue
+            if kinds and e.kind not in kinds: continue
+            out.append(e)
+        return out
+
+def iter_entries(root, policy=None):
+    """惰性遍历：os.scandir 深度优先，目录内按名字排序，逐个产出 Entry。"""
+    policy = policy or SkipPolicy.for_site(root)
+    stack = [("", root)]
+    while stack:
+        rel_dir, abs_dir = stack.pop()
+        try:
+            with os.scandir(abs_dir) as it:
+                items = sorted(it, key=lambda d: d.name)
+        except OSError:
+            continue
+        subdirs = []
+        for d in items:
+            rel = f"{rel_dir}/{d.name}" if rel_dir else d.name
+            try:
+                is_dir = d.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if not policy.skip_dir(d.name):
+                    subdirs.append((rel, d.path))
+            elif not policy.skip_file(d.name):
+                yield Entry(rel, d.path, classify(rel))
+        stack.extend(reversed(subdirs))
+
+def iter_pages(root, policy=None):
+    """惰性产出页面（category / detail / landing），不建全量清单；大站流式处理用这个。"""
+    for e in iter_entries(root, policy):
+        if e.kind in PAGE_KINDS:
+            yield e
+
+class DirPages:
+    """
+    按目录列页面的小缓存。iter_entries 是逐目录产出的，流式处理时同一目录的页面挨在一起，
+    只需留最近几个目录的列表，内存与全站页数无关。
+    """
+    def __init__(self, root, policy=None, maxsize=2):
+        self.root = os.path.abspath(root)
+        self.policy = policy or SkipPolicy.for_site(self.root)
+        self.maxsize = maxsize
+        self._lru = {}
+
+    def get(self, rel_dir):
+        rel_dir = rel_dir.strip("/").replace("\\", "/")
+        if rel_dir == ".": rel_dir = ""
+        hit = self._lru.pop(rel_dir, None)
+        if hit is None:
+            abs_dir = os.path.join(self.root, rel_dir) if rel_dir else self.root
+            hit = []
+            try:
+                with os.scandir(abs_dir) as it:
+                    for d in sorted(it, key=lambda d: d.name):
+                        if d.is_file() and not self.policy.skip_file(d.name):
+                            rel = f"{rel_dir}/{d.name}" if rel_dir else d.name
+                            e = Entry(rel, d.path, classify(rel))
+                            if e.kind in PAGE_KINDS: hit.append(e)
+            except OSError:
+                pass
+            if len(self._lru) >= self.maxsize:
+                self._lru.pop(next(iter(self._lru)))
+        self._lru[rel_dir] = hit
+        return hit
+
+def sample_pages(root, k, rnd=None, policy=None):
+    """蓄水池抽样：流式走一遍，均匀抽 k 个页面（内存 O(k)），给“跨目录混入”这类需求用。"""
+    import random
+    rnd = rnd or random.Random()
+    out = []
+    for i, e in enumerate(iter_pages(root, policy)):
+        if i < k:
+            out.append(e)
+        else:
+            j = rnd.randint(0, i)
+            if j < k: out[j] = e
+    return out
+
+_CACHE = {}
+
+def scan(root=".", policy=None):
+    """同一进程内缓存的全量清单。"""
+    root = os.path.abspath(root)
+    policy = policy or SkipPolicy.for_site(root)
+    key = (root, policy.key())
+    inv = _CACHE.get(key)
+    if inv is None:
+        inv = Inventory(root, list(iter_entries(root, policy)))
+        _CACHE[key] = inv
+    return inv
+
+def invalidate(root=None):
+    if root is None:
+        _CACHE.clear(); return
+    root = os.path.abspath(root)
+    for k in [k for k in _CACHE if k[0] == root]:
+        del _CACHE[k]
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+    ap = argparse.ArgumentParser(description="扫描站点并按类别统计文件")
+    ap.add_argument("--root", default=".", help="站点根目录")
+    args = ap.parse_args()
+    inv = scan(args.root)
+    cnt = Counter(e.kind for e in inv.entries)
+    print(f"[scan] root={inv.root} ; total={len(inv.entries)}")
+    for k, v in sorted(cnt.items()):
+        print(f"  {k:9s} {v}")
+    print("[scan] category_dirs ->", inv.category_dirs())
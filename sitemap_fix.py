@@ -1,10 +1,44 @@
 # -*- coding: utf-8 -*-
-import os, json, datetime
+"""
+sitemap_fix.py —— 流式 sitemap 引擎（全站共用）
+- 条目由生成器逐条产出，直接写盘，不在内存里攒列表（大站也是常量内存）
+- 按协议上限自动分片：单片 ≤ 50,000 条 且 未压缩 ≤ 50MB，超出即滚动到下一片
+- 输出 sitemap-1.xml.gz, sitemap-2.xml.gz ... + sitemap_index.xml（robots.txt 指向 index）
+- 上次运行多出来的旧分片、以及旧版单文件 sitemap.xml 会被清掉，避免残留过期地图
+- 默认增量：.sitemap_state.json 记录 URL → 内容哈希 / lastmod，只有内容真变了才改 lastmod、
+  只重写受影响的分片；什么都没变就不写任何文件
+- 状态库同时记下每个分片 / index 写出时的哈希和大小：被别的脚本覆盖、改过、删掉的分片对不上就重写，
+  不会把别人写坏的 sitemap 当成自己的
+
+用法：
+python sitemap_fix.py                 # 默认：增量更新 gzip 分片
+python sitemap_fix.py --full          # 丢弃状态库，全量重算
+python sitemap_fix.py --stream        # 不用状态库，流式全量生成（超大站一次性重建）
+python sitemap_fix.py --no-gzip       # 分片写成 sitemap-N.xml（调试用）
+"""
+import os, re, json, gzip, hashlib, datetime, argparse
+from xml.sax.saxutils import escape
+from site_scan import iter_entries as iter_scan, PAGE_KINDS
+import nb_metrics, nb_profile
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
 
-def load_domain():
-    cfg = os.path.join(ROOT, "config.json")
+# ===== 协议上限（sitemaps.org） =====
+MAX_URLS  = 50000
+MAX_BYTES = 50 * 1024 * 1024
+
+INDEX_NAME = "sitemap_index.xml"
+LEGACY_NAME = "sitemap.xml"
+SHARD_RE = re.compile(r"^sitemap-(\d+)\.xml(\.gz)?$")
+
+XML_HEAD   = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN  = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = '</urlset>\n'
+INDEX_OPEN  = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_CLOSE = '</sitemapindex>\n'
+
+def load_domain(root=ROOT):
+    cfg = os.path.join(root, "config.json")
     with open(cfg, "r", encoding="utf-8") as f:
         d = json.load(f).get("domain", "").strip()
     if d.endswith("/"): d = d[:-1]
@@ -12,57 +46,395 @@ def load_domain():
         raise SystemExit(f"[FATAL] config.json 的 domain 非法: {d}")
     return d
 
-def should_skip(path):
-    p = path.replace("\\","/").lower()
-    # 跳过这几类目录/文件
-    skip_dirs = ("/generator/", "/logs/", "/keywords/", "/.git/")
-    if any(s in p for s in skip_dirs): return True
-    skip_files = ("template",)  # 跳过 *_template.html
-    if any(s in os.path.basename(p) for s in skip_files): return True
-    return False
-
 def iter_html(root):
-    for dp, dn, fn in os.walk(root):
-        dpn = dp.replace("\\","/")
-        if any(x in dpn.lower() for x in ["/generator", "/logs", "/keywords", "/.git"]):
-            continue
-        for name in fn:
-            if name.lower().endswith(".html"):
-                full = os.path.join(dp, name)
-                if not should_skip(full):
-                    yield full
+    # 跳过规则统一走 site_scan（generator/logs/keywords/隐藏目录、*template*.html、备份文件）
+    for e in iter_scan(root):
+        if e.kind in PAGE_KINDS:
+            yield e.path
 
 def fmt_date(ts):
     # 谷歌接受 yyyy-MM-dd（也可用 ISO8601）
     return datetime.datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d")
 
-def build_sitemap(domain):
-    urls = []
-    for f in iter_html(ROOT):
-        rel = os.path.relpath(f, ROOT).replace("\\","/")
-        loc = f"{domain}/{rel}"
-        last = fmt_date(os.path.getmtime(f))
-        urls.append((loc, last))
-    return urls
-
-def write_xml(urls):
-    out = os.path.join(ROOT, "sitemap.xml")
-    lines = []
-    lines.append('<?xml version="1.0" encoding="UTF-8"?>')
-    lines.append('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">')
-    for loc, last in urls:
-        lines.append("  <url>")
-        lines.append(f"    <loc>{loc}</loc>")
-        lines.append(f"    <lastmod>{last}</lastmod>")
-        lines.append("  </url>")
-    lines.append("</urlset>")
-    with open(out, "w", encoding="utf-8", newline="\n") as f:
-        f.write("\n".join(lines))
-    print(f"[OK] 生成 sitemap.xml ：{len(urls)} 条")
+def iter_entries(root, domain):
+    """逐条产出 (loc, lastmod)，不落列表。"""
+    for f in iter_html(root):
+        rel = os.path.relpath(f, root).replace("\\","/")
+        yield f"{domain}/{rel}", fmt_date(os.path.getmtime(f))
 
-if __name__ == "__main__":
-    dom = load_domain()
-    urls = build_sitemap(dom)
-    if not urls:
+def url_entry(loc, lastmod=None):
+    s = f"  <url>\n    <loc>{escape(loc)}</loc>\n"
+    if lastmod:
+        s += f"    <lastmod>{lastmod}</lastmod>\n"
+    return s + "  </url>\n"
+
+def write_index(out_dir, domain, shards):
+    """shards: [(分片文件名, 该片最大 lastmod)]"""
+    path = os.path.join(out_dir, INDEX_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+        f.write(XML_HEAD + INDEX_OPEN)
+        for name, last in shards:
+            f.write(f"  <sitemap>\n    <loc>{escape(domain)}/{name}</loc>\n")
+            if last:
+                f.write(f"    <lastmod>{last}</lastmod>\n")
+            f.write("  </sitemap>\n")
+        f.write(INDEX_CLOSE)
+    os.replace(tmp, path)
+    return path
+
+def prune_stale(out_dir, keep):
+    """删掉不在 keep 里的旧分片（含另一种压缩格式的同名分片）和旧单文件 sitemap.xml。"""
+    for name in os.listdir(out_dir):
+        if (SHARD_RE.match(name) and name not in keep) or name == LEGACY_NAME:
+            try: os.remove(os.path.join(out_dir, name))
+            except OSError: pass
+
+class SitemapWriter:
+    """
+    流式分片写入器：add() 一条写一条；到上限自动换片；close() 写 sitemap_index.xml。
+    分片先写 .tmp，close() 才改名就位；异常退出时丢弃临时文件，旧地图保持不变。
+    """
+    def __init__(self, out_dir, domain, use_gzip=True, max_urls=MAX_URLS, max_bytes=MAX_BYTES):
+        self.out_dir = out_dir
+        self.domain = domain.rstrip("/")
+        self.use_gzip = use_gzip
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+        self.shards = []      # [(文件名, 该片最大 lastmod)]
+        self.total = 0
+        self._fh = None
+        self._count = 0
+        self._bytes = 0
+        self._last = None
+
+    def shard_name(self, n):
+        return f"sitemap-{n}.xml" + (".gz" if self.use_gzip else "")
+
+    def _open_shard(self):
+        name = self.shard_name(len(self.shards) + 1)
+        path = os.path.join(self.out_dir, name + ".tmp")  # 先写临时文件，close() 时统一改名
+        if self.use_gzip:
+            # mtime=0：内容不变时压缩结果逐字节一致，方便 git / 增量部署判断
+            self._fh = gzip.GzipFile(filename="", mode="wb", fileobj=open(path, "wb"), mtime=0)
+        else:
+            self._fh = open(path, "wb")
+        self.shards.append((name, None))
+        self._count = 0
+        self._last = None
+        self._bytes = 0
+        self._write(XML_HEAD + URLSET_OPEN)
+
+    def _close_shard(self):
+        if not self._fh: return
+        self._write(URLSET_CLOSE)
+        raw = self._fh.fileobj if self.use_gzip else None
+        self._fh.close()
+        if raw: raw.close()
+        name, _ = self.shards[-1]
+        self.shards[-1] = (name, self._last)
+        self._fh = None
+
+    def _write(self, s):
+        b = s.encode("utf-8")
+        self._fh.write(b)
+        self._bytes += len(b)
+
+    def add(self, loc, lastmod=None):
+        entry = url_entry(loc, lastmod)
+        size = len(entry.encode("utf-8"))
+        if self._fh and (self._count >= self.max_urls or
+                         self._bytes + size + len(URLSET_CLOSE) > self.max_bytes):
+            self._close_shard()
+        if not self._fh:
+            self._open_shard()
+        self._write(entry)
+        self._count += 1
+        self.total += 1
+        if lastmod and (self._last is None or lastmod > self._last):
+            self._last = lastmod
+
+    def _discard(self):
+        if self._fh:
+            raw = self._fh.fileobj if self.use_gzip else None
+            self._fh.close()
+            if raw: raw.close()
+            self._fh = None
+        for name, _ in self.shards:
+            try: os.remove(os.path.join(self.out_dir, name + ".tmp"))
+            except OSError: pass
+
+    def close(self):
+        """收尾：分片改名就位 → 写 index → 清理旧分片。一条都没有时什么都不动。"""
+        if not self.total:
+            self._discard()
+            return self.shards
+        self._close_shard()
+        for name, _ in self.shards:
+            os.replace(os.path.join(self.out_dir, name + ".tmp"), os.path.join(self.out_dir, name))
+        write_index(self.out_dir, self.domain, self.shards)
+        prune_stale(self.out_dir, {name for name, _ in self.shards})
+        return self.shards
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+        return False
+
+def write_sitemaps(root, domain, entries, use_gzip=True, max_urls=MAX_URLS, max_bytes=MAX_BYTES):
+    """把任意 (loc, lastmod) 迭代器流式写成分片 + index，返回 SitemapWriter。"""
+    with SitemapWriter(root, domain, use_gzip, max_urls, max_bytes) as w:
+        for loc, last in entries:
+            w.add(loc, last)
+    return w
+
+# ===== 增量模式：URL → (内容哈希, lastmod) 状态库 =====
+STATE_FILE = ".sitemap_state.json"
+STATE_VERSION = 1
+
+def _content_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+def _file_sig(path):
+    """[哈希, 大小, mtime_ns]；文件不存在返回 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [_content_hash(path), st.st_size, st.st_mtime_ns]
+
+def _sig_matches(path, rec):
+    """文件和状态库里记的一致：stat 相同直接信，否则比哈希。"""
+    if not rec:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != rec[1]:
+        return False
+    if st.st_mtime_ns == rec[2]:
+        return True
+    return _content_hash(path) == rec[0]
+
+def _write_shard(path, entries, use_gzip):
+    """整片重写（先 .tmp 再改名）；entries 为 [(loc, lastmod)]。"""
+    tmp = path + ".tmp"
+    raw = open(tmp, "wb")
+    fh = gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0) if use_gzip else raw
+    try:
+        fh.write((XML_HEAD + URLSET_OPEN).encode("utf-8"))
+        for loc, last in entries:
+            fh.write(url_entry(loc, last).encode("utf-8"))
+        fh.write(URLSET_CLOSE.encode("utf-8"))
+    finally:
+        fh.close()
+        if use_gzip: raw.close()
+    os.replace(tmp, path)
+
+class SitemapStore:
+    """
+    增量 sitemap 状态库（.sitemap_state.json）：
+      urls: {loc: [内容哈希, lastmod, 分片号, mtime_ns, size]}
+      files: {文件名: [哈希, 大小, mtime_ns]}  —— 本库写出的分片和 index
+    - mtime/size 没变的文件不读内容；变了才算哈希，哈希也没变就只刷新 stat，lastmod 不动
+    - 只有哈希变化 / 新增 / 删除的 URL 所在分片才重写；新 URL 追加到末片（满了开新片）
+    - 分片 / index 缺失或与记录对不上（被别的脚本覆盖过）也算脏，按状态库重写
+    - 没有任何分片变脏时，sitemap 文件一个字节都不写
+    """
+    def __init__(self, root, domain, use_gzip=True, max_urls=MAX_URLS, max_bytes=MAX_BYTES):
+        self.root = root
+        self.domain = domain.rstrip("/")
+        self.use_gzip = use_gzip
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+        self.path = os.path.join(root, STATE_FILE)
+        self.urls = {}
+        self.files = {}
+        self.dirty = set()        # 需要重写的分片号
+        self.index_dirty = False
+        self.state_dirty = False
+        self.stats = {"new": 0, "changed": 0, "removed": 0, "hashed": 0, "unchanged": 0}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        if data.get("version") != STATE_VERSION: return
+        self.urls = data.get("urls", {})
+        self.files = data.get("files", {})
+        if bool(data.get("gzip", True)) != self.use_gzip:
+            # 压缩格式切换：文件名都变了，全部分片重写
+            self.dirty.update(v[2] for v in self.urls.values())
+            self.state_dirty = True
+
+    def save(self):
+        if not self.state_dirty: return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "gzip": self.use_gzip, "urls": self.urls, "files": self.files},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.state_dirty = False
+
+    def shard_name(self, n):
+        return f"sitemap-{n}.xml" + (".gz" if self.use_gzip else "")
+
+    def _shard_usage(self):
+        usage = {}
+        for loc, v in self.urls.items():
+            c, b = usage.get(v[2], (0, 0))
+            usage[v[2]] = (c + 1, b + len(url_entry(loc, v[1]).encode("utf-8")))
+        return usage
+
+    def sync(self, files):
+        """files: 可迭代的 HTML 绝对路径。对比状态库，标出脏分片。"""
+        seen = set()
+        pending = []   # 新 URL 稍后统一分片
+        for f in files:
+            rel = os.path.relpath(f, self.root).replace("\\", "/")
+            loc = f"{self.domain}/{rel}"
+            seen.add(loc)
+            st = os.stat(f)
+            cur = self.urls.get(loc)
+            if cur and cur[3] == st.st_mtime_ns and cur[4] == st.st_size:
+                self.stats["unchanged"] += 1
+                continue
+            h = _content_hash(f); self.stats["hashed"] += 1
+            if cur is None:
+                pending.append((loc, [h, fmt_date(st.st_mtime), 0, st.st_mtime_ns, st.st_size]))
+                self.stats["new"] += 1
+            elif cur[0] == h:
+                cur[3], cur[4] = st.st_mtime_ns, st.st_size
+                self.stats["unchanged"] += 1
+            else:
+                cur[0], cur[1], cur[3], cur[4] = h, fmt_date(st.st_mtime), st.st_mtime_ns, st.st_size
+                self.dirty.add(cur[2])
+                self.stats["changed"] += 1
+            self.state_dirty = True
+
+        for loc in [u for u in self.urls if u not in seen]:
+            self.dirty.add(self.urls.pop(loc)[2])
+            self.stats["removed"] += 1
+            self.state_dirty = True
+
+        if pending:
+            usage = self._shard_usage()
+            n = max(usage) if usage else 1
+            count, size = usage.get(n, (0, 0))
+            for loc, v in sorted(pending):
+                b = len(url_entry(loc, v[1]).encode("utf-8"))
+                if count >= self.max_urls or size + b + len(XML_HEAD + URLSET_OPEN + URLSET_CLOSE) > self.max_bytes:
+                    n += 1; count = size = 0
+                v[2] = n
+                self.urls[loc] = v
+                self.dirty.add(n)
+                count += 1; size += b
+
+        # 分片文件缺失（首次运行 / 被误删）或被别的脚本覆盖过（和记录的哈希/大小对不上）也算脏
+        for n in {v[2] for v in self.urls.values()}:
+            name = self.shard_name(n)
+            if not _sig_matches(os.path.join(self.root, name), self.files.get(name)):
+                self.dirty.add(n)
+        if not _sig_matches(os.path.join(self.root, INDEX_NAME), self.files.get(INDEX_NAME)):
+            self.index_dirty = True
+        return self
+
+    def write(self):
+        """只重写脏分片；有变化时才重写 index。返回重写的分片数。"""
+        if not self.dirty and not self.index_dirty:
+            return 0
+        groups = {}
+        for loc, v in self.urls.items():
+            if v[2] in self.dirty:
+                groups.setdefault(v[2], []).append((loc, v[1]))
+        for n in sorted(self.dirty):
+            path = os.path.join(self.root, self.shard_name(n))
+            if n in groups:
+                _write_shard(path, sorted(groups[n]), self.use_gzip)
+                self.files[self.shard_name(n)] = _file_sig(path)
+            else:
+                if os.path.exists(path):
+                    os.remove(path)   # 整片 URL 都删光了
+                self.files.pop(self.shard_name(n), None)
+
+        shards = {}
+        for v in self.urls.values():
+            if v[1] > shards.get(v[2], ""): shards[v[2]] = v[1]
+        names = [(self.shard_name(n), shards[n]) for n in sorted(shards)]
+        write_index(self.root, self.domain, names)
+        keep = {name for name, _ in names}
+        prune_stale(self.root, keep)
+        self.files[INDEX_NAME] = _file_sig(os.path.join(self.root, INDEX_NAME))
+        self.files = {k: v for k, v in self.files.items() if k in keep or k == INDEX_NAME}
+        self.state_dirty = True
+        written = len(groups)
+        self.dirty.clear()
+        self.index_dirty = False
+        return written
+
+def update_sitemaps(root, domain=None, files=None, use_gzip=True):
+    """
+    增量更新入口（其他脚本也调这个，而不是把所有 lastmod 改成今天）。
+    返回 (SitemapStore, 重写分片数)；重写分片数为 0 表示 sitemap 文件完全没动。
+    """
+    root = os.path.abspath(root)
+    domain = domain or load_domain(root)
+    m = nb_metrics.current()
+    store = SitemapStore(root, domain, use_gzip=use_gzip)
+    with m.timer("sitemap.sync"):
+        store.sync(iter_html(root) if files is None else files)
+    with m.timer("sitemap.write"):
+        written = store.write()
+    store.save()
+    m.count("sitemap.urls", len(store.urls))
+    m.count("sitemap.shards_written", written)
+    # stat 没变直接命中状态库，不读文件
+    m.count("cache.sitemap_stat.hit", len(store.urls) + store.stats["removed"] - store.stats["hashed"])
+    m.count("cache.sitemap_stat.miss", store.stats["hashed"])
+    return store, written
+
+def main():
+    ap = argparse.ArgumentParser(description="生成 sitemap-N.xml.gz + sitemap_index.xml（默认按内容哈希增量更新）")
+    ap.add_argument("--root", default=ROOT, help="站点根目录（默认脚本所在目录）")
+    ap.add_argument("--no-gzip", action="store_true", help="分片不压缩，写成 sitemap-N.xml")
+    ap.add_argument("--max-urls", type=int, default=MAX_URLS, help="单片最多条数（默认 50000，仅 --stream）")
+    ap.add_argument("--full", action="store_true", help="丢弃状态库，全部重新计算哈希并重写")
+    ap.add_argument("--stream", action="store_true", help="不用状态库，直接流式全量生成（常量内存，lastmod 取文件 mtime）")
+    args = ap.parse_args()
+
+    root = os.path.abspath(args.root)
+    nb_metrics.start("sitemap_fix", root)
+    dom = load_domain(root)
+    if args.stream:
+        w = write_sitemaps(root, dom, iter_entries(root, dom),
+                           use_gzip=not args.no_gzip, max_urls=args.max_urls)
+        if not w.total:
+            raise SystemExit("[FATAL] 没找到任何 HTML，确认目录/过滤规则")
+        print(f"[OK] 生成 {INDEX_NAME} ：{len(w.shards)} 个分片，共 {w.total} 条")
+        return
+
+    if args.full and os.path.exists(os.path.join(root, STATE_FILE)):
+        os.remove(os.path.join(root, STATE_FILE))
+    store, written = update_sitemaps(root, dom, use_gzip=not args.no_gzip)
+    if not store.urls:
         raise SystemExit("[FATAL] 没找到任何 HTML，确认目录/过滤规则")
-    write_xml(urls)
+    st = store.stats
+    print(f"[OK] sitemap 增量更新：新增 {st['new']} / 变更 {st['changed']} / 删除 {st['removed']} ；"
+          f"重写分片 {written} 个（共 {len(store.urls)} 条）" + ("" if written else " —— 无变化，未写文件"))
+
+if __name__ == "__main__":
+    nb_profile.run_main("sitemap_fix", main)
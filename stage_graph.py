@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+stage_graph.py —— 构建阶段依赖图（make 式“输入没变就跳过”，按内容哈希而不是 mtime）
+- 每个阶段声明：deps（上游阶段）、inputs（脚本/配置/词库等 glob）、outputs（产物 glob）
+- 阶段指纹 = 脚本内容 + 参数 + 全部输入文件的内容哈希 + 脚本（递归）import 的同目录模块
+  （nb_regions / page_templates / nb_textgen 这类共用模块改了，用到它的阶段也算输入变了）；
+  与上次成功运行时的指纹相同即跳过
+- 以下情况仍会执行：
+    上游阶段本轮执行过（页面脚本都是原地改写，上游重跑后下游必须重新补丁）
+    声明的产物一个都找不到（例如 sitemap_index.xml 被删）
+    always=True（图片生成、部署这类自己判断增量的阶段）或 --force 点名
+- 状态存站点根目录 .nb_stage_state.json；文件哈希带 (mtime, size) 预筛，没动过的文件不重读
+- 某阶段失败会清掉它的指纹，下次必跑
+
+用法：
+from stage_graph import Stage, StageGraph
+g = StageGraph([Stage("pages", "2222.py", inputs=["config.json"]),
+                Stage("ads", "ads_apply_all.py", deps=["pages"], inputs=["ads_mapping.json"])])
+reports = g.run(site, execute, script_path)     # execute(stage) -> {"status": "ok"/...}
+"""
+import os, ast, json, glob, hashlib
+
+STATE_FILE = ".nb_stage_state.json"
+STATE_VERSION = 1
+
+def local_modules(script):
+    """script 直接或间接 import 的、与它同目录的 .py 模块（函数里的延迟 import 也算）。"""
+    base = os.path.dirname(os.path.abspath(script))
+    found, todo = set(), [os.path.abspath(script)]
+    while todo:
+        path = todo.pop()
+        try:
+            with open(path, "rb") as f:
+                tree = ast.parse(f.read(), path)
+        except (OSError, SyntaxError, ValueError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                mp = os.path.join(base, name.split(".")[0] + ".py")
+                if mp not in found and os.path.isfile(mp) and mp != os.path.abspath(script):
+                    found.add(mp)
+                    todo.append(mp)
+    return sorted(found)
+
+class Stage:
+    def __init__(self, name, script=None, args=None, cwd="", deps=(), inputs=(), outputs=(),
+                 builtin=None, after=None, required=False, default_off=False, always=False):
+        self.name = name
+        self.script = script        # 站点根目录（或工具目录）下的脚本名
+        self.args = args            # 列表，或 fn(site) -> 列表
+        self.cwd = cwd              # 相对站点根目录的运行目录
+        self.deps = tuple(deps)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.builtin = builtin      # fn(site) -> 状态字符串；与 script 二选一
+        self.after = after          # fn(site, ok)：执行后回调
+        self.required = required    # 找不到脚本时算失败（否则算跳过）
+        self.default_off = default_off
+        self.always = always
+
+    def resolve_args(self, site):
+        return list(self.args(site) if callable(self.args) else (self.args or []))
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+class StageGraph:
+    def __init__(self, stages):
+        self.stages = {s.name: s for s in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("阶段名重复")
+        for s in stages:
+            for d in s.deps:
+                if d not in self.stages:
+                    raise ValueError(f"阶段 {s.name} 依赖了不存在的阶段 {d}")
+        self.order = self._toposort([s.name for s in stages])
+
+    def _toposort(self, names):
+        # 每次取声明顺序里第一个“上游都已排好”的阶段：执行顺序稳定，且尽量贴近声明顺序
+        out, done, left = [], set(), list(names)
+        while left:
+            for n in left:
+                if all(d in done for d in self.stages[n].deps):
+                    break
+            else:
+                raise ValueError("阶段依赖存在环：" + ", ".join(left))
+            left.remove(n)
+            out.append(n)
+            done.add(n)
+        return out
+
+    def names(self):
+        return list(self.order)
+
+    def plan(self, site, selected=None, force=(), script_path=None, state=None):
+        """只算不跑：返回 [(阶段名, 原因)]，原因为 None 表示可跳过（假设上游全部跳过）。"""
+        state = state or StageState(site)
+        out, ran = [], set()
+        for n in self.order:
+            if selected is not None and n not in selected: continue
+            reason = state.reason_to_run(self.stages[n], ran, force, script_path)
+            if reason: ran.add(n)
+            out.append((n, reason))
+        return out
+
+    def run(self, site, execute, script_path=None, selected=None, force=(), stop_on_error=False):
+        """
+        按拓扑序执行。execute(stage) 返回记录字典（至少含 status）；跳过的阶段记 status="up-to-date"。
+        selected 限定参与的阶段（其余视为不存在）；force 里的阶段无条件执行。
+        """
+        state = StageState(site)
+        reports, ran = [], set()
+        try:
+            for n in self.order:
+                if selected is not None and n not in selected: continue
+                st = self.stages[n]
+                reason = state.reason_to_run(st, ran, force, script_path)
+                if not reason:
+                    reports.append({"stage": n, "status": "up-to-date", "seconds": 0.0, "rc": 0})
+                    continue
+                fp = state.fingerprint(st, script_path)     # 执行前取指纹：执行中被改的输入下轮会再触发
+                rec = execute(st)
+                rec.setdefault("stage", n)
+                rec["reason"] = reason
+                reports.append(rec)
+                ran.add(n)
+                if rec.get("status") in ("ok", "skip"):
+                    state.record(n, fp)
+                else:
+                    state.forget(n)
+                    if stop_on_error: break
+        finally:
+            state.save()
+        return reports
+
+class StageState:
+    def __init__(self, site):
+        self.site = os.path.abspath(site)
+        self.path = os.path.join(self.site, STATE_FILE)
+        self.data = {"version": STATE_VERSION, "files": {}, "stages": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    d = json.load(f)
+                if d.get("version") == STATE_VERSION:
+                    self.data = d
+            except Exception:
+                pass
+        self.dirty = False
+        self._modules = {}    # 脚本路径 -> local_modules()，一轮里只解析一次
+
+    # ----- 文件哈希（stat 预筛） -----
+    def file_hash(self, path):
+        rel = os.path.relpath(path, self.site).replace("\\", "/")
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        old = self.data["files"].get(rel)
+        if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+            return old[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        self.data["files"][rel] = [st.st_mtime_ns, st.st_size, h.hexdigest()]
+        self.dirty = True
+        return h.hexdigest()
+
+    def expand(self, patterns):
+        files = set()
+        for pat in patterns:
+            for p in glob.glob(os.path.join(self.site, pat), recursive=True):
+                if os.path.isfile(p):
+                    files.add(os.path.abspath(p))
+        return sorted(files)
+
+    def fingerprint(self, stage, script_path=None):
+        h = hashlib.sha1()
+        h.update(json.dumps([stage.name, stage.cwd, stage.resolve_args(self.site)],
+                            ensure_ascii=False).encode("utf-8"))
+        sp = script_path(self.site, stage) if (script_path and stage.script) else None
+        if sp:
+            h.update(b"script\0" + (self.file_hash(sp) or "-").encode())
+            if sp not in self._modules:
+                self._modules[sp] = local_modules(sp)
+            for mp in self._modules[sp]:
+                h.update(f"module\0{os.path.basename(mp)}\0{self.file_hash(mp)}\n".encode("utf-8"))
+        for p in self.expand(stage.inputs):
+            rel = os.path.relpath(p, self.site).replace("\\", "/")
+            h.update(f"{rel}\0{self.file_hash(p)}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def outputs_missing(self, stage):
+        return any(not glob.glob(os.path.join(self.site, pat), recursive=True) for pat in stage.outputs)
+
+    def reason_to_run(self, stage, ran, force=(), script_path=None):
+        """返回需要执行的原因；None 表示已是最新。"""
+        if stage.name in force: return "forced"
+        if stage.always: return "always"
+        rec = self.data["stages"].get(stage.name)
+        if not rec: return "never-ran"
+        up = [d for d in stage.deps if d in ran]
+        if up: return "upstream:" + ",".join(up)
+        if self.outputs_missing(stage): return "outputs-missing"
+        if rec.get("fp") != self.fingerprint(stage, script_path): return "inputs-changed"
+        return None
+
+    def record(self, name, fp):
+        self.data["stages"][name] = {"fp": fp}
+        self.dirty = True
+
+    def forget(self, name):
+        if self.data["stages"].pop(name, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty: return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.dirty = False
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""各脚本都在仓库根目录平铺，测试直接按模块名导入。"""
+import os, sys, importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def load_script(name, filename):
+    """按文件路径导入（2222.py 这种数字开头、没法 import 的脚本）。"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def write_page(root, rel, body="", title="t"):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<html><head><title>{title}</title></head><body>{body}</body></html>")
+    return path
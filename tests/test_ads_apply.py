@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""ads_apply_all：单遍注入与逐块插入的老流程逐字节一致（固定种子随机页面）；--refresh 按指纹原地更新；加载器去重。"""
+import re, random
+import pytest
+import ads_apply_all as ads
+from ads_apply_all import Injector, apply_sequential, scan_points
+
+JADS = '<script type="text/javascript" data-cfasync="false" async src="https://poweredby.jads.co/js/jads.js"></script>'
+
+def slot(zone, w, h, label):
+    return (f'<!-- {label} -->{JADS}<ins id="{zone}" data-width="{w}" data-height="{h}"></ins>'
+            f'<script type="text/javascript" data-cfasync="false" async>(adsbyjuicy = window.adsbyjuicy || [])'
+            f".push({{'adzone':{zone}}});</script>")
+
+POPUP = '<!-- PopUnders --><script type="text/javascript" src="https://js.example.com/jp.php?c=1&u=x"></script>'
+INNER = {"top_banner": [slot(1100527, 300, 100, "Top")], "inline_banner": [slot(1100524, 300, 250, "Inline")],
+         "bottom_banner": [slot(1100529, 300, 50, "Bottom")], "popup": [POPUP]}
+HOME = {"top_banner": [slot(1100522, 728, 90, "Leaderboard")], "bottom_banner": [slot(1100534, 250, 250, "Bottom")]}
+SECTIONS = [INNER, HOME, {"inline_banner": INNER["inline_banner"]}, {"popup": [POPUP]}, {},
+            # 顶部块里带 inline 锚点：整套配置退回老流程
+            {"top_banner": ["<p>sponsored</p>" + slot(1, 1, 1, "x")], "bottom_banner": ["<div>b</div>"]}]
+
+PIECES = ["<h2>Title</h2>", "<p>text</p>", "<P>Upper</P >", "<img src=\"a.jpg\"></img>", "<main>m</main>",
+          "<!-- NB:INLINE-ANCHOR -->", "</h2 >", "plain text ", "\n", "<div>x</div>",
+          '<div class="nb-bottombar-wrap"><a>x</a></div>\n', "<h2 class=\"s\">t</h2>"]
+
+def existing_block(rnd):
+    key = rnd.choice(("top", "inline", "bottom", "popup", "loader"))
+    if rnd.random() < 0.5:
+        return ads.snippet(key, "old")                       # 带指纹
+    s, e = ads.MARKS[key]
+    return f"\n{s}\nold\n{e}\n"                              # 老格式
+
+def random_page(rnd):
+    out = [rnd.choice(["", "<!DOCTYPE html>\n"]), rnd.choice(["<html>", '<HTML lang="en">', ""]),
+           "<head><title>t</title></head>"]
+    if rnd.random() < 0.9:
+        out.append(rnd.choice(["<body>", '<body class="a nb-has-bottom b">', "<BODY id=x>",
+                               '<body data-x="<">', '<body title="</h2>">', '<body class="nb-has-bottom">']))
+    for _ in range(rnd.randint(0, 8)):
+        out.append(existing_block(rnd) if rnd.random() < 0.15 else rnd.choice(PIECES))
+    if rnd.random() < 0.85:
+        out.append(rnd.choice(["</body>", "</BODY >", "</body>\n"]))
+    out.append(rnd.choice(["</html>", "</html>\n", ""]))
+    return "".join(out)
+
+@pytest.mark.parametrize("dedupe,lazy", [(False, False), (True, False), (True, True)])
+def test_single_pass_matches_sequential(dedupe, lazy):
+    rnd = random.Random(20250101)
+    fast = 0
+    for i in range(3000):
+        html = random_page(rnd)
+        section = SECTIONS[i % len(SECTIONS)]
+        clean = bool(i % 3)
+        inj = Injector(section, clean, dedupe=dedupe, lazy=lazy)
+        got = inj.apply(html)
+        assert got == apply_sequential(html, inj.blocks, inj.clean), (i, html)
+        assert inj.apply(got) == apply_sequential(got, inj.blocks, inj.clean)
+        fast += inj.inert and scan_points(html, clean) is not None
+    assert fast > 1000                                       # 大部分页面确实走了单遍路径
+
+# ===== --refresh：块指纹 =====
+BASE = ('<html><head><title>t</title></head><body><h1>x</h1><h2>Sub</h2><p>one</p><p>two</p>'
+        '<img src="a.jpg"/></body></html>')
+OLD_INNER = {"top_banner": [slot(900001, 300, 100, "Top")], "inline_banner": [slot(900002, 300, 250, "Inline")],
+             "bottom_banner": [slot(900003, 300, 50, "Bottom")], "popup": [POPUP]}
+
+def strip_fp(html):
+    """改成加指纹之前的标记格式（<!-- NB:AD-TOP START -->）。"""
+    return re.sub(r" fp=[0-9a-f]+ -->", " -->", html)
+
+def run(inj, html, refresh=False):
+    """与 process_files 相同的一步。"""
+    return inj.apply(inj.refresh(html) if refresh else html)
+
+@pytest.mark.parametrize("dedupe", [False, True])
+def test_default_run_leaves_baseline_pages_alone(dedupe):
+    old = strip_fp(Injector(OLD_INNER, True).apply(BASE))      # 老脚本注入的页面：无指纹、旧 zone
+    assert "fp=" not in old and "900001" in old
+    inj = Injector(INNER, True, dedupe=dedupe)
+    assert run(inj, old) == old
+
+@pytest.mark.parametrize("dedupe,lazy", [(False, False), (True, False), (True, True)])
+def test_refresh_equals_fresh_injection(dedupe, lazy):
+    inj = Injector(INNER, True, dedupe=dedupe, lazy=lazy)
+    fresh = inj.apply(BASE)
+    for old_cfg in (OLD_INNER, INNER):
+        for old in (Injector(old_cfg, True).apply(BASE), strip_fp(Injector(old_cfg, True).apply(BASE))):
+            once = run(inj, old, refresh=True)
+            assert once == fresh
+            assert run(inj, once, refresh=True) == once         # 再跑不变
+            assert run(inj, once) == once
+
+def test_refresh_drops_blocks_removed_from_config():
+    old = Injector(OLD_INNER, True).apply(BASE)
+    inj = Injector({"top_banner": INNER["top_banner"]}, True)
+    once = run(inj, old, refresh=True)
+    assert once == inj.apply(BASE)
+    assert "NB:AD-INLINE" not in once and "NB:AD-POPUP" not in once
+    assert run(inj, once, refresh=True) == once
+
+def test_refresh_collapses_duplicate_blocks():
+    inj = Injector(INNER, True)
+    fresh = inj.apply(BASE)
+    top = ads.snippet("top", "stale")
+    dup = fresh.replace("<body>", "<body>" + top + top, 1)
+    assert run(inj, dup, refresh=True).count("NB:AD-TOP START") == 1
+
+def test_refresh_only_rewrites_stale_pages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inj = {"inner": Injector(INNER, True), "home": Injector(HOME, True)}
+    cur, stale = tmp_path / "cur.html", tmp_path / "stale.html"
+    cur.write_text(inj["inner"].apply(BASE), encoding="utf-8")
+    stale.write_text(Injector(OLD_INNER, True).apply(BASE), encoding="utf-8")
+    changed = ads.process_files([cur, stale], inj, refresh=True)
+    assert [f for f, _ in changed] == [stale]
+
+# ===== dedupe_loader：每页一个 jads.js =====
+def loaders(html):
+    return html.count("poweredby.jads.co/js/jads.js")
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_dedupe_leaves_one_loader(lazy):
+    inj = Injector(INNER, True, dedupe=True, lazy=lazy)
+    assert loaders(Injector(INNER, True).apply(BASE)) == 3       # 不去重：每个广告位各带一个
+    once = inj.apply(BASE)
+    assert loaders(once) == 1
+    assert once.count("NB:AD-LOADER START") == 1
+    assert once.index("NB:AD-LOADER START") > once.index("NB:AD-BOTTOM START")   # 在 </body> 前、广告位之后
+    assert inj.apply(once) == once                              # 重跑不变
+    assert run(inj, once, refresh=True) == once
+    if lazy:
+        assert 'data-nb-zone="1100524"' in once and 'data-nb-zone="1100529"' in once
+        assert "IntersectionObserver" in once and "'adzone':1100527" in once       # 首屏的顶部照常 push
+    else:
+        assert "data-nb-zone" not in once
+
+def test_refresh_moves_inline_loaders_into_one_block():
+    old = Injector(INNER, True).apply(BASE)                     # 老页面：每块自带加载脚本
+    inj = Injector(INNER, True, dedupe=True)
+    assert inj.apply(old) == old                                # 默认不动老块
+    once = run(inj, old, refresh=True)
+    assert loaders(once) == 1 and once == inj.apply(BASE)
+    assert run(inj, once, refresh=True) == once
+
+def test_no_loader_without_slots():
+    inj = Injector({"popup": [POPUP], "top_banner": INNER["top_banner"]}, True, dedupe=True)
+    page = inj.apply(BASE)
+    assert loaders(page) == 1
+    only_popup = Injector({"popup": [POPUP]}, True, dedupe=True)
+    assert loaders(only_popup.apply(BASE)) == 0 and "NB:AD-LOADER" not in only_popup.apply(BASE)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os, subprocess
+from conftest import write_page
+import auto_git_push
+
+def _git(cwd, *args):
+    r = subprocess.run(["git"] + list(args), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return r.stdout.decode("utf-8")
+
+def _remote_files(bare):
+    return set(_git(bare, "ls-tree", "-r", "--name-only", "HEAD").split())
+
+def _repo(tmp_path):
+    bare = str(tmp_path / "remote.git")
+    work = str(tmp_path / "site")
+    _git(str(tmp_path), "init", "-q", "--bare", bare)
+    _git(str(tmp_path), "init", "-q", work)
+    for k, v in (("user.name", "t"), ("user.email", "t@example.com"), ("core.quotepath", "false")):
+        _git(work, "config", k, v)
+    _git(work, "remote", "add", "origin", bare)
+    write_page(work, "README.html")
+    _git(work, "add", "README.html")
+    _git(work, "commit", "-q", "-m", "init")
+    _git(work, "push", "-q", "-u", "origin", "HEAD")
+    return bare, work
+
+def test_changed_only_round_trip(tmp_path):
+    bare, work = _repo(tmp_path)
+    write_page(work, "bedroom/page1.html")
+    write_page(work, "bedroom/x1.html")
+    write_page(work, "bedroom/x*.html")
+    write_page(work, "bedroom/[ab].html")
+    write_page(work, "bedroom/a.html")
+    write_page(work, "bedroom/page1.html.bak")            # 备份产物不部署
+    assert auto_git_push.deploy_changed(work, "deploy 1")
+    first = _remote_files(bare)
+    assert "bedroom/x*.html" in first and "bedroom/[ab].html" in first
+    assert "bedroom/page1.html.bak" not in first
+    assert auto_git_push.MANIFEST not in first
+
+    # 第二轮：改一个、删一个带通配符的、新增一个；其余文件不该出现在提交里
+    write_page(work, "bedroom/[ab].html", body="changed")
+    os.remove(os.path.join(work, "bedroom", "x*.html"))
+    write_page(work, "dark/page1.html")
+    assert auto_git_push.deploy_changed(work, "deploy 2")
+    files = _remote_files(bare)
+    assert files == (first - {"bedroom/x*.html"}) | {"dark/page1.html"}
+    touched = _git(bare, "diff-tree", "--no-commit-id", "--name-only", "-r", "-z", "HEAD").split("\0")
+    assert sorted(p for p in touched if p) == ["bedroom/[ab].html", "bedroom/x*.html", "dark/page1.html"]
+
+    # 第三轮：什么都没变，不产生新提交
+    head = _git(bare, "rev-parse", "HEAD")
+    assert auto_git_push.deploy_changed(work, "deploy 3")
+    assert _git(bare, "rev-parse", "HEAD") == head
+
+def test_stage_paths_are_literal(tmp_path):
+    _, work = _repo(tmp_path)
+    write_page(work, "a.html")
+    write_page(work, "[ab].html")
+    _git(work, "add", "-A")
+    _git(work, "commit", "-q", "-m", "pages")
+    write_page(work, "a.html", body="local edit")         # 不在本次变更列表里
+    write_page(work, "[ab].html", body="changed")
+    auto_git_push.stage_paths(work, ["[ab].html"], [])
+    assert _git(work, "diff", "--cached", "--name-only").split() == ["[ab].html"]
+
+class _Failed:
+    returncode = 1
+    stderr = b"rejected"
+
+def test_backoff_push_retries_with_growing_delays(monkeypatch):
+    calls, slept = [], []
+    monkeypatch.setattr(auto_git_push, "git", lambda args, root, stdin=None, check=True: calls.append(args) or _Failed())
+    monkeypatch.setattr(auto_git_push.random, "uniform", lambda lo, hi: hi)    # 抖动取上限，方便核对
+    assert not auto_git_push.push_with_backoff(".", sleep=slept.append)
+    assert len(calls) == auto_git_push.BACKOFF_RETRIES and all(c == ["push"] for c in calls)
+    assert slept == [5, 10, 20, 40]                                            # 最后一次失败后不再等
+
+    # 抖动在 [cap/2, cap] 之间，cap 封顶 MAX_DELAY
+    monkeypatch.undo()
+    for attempt in range(1, 10):
+        cap = min(auto_git_push.MAX_DELAY, auto_git_push.BASE_DELAY * 2 ** (attempt - 1))
+        assert cap / 2 <= auto_git_push.backoff_delay(attempt) <= cap
+    assert auto_git_push.backoff_delay(9) <= auto_git_push.MAX_DELAY
+
+def test_backoff_push_stops_on_success(monkeypatch):
+    results = [_Failed(), _Failed(), type("Ok", (), {"returncode": 0})()]
+    monkeypatch.setattr(auto_git_push, "git", lambda args, root, stdin=None, check=True: results.pop(0))
+    slept = []
+    assert auto_git_push.push_with_backoff(".", sleep=slept.append)
+    assert len(slept) == 2 and not results
+
+def test_full_mode_keeps_its_own_retry_budget(monkeypatch):
+    pushes, slept = [], []
+    monkeypatch.setattr(auto_git_push.subprocess, "run", lambda *a, **k: None)   # git add . / commit
+    monkeypatch.setattr(auto_git_push, "run_git_command", lambda cmd: pushes.append(cmd) and False)
+    monkeypatch.setattr(auto_git_push.time, "sleep", slept.append)
+    auto_git_push.push_with_retry()
+    assert pushes == ["git push"] * auto_git_push.MAX_RETRIES
+    assert auto_git_push.MAX_RETRIES != auto_git_push.BACKOFF_RETRIES
+    assert slept == [10, 20]                                                   # 旧流程：固定多等 10 秒
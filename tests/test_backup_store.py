@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import os
+from conftest import write_page
+from backup_store import BackupStore
+
+def test_first_version_per_page_is_kept_and_restored(tmp_path):
+    root = str(tmp_path)
+    a = write_page(root, "bedroom/page1.html", body="v1")
+    store = BackupStore(root, run_id="r1", stage="test")
+    assert store.save(a) is not None
+    write_page(root, "bedroom/page1.html", body="v2")
+    assert store.save(a) is None                       # 同一页只记第一次
+    assert store._seen == {"bedroom/page1.html"}
+    new = os.path.join(root, "dark", "page1.html")
+    store.save(new)                                     # 本轮新建的页面
+    write_page(root, "dark/page1.html")
+
+    assert store.restore("r1") == 2
+    with open(a, encoding="utf-8") as f:
+        assert "v1" in f.read()
+    assert not os.path.exists(new)
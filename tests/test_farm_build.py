@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+from concurrent.futures import ProcessPoolExecutor
+import farm_build
+
+# 替身词库脚本：读跨站词库，挑第一个没用过的词，停一会儿（放大竞争窗口）再追加
+FAKE_SELECT = r'''
+import os, time
+p = os.environ["NB_USED_GLOBAL"]
+used = set(open(p, encoding="utf-8").read().split()) if os.path.exists(p) else set()
+kw = next(k for k in ("alpha", "beta", "gamma") if k not in used)
+time.sleep(0.5)
+with open(p, "a", encoding="utf-8") as f:
+    f.write(kw + "\n")
+with open("picked.txt", "w", encoding="utf-8") as f:
+    f.write(kw)
+'''
+
+def test_keyword_stages_are_serialized_across_sites(tmp_path):
+    used = str(tmp_path / "used_keywords_global.txt")
+    st = next(s for s in farm_build.STAGES if s.name == "kw_select")
+    sites = []
+    for name in ("site_a", "site_b", "site_c"):
+        site = tmp_path / name
+        site.mkdir()
+        (site / st.script).write_text(FAKE_SELECT, encoding="utf-8")
+        sites.append(str(site))
+    env = dict(os.environ, NB_USED_GLOBAL=used)
+    with ProcessPoolExecutor(max_workers=3) as ex:
+        recs = list(ex.map(farm_build.run_stage, sites, [st] * 3, [env] * 3, [60] * 3))
+    assert all(r["status"] == "ok" for r in recs)
+    assert all("lock_wait" in r for r in recs)
+    picked = sorted(open(os.path.join(s, "picked.txt"), encoding="utf-8").read() for s in sites)
+    assert picked == ["alpha", "beta", "gamma"]
+    with open(used, encoding="utf-8") as f:
+        assert sorted(f.read().split()) == ["alpha", "beta", "gamma"]
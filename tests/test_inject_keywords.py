@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import os, sys, random, shutil, subprocess
+import pytest
+from conftest import ROOT
+import inject_keywords as ik
+
+KWS = ["red dress", "Tom & Jerry", 'say "hi"', "<b>bold</b>", r"a\\b", "tab\\tin", r"grp\1", r"bad\d", r"\g<0>"]
+
+HEADS = [
+    "<head>{title}{meta}</head>",
+    "<HEAD>{meta}{title}</HEAD>",
+    "<head lang=\"en\">\n{title}\n{meta}\n</head>",
+    "{title}{meta}",                                  # 没有 <head>
+    "<head>{title}</head><head>{meta}</head>",
+]
+TITLES = ["", "<title>old</title>", "<TITLE>Old</TITLE>", "<title>\nmulti\nline</title>",
+          "<title><img src=\"t.jpg\"></title>", "<title>a</title><title>b</title>",
+          "<title>x<head>y</title>"]
+METAS = ["", '<meta name="description" content="old">', "<meta name='description' content='old' />",
+         '<META NAME="description" CONTENT="x"/>', '<meta charset="utf-8"><meta name="description" content="y">',
+         '<meta name="keywords" content="k">']
+BODIES = ["<body>", "<BODY class=\"x\">", "<body title=\"</head>\">", "<body><header><h1 class=\"logo\">Site</h1></header>",
+          "<body><header>nav</header>", ""]
+MAINS = ["", "<main>", "<main id=\"m\">", "<main><h1>old</h1>", "<h1>\nold\n</h1>"]
+IMGS = ["", '<img src="a.jpg">', '<img src="a.jpg" alt="old">', '<IMG alt="x" src="b.jpg"/>',
+        '<img src="a.jpg" alt="old" loading="lazy"><img src="b.jpg">', "<imgx>"]
+
+def random_page(rnd):
+    head = rnd.choice(HEADS).format(title=rnd.choice(TITLES), meta=rnd.choice(METAS))
+    body = rnd.choice(BODIES) + rnd.choice(MAINS) + rnd.choice(IMGS) + "<p>text</p>"
+    if rnd.random() < 0.5:
+        body += rnd.choice(IMGS)
+    return f"<!doctype html><html>{head}{body}</body></html>"
+
+def outcome(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:          # 反斜杠模板非法时两条路都该报同一种错
+        return type(e)
+
+@pytest.mark.parametrize("h1", [True, False])
+def test_render_page_matches_sequential(monkeypatch, h1):
+    monkeypatch.setattr(ik, "INJECT_H1", h1)
+    rnd = random.Random(20260 + h1)
+    planned = 0
+    for i in range(4000):
+        page, kw = random_page(rnd), rnd.choice(KWS)
+        title, desc = ik.build_title_desc("bedroom", kw, seed_idx=i)
+        want = outcome(ik.inject_sequential, page, title, desc, kw)
+        assert outcome(ik.render_page, page, "bedroom", kw, i) == want, (page, kw)
+        planned += isinstance(outcome(ik.plan_edits, page, title, desc, kw), list)
+    assert planned > 2000               # 大部分页面确实走的单遍
+
+@pytest.mark.parametrize("page", [
+    '<html><head><title><img src="t.jpg"></title></head><body><img src="a.jpg"></body></html>',
+    '<html><head><title>t</title></head><body><header><h1>Logo</h1></header><main><img src="a.jpg"></main></body></html>',
+    '<html><body title="<head>"><img src="a.jpg"></body></html>',
+    '<html><title>x<head>y</title></head><body><img src="a.jpg"></body></html>',
+])
+def test_overlapping_edits_fall_back(page):
+    for kw in ["plain", r"back\\slash", "Tom & Jerry"]:
+        title, desc = ik.build_title_desc("dark", kw)
+        assert ik.render_page(page, "dark", kw) == ik.inject_sequential(page, title, desc, kw)
+    assert ik.plan_edits('<html><head><title><img src="t.jpg"></title></head><body></body></html>', "t", "d", "k") is None
+
+# ===== --workers：多进程输出与串行逐字节一致 =====
+SIZES = {"bedroom": 430, "dark": 7, "office": 0}
+
+def make_site(root):
+    rnd = random.Random(47)
+    os.makedirs(os.path.join(root, "keywords"))
+    for cat, n in SIZES.items():
+        os.makedirs(os.path.join(root, cat))
+        for i in range(n):
+            with open(os.path.join(root, cat, f"{i:04d}.html"), "w", encoding="utf-8") as f:
+                f.write(random_page(rnd))
+        with open(os.path.join(root, "keywords", f"{cat}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(f"{cat} kw {j} {rnd.choice(KWS[:6])}" for j in range(37)))
+
+def run(site, *args):
+    r = subprocess.run([sys.executable, os.path.join(ROOT, "inject_keywords.py"), *args], cwd=site,
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert r.returncode == 0, r.stdout.decode("utf-8", "ignore")
+
+def snapshot(site):
+    out = {}
+    for cat in SIZES:
+        for name in sorted(os.listdir(os.path.join(site, cat))):
+            with open(os.path.join(site, cat, name), "rb") as f:
+                out[f"{cat}/{name}"] = f.read()
+    return out
+
+def test_workers_output_is_byte_identical(tmp_path):
+    base = tmp_path / "base"
+    make_site(str(base))
+    before = snapshot(base)
+    snaps = {}
+    for w in ("1", "2"):
+        site = tmp_path / f"w{w}"
+        shutil.copytree(base, site)
+        run(site, "--workers", w)
+        snaps[w] = snapshot(site)
+        run(site, "--workers", w, "--force")
+        snaps[w + "f"] = snapshot(site)
+    assert snaps["1"] == snaps["2"] and snaps["1f"] == snaps["2f"]
+    assert len(snaps["1"]) == 437
+    assert all(snaps["1"][k] != v for k, v in before.items())
+    assert snaps["1f"] != snaps["1"]     # --force 无视标记，已注入的页面照样重写
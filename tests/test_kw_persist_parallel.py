@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""kw_persist_and_fill：--workers 1 / 多进程 / 旧的逐页 process_page 三种跑法输出逐字节一致，重跑不改任何页面。"""
+import os, sys, shutil, subprocess
+import pytest
+from conftest import ROOT
+import nb_bench
+import kw_persist_and_fill as kwp
+from kw_store import KwMapStore
+from site_scan import scan, invalidate
+
+PAGES = 700          # > 3 个 CHUNK，多进程时真的会切成多块
+
+def _args(site):
+    return ["--root", site, "--pool", os.path.join("keywords", "selected.txt"),
+            "--global-used", os.path.join(site, "used_global.txt")]
+
+def _main(site, workers):
+    r = subprocess.run([sys.executable, os.path.join(ROOT, "kw_persist_and_fill.py")] + _args(site)
+                       + ["--workers", str(workers)], cwd=site, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert r.returncode == 0, r.stdout.decode("utf-8", "ignore")
+
+def _sequential(site):
+    """分配和注入逐页一起做（拆成两步之前的流程）。"""
+    invalidate(site)
+    global_path = os.path.join(site, "used_global.txt")
+    with KwMapStore(site) as store:
+        picker = kwp.KeywordPicker(store, kwp.load_pool(os.path.join(site, "keywords", "selected.txt")),
+                                   kwp.load_global_used(global_path))
+        for path in scan(site).page_paths():
+            kwp.process_page(site, path, picker, global_path, 100, 180)
+        store.export_csv()
+
+def _snapshot(site):
+    out = {}
+    for d, dirs, files in os.walk(site):
+        dirs[:] = [x for x in dirs if not x.startswith(".") and x != "logs"]
+        for n in files:
+            if n.endswith(".html") or n in (".kw_map.csv", "used_global.txt"):
+                p = os.path.join(d, n)
+                with open(p, "rb") as f:
+                    out[os.path.relpath(p, site)] = f.read()
+    return out
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory):
+    site = str(tmp_path_factory.mktemp("kwp") / "base")
+    nb_bench.synth_site(site, PAGES, seed=3)
+    return site
+
+def _copy(base, tmp_path, name):
+    dst = str(tmp_path / name)
+    shutil.copytree(base, dst)
+    return dst
+
+def test_parallel_render_is_byte_identical(base, tmp_path):
+    one, many, seq = (_copy(base, tmp_path, n) for n in ("one", "many", "seq"))
+    _main(one, 1)
+    _main(many, 3)
+    _sequential(seq)
+    a, b, c = _snapshot(one), _snapshot(many), _snapshot(seq)
+    assert a != _snapshot(base)
+    assert a == b
+    assert a == c
+
+def test_rerun_changes_nothing(base, tmp_path):
+    site = _copy(base, tmp_path, "rerun")
+    _main(site, 2)
+    first = _snapshot(site)
+    _main(site, 2)
+    assert _snapshot(site) == first
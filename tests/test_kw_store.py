@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import os, json
+from kw_store import KwMapStore, read_csv, DB_FILE, CSV_FILE, LEGACY_JSON
+
+PLAIN = "url,keyword\nabout.html,about\nbedroom/a.html,soft light\ndark/b.html,dark mirror\n"
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+def _read(path):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+def test_rebuilds_from_tracked_csv_and_exports_same_bytes(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, CSV_FILE), PLAIN)
+    with KwMapStore(root) as store:
+        assert store.get("bedroom/a.html") == "soft light"
+        assert store.has_keyword("dark mirror")
+        assert store.export_csv(force=True)
+    assert _read(os.path.join(root, CSV_FILE)) == PLAIN
+
+def test_fresh_clone_round_trip(tmp_path):
+    root = str(tmp_path)
+    with KwMapStore(root) as store:
+        store.put("b.html", "with, comma")
+        store.put("a.html", 'say "hi"')
+        store.put("c.html", "plain")
+        store.export_csv()
+    os.remove(os.path.join(root, DB_FILE))          # 新克隆：只有进 git 的 CSV
+    with KwMapStore(root) as store:
+        assert list(store.items()) == [("b.html", "with, comma"), ("a.html", 'say "hi"'), ("c.html", "plain")]
+
+def test_csv_preferred_over_stale_json(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, CSV_FILE), PLAIN + "new.html,newer\n")
+    with open(os.path.join(root, LEGACY_JSON), "w", encoding="utf-8") as f:
+        json.dump({"about.html": "old"}, f)
+    with KwMapStore(root) as store:
+        assert store.get("about.html") == "about"
+        assert store.get("new.html") == "newer"
+        assert len(store) == 4
+
+def test_json_fallback_without_csv(tmp_path):
+    root = str(tmp_path)
+    with open(os.path.join(root, LEGACY_JSON), "w", encoding="utf-8") as f:
+        json.dump({"about.html": "about"}, f)
+    with KwMapStore(root) as store:
+        assert store.get("about.html") == "about"
+
+def test_read_csv_salvages_conflicts_and_unquoted_commas(tmp_path):
+    p = str(tmp_path / CSV_FILE)
+    _write(p, "url,keyword\na.html,one\n<<<<<<< HEAD\nb.html,two\n=======\nb.html,deux\n"
+              ">>>>>>> 70ab8fd\nc.html,x, y\n")
+    data, salvaged = read_csv(p)
+    assert salvaged
+    assert data == {"a.html": "one", "b.html": "deux", "c.html": "x, y"}
+
+def test_reimports_tracked_csv_changed_by_git(tmp_path):
+    root = str(tmp_path)
+    csv_path = os.path.join(root, CSV_FILE)
+    _write(csv_path, PLAIN)
+    with KwMapStore(root) as store:
+        store.put("new.html", "fresh")
+        store.export_csv()
+    # git pull 改了 CSV（库文件不进 git，还是旧的）
+    _write(csv_path, PLAIN.replace("soft light", "warm light") + "pulled.html,from remote\n")
+    with KwMapStore(root) as store:
+        assert store.get("bedroom/a.html") == "warm light"
+        assert store.get("pulled.html") == "from remote"
+        assert store.get("new.html") == "fresh"            # 库里有、CSV 没有的不丢
+        assert store.export_csv()
+    assert _read(csv_path) == (PLAIN.replace("soft light", "warm light")
+                               + "new.html,fresh\npulled.html,from remote\n")
+
+def test_unchanged_or_touched_csv_is_not_reimported(tmp_path):
+    root = str(tmp_path)
+    csv_path = os.path.join(root, CSV_FILE)
+    _write(csv_path, PLAIN)
+    with KwMapStore(root) as store:
+        store.put("about.html", "changed in db")
+        store.flush()
+    with KwMapStore(root) as store:                      # CSV 没动：库里的新值不被覆盖
+        assert store.get("about.html") == "changed in db"
+        assert not store.dirty
+    st = os.stat(csv_path)
+    os.utime(csv_path, ns=(st.st_atime_ns, st.st_mtime_ns + 5 * 10**9))   # checkout 只碰了 mtime
+    with KwMapStore(root) as store:
+        assert store.get("about.html") == "changed in db"
+        assert not store.export_csv()
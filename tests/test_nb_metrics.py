@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""nb_metrics：计时 / 计数累加，to_dict() 交回主进程后 merge() 相加，emit() 落盘后能按 run 读回。"""
+import json, time
+import nb_metrics
+from nb_metrics import Metrics, load_run
+
+def test_timer_accumulates_and_survives_exceptions():
+    m = Metrics("t", run_id="r")
+    with m.timer("parse"):
+        time.sleep(0.01)
+    try:
+        with m.timer("parse"):
+            raise ValueError
+    except ValueError:
+        pass
+    secs, calls = m.timers["parse"]
+    assert calls == 2 and secs >= 0.01
+
+def test_counters_and_helpers():
+    m = Metrics("t", run_id="r")
+    m.count("x"); m.count("x", 4)
+    m.read("héllo"); m.read(b"abc"); m.wrote(10); m.skipped(); m.skipped(2)
+    m.cache("kw", True); m.cache("kw", False); m.cache("kw", False)
+    assert m.counters == {"x": 5, "files_read": 2, "bytes_in": 9, "files_written": 1, "bytes_out": 10,
+                          "files_skipped": 3, "cache.kw.hit": 1, "cache.kw.miss": 2}
+
+def test_to_dict_and_merge_round_trip():
+    child = Metrics("t", run_id="r")
+    with child.timer("render"):
+        pass
+    child.count("files_written", 3)
+    d = json.loads(json.dumps(child.to_dict()))     # 进程池传回来的就是这种普通字典
+    assert d["stage"] == "t" and d["run_id"] == "r"
+    assert d["timers"]["render"]["calls"] == 1 and d["counters"] == {"files_written": 3}
+
+    parent = Metrics("t", run_id="r")
+    parent.count("files_written", 1)
+    parent.merge(d); parent.merge(d)
+    assert parent.counters["files_written"] == 7
+    assert parent.timers["render"][1] == 2
+    parent.merge({})                                  # 空结果不报错
+
+def test_emit_once_and_load_run(tmp_path):
+    m = Metrics("stage_a", str(tmp_path), run_id="run1")
+    m.count("files_read", 2)
+    p = m.emit(quiet=True)
+    assert p and m.emit(quiet=True) is None
+    runs = load_run(str(tmp_path), "run1")
+    assert [r["stage"] for r in runs] == ["stage_a"] and runs[0]["counters"]["files_read"] == 2
+    assert "stage_a" in nb_metrics.summary_table(runs)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""托管区块：set / cleanup / inject_auto_desc 重复执行不再改页面，老版本叠加的重复块收成一个。"""
+import nb_regions
+from kw_persist_and_fill import inject_auto_desc
+
+PAGE = "<html><head><title>t</title></head><body><h1>t</h1><p>x</p></body></html>"
+RELATED = '<div>More related: <a href="/a.html">a</a> | <a href="/b.html">b</a> | </div>'
+
+def _set(html, name, content):
+    rg = nb_regions.Regions(html)
+    rg.set(name, content, at=rg.body_close, sep="\n")
+    return rg.render()
+
+def test_set_is_idempotent_and_replaces_in_place():
+    once = _set(PAGE, "SEO-RELATED", "<div>one</div>")
+    assert _set(once, "SEO-RELATED", "<div>one</div>") == once
+    assert not nb_regions.Regions(once).changed
+    two = _set(once, "SEO-RELATED", "<div>two</div>")
+    assert two == once.replace("<div>one</div>", "<div>two</div>")
+    assert _set(two, "SEO-RELATED", "<div>two</div>") == two
+
+def test_duplicate_regions_collapse_to_first():
+    block = nb_regions.wrap("SEO-RELATED", "<div>one</div>")
+    html = PAGE.replace("</body>", block + "\n" + block + "\n" + block + "</body>")
+    out = nb_regions.cleanup(html)
+    assert out.count("NB:SEO-RELATED START") == 1
+    assert nb_regions.cleanup(out) == out
+    assert _set(out, "SEO-RELATED", "<div>one</div>") == out
+
+def test_legacy_blocks_adopted_once():
+    html = PAGE.replace("</body>", RELATED + RELATED + RELATED + "</body>")
+    out = nb_regions.cleanup(html)
+    assert out.count("More related:") == 1
+    assert out.count("NB:SEO-RELATED START") == 1
+    assert nb_regions.cleanup(out) == out
+
+def test_auto_desc_rerun_is_stable():
+    once = inject_auto_desc(PAGE, "<p>desc</p>")
+    assert inject_auto_desc(once, "<p>desc</p>") == once
+    twice = inject_auto_desc(once, "<p>new</p>")
+    assert twice.count("auto-desc") == 1 and "<p>new</p>" in twice
+    # 老版本叠加出来的两块：更新时只留一块
+    dup = once.replace("</body>", once[once.index("<!--AUTO_DESC_START-->"):once.index("</body>")] + "</body>")
+    assert dup.count("AUTO_DESC_START") == 2
+    fixed = inject_auto_desc(dup, "<p>desc</p>")
+    assert fixed.count("AUTO_DESC_START") == 1
+    assert inject_auto_desc(fixed, "<p>desc</p>") == fixed
+
+def test_inserted_blocks_survive_bs4_reserialization():
+    from bs4 import BeautifulSoup
+    rg = nb_regions.Regions(PAGE.replace("</p>", "</p>\n\n"))
+    rg.set("SEO-TEXT", "<p>a &amp; b</p>", at=rg.body_close, sep="\n")
+    rg.set("SEO-RELATED", RELATED, at=rg.body_close, sep="\n")
+    html = rg.render()
+    # 两块插在同一位置、原页面尾部自带空行：和 sep 连成的空白都并成一个换行，与 bs4 的输出一致
+    assert "\n\n" not in html
+    assert str(BeautifulSoup(html, "html.parser")) == html
+    desc = inject_auto_desc(html, "<p>x</p>")
+    assert str(BeautifulSoup(desc, "html.parser")) == desc
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""预编译模板与旧的 BeautifulSoup 流程（2222.render_detail_dom）逐字节一致；带 < > " & 的值退回 DOM 流程。"""
+import json
+from pathlib import Path
+import pytest
+from conftest import load_script
+from page_templates import needs_dom
+
+ADS = [
+    '<script async="async" src="https://a.example.com/jads.js" type="text/javascript"></script>\n'
+    '<ins class="eas6a97888e" data-zoneid="5012345"></ins>\n'
+    '<script>(AdProvider = window.AdProvider || []).push({"serve": {}});</script>',
+    '<div class="ad-bottom" style="text-align:center"><a href="https://x.example.com/?a=1&b=2">ad</a></div>',
+]
+
+ORDINARY = ["sunset beach", "Soft Light Portrait", "it's a café", "50% off look", "über naïve style",
+            "rock & roll", "AT & T", "a+b=c", "#hashtag", ""]
+SPECIAL = ["a < b", "x > y", 'say "hi"', "&amp; co", "caf&eacute;", "&#39;quoted", "<b>bold</b>"]
+
+@pytest.fixture(scope="module")
+def pages(tmp_path_factory):
+    site = tmp_path_factory.mktemp("tpl")
+    with open(site / "config.json", "w", encoding="utf-8") as f:
+        json.dump({"domain": "https://example.com/", "site_name": "Tom & Jerry Gallery", "ads_code": ADS}, f)
+    mp = pytest.MonkeyPatch()
+    mp.chdir(site)
+    try:
+        yield load_script("pages_2222_tpl", "2222.py")
+    finally:
+        mp.undo()
+
+def _args(mod, kw, cat="bedroom", img="20250101_000000_01.jpg", prev="", next="20250101_000037_01", page_no=3):
+    return (cat, img, img.rsplit(".", 1)[0], kw, mod.generate_description(kw), mod.generate_paragraph(kw),
+            prev, next, page_no)
+
+@pytest.mark.parametrize("kw", ORDINARY)
+def test_detail_matches_dom_flow(pages, kw):
+    tpl = pages.templates()
+    for prev, nxt in (("", "b"), ("a", "b"), ("a", ""), ("", "")):
+        args = _args(pages, kw, prev=prev, next=nxt)
+        assert not tpl.detail_needs_dom(args[0], args[1], kw)
+        assert tpl.detail(*args) == pages.render_detail_dom(args)
+
+@pytest.mark.parametrize("kw", SPECIAL)
+def test_special_values_fall_back_to_dom(pages, kw):
+    tpl = pages.templates()
+    args = _args(pages, kw)
+    assert tpl.detail_needs_dom(args[0], args[1], kw)
+    assert pages.render_detail(tpl, args[0], Path(args[1]), kw, args[6], args[7], args[8]) == pages.render_detail_dom(args)
+
+def test_special_file_and_dir_names_fall_back(pages):
+    tpl = pages.templates()
+    assert not tpl.detail_needs_dom("r & b", "p&1.jpg", "kw")       # 不像实体的 & 模板自己转义
+    assert tpl.detail_needs_dom("a&b", "x.jpg", "kw")               # &b 像实体，bs4 会当实体解析
+    assert tpl.detail_needs_dom("cat", 'x"y.jpg', "kw")
+    assert tpl.detail_needs_dom("c<t", "x.jpg", "kw")
+    args = ("r & b", "p&1.jpg", "p&1", "kw", "d", "para", "p&0", "", 1)
+    assert tpl.detail(*args) == pages.render_detail_dom(args)
+    assert needs_dom("&x") and needs_dom("&#1") and not needs_dom("& x", "a&")
+
+def _old_category_page(cat, page, total_pages, imgs):
+    """拆模板之前 2222.py 写分类页的原样代码（page 从 0 开始）。"""
+    desc = f"Browse {cat} images. Page {page+1} of curated {cat}-style portrait collection."
+    out = [f'<html><head><title>{cat.capitalize()} - Page {page+1}</title><meta name="description" content="{desc}"></head><body>',
+           f'<h1>{cat.capitalize()} Gallery - Page {page+1}</h1><p>{desc}</p>']
+    for stem, name in imgs:
+        out.append(f'<a href="{stem}.html"><img src="{name}" width="200"></a>\n')
+    out.append('<div style="margin-top:20px">')
+    if page > 0:
+        out.append(f'<a href="page{page}.html">Previous</a> ')
+    out.append('<a href="../index.html">Home</a> ')
+    if page < total_pages - 1:
+        out.append(f'<a href="page{page+2}.html">Next</a>')
+    out.append('</div></body></html>')
+    return "".join(out)
+
+@pytest.mark.parametrize("cat", ["bedroom", "dark mirror", "r&b"])
+def test_category_page_matches_old_flow(pages, cat):
+    tpl = pages.templates()
+    items = [(f"2025010{i}_000000_01", f"2025010{i}_000000_01.jpg") for i in range(5)]
+    for total in (1, 3):
+        for page in range(total):
+            assert tpl.category_page(cat, page + 1, total, items) == _old_category_page(cat, page, total, items)
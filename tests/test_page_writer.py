@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""PageWriter：正常提交 / 演练 / 提交中途崩溃后下次启动前滚补完。"""
+import os, sys, subprocess
+from conftest import ROOT, write_page
+import page_writer
+from page_writer import PageWriter, STAGING_DIR
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def _site(root, n=4):
+    return [write_page(root, f"cat/p{i}.html", body=f"old{i}") for i in range(n)]
+
+def test_commit_replaces_and_removes(tmp_path):
+    root = str(tmp_path)
+    a, b, c, d = _site(root)
+    with PageWriter(root, stage="test") as pw:
+        assert pw.write(a, "new-a")
+        assert not pw.write(b, _read(b))                 # 内容没变：跳过
+        pw.write(c, "first")
+        pw.write(c, "second")                             # 同一页后写的为准
+        pw.remove(d)
+        pw.write(os.path.join(root, "cat", "..", "cat", "p0.html"), "new-a2")   # 同一页换个写法
+        assert "old0" in _read(a)                        # 提交前原页面不动
+    assert _read(a) == "new-a2" and _read(c) == "second"
+    assert not os.path.exists(d)
+    assert pw.stats == {"written": 2, "unchanged": 1, "removed": 1}
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
+
+def test_dry_run_touches_nothing(tmp_path, capsys):
+    root = str(tmp_path)
+    a, b, _, _ = _site(root)
+    before = os.stat(a).st_mtime_ns
+    with PageWriter(root, stage="test", dry_run=True) as pw:
+        assert pw.write(a, "new")
+        pw.remove(b)
+    assert "old0" in _read(a) and os.path.exists(b)
+    assert os.stat(a).st_mtime_ns == before
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
+    assert "[DRY] would write:" in capsys.readouterr().out
+
+def test_exception_aborts(tmp_path):
+    root = str(tmp_path)
+    a = _site(root)[0]
+    try:
+        with PageWriter(root, stage="test") as pw:
+            pw.write(a, "new")
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert "old0" in _read(a)
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
+
+CRASH = r"""
+import os, sys
+sys.path.insert(0, {root!r})
+import page_writer
+from page_writer import PageWriter
+site, after = sys.argv[1], int(sys.argv[2])
+pages = [os.path.join(site, "cat", f"p{{i}}.html") for i in range(4)]
+real, done = os.replace, [0]
+def replace(a, b):
+    # 提交点（commit.tsv）之后换到第 after 个页面时进程直接死掉
+    if b.endswith(".html"):
+        if done[0] == after: os._exit(3)
+        done[0] += 1
+    real(a, b)
+page_writer.os.replace = replace
+pw = PageWriter(site, stage="crash")
+for i, p in enumerate(pages): pw.write(p, f"new{{i}}")
+pw.remove(pages[3])
+if after < 0: os._exit(3)          # 还没 commit 就死掉
+pw.commit()
+"""
+
+def _crash(root, after):
+    r = subprocess.run([sys.executable, "-c", CRASH.format(root=ROOT), root, str(after)])
+    assert r.returncode == 3
+
+def test_crash_mid_commit_rolls_forward(tmp_path):
+    root = str(tmp_path)
+    pages = _site(root)
+    _crash(root, 2)
+    assert [_read(p) for p in pages[:2]] == ["new0", "new1"]
+    assert "old2" in _read(pages[2])                  # 提交到一半：站点处于半新半旧
+    assert page_writer.recover_staging(root) == 1
+    assert [_read(p) for p in pages[:3]] == ["new0", "new1", "new2"]
+    assert not os.path.exists(pages[3])
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
+    assert page_writer.recover_staging(root) == 0
+
+def test_crash_before_commit_keeps_old_pages(tmp_path):
+    root = str(tmp_path)
+    pages = _site(root)
+    _crash(root, -1)
+    assert os.path.isdir(os.path.join(root, STAGING_DIR))
+    with PageWriter(root, stage="next"):             # 下次启动顺手清掉
+        pass
+    assert all(f"old{i}" in _read(p) for i, p in enumerate(pages))
+    assert not os.path.exists(os.path.join(root, STAGING_DIR))
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""2222.py：--workers N 与串行输出逐字节一致；增量清单只重渲染受影响的页面。"""
+import os, sys, json, shutil, subprocess
+import pytest
+from conftest import ROOT, load_script
+
+CATS = {"bedroom": 45, "dark": 61, "office": 5}
+PAGES = sum(CATS.values()) + sum(-(-n // 20) for n in CATS.values())     # 详情页 + 列表页
+ADS = ['<script async="async" src="https://a.example.com/jads.js"></script>\n<ins class="z" data-zoneid="1"></ins>']
+
+def make_site(root):
+    os.makedirs(os.path.join(root, "keywords"))
+    with open(os.path.join(root, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"domain": "https://example.com", "site_name": "Gallery", "ads_code": ADS}, f)
+    for ci, (cat, n) in enumerate(CATS.items()):
+        os.makedirs(os.path.join(root, cat))
+        for i in range(n):
+            with open(os.path.join(root, cat, f"20250101_{i:06d}_{ci + 1:02d}.jpg"), "wb") as f:
+                f.write(b"\xff\xd8" + f"{cat}{i}".encode() + b"\xff\xd9")
+        # 关键词比图片少几个（剩下的回落到分类名），夹几个要走 DOM 兜底的
+        kws = [f"{cat} look {i}" for i in range(n - 3)]
+        kws[1:3] = [f'{cat} "quoted"', f"{cat} & more"]
+        with open(os.path.join(root, "keywords", f"{cat}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(kws) + "\n")
+    return root
+
+def run_2222(site, *args):
+    r = subprocess.run([sys.executable, os.path.join(ROOT, "2222.py")] + list(args), cwd=site,
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert r.returncode == 0, r.stdout.decode("utf-8", "ignore")
+
+def snapshot(site):
+    out = {}
+    for d, dirs, files in os.walk(site):
+        dirs[:] = [x for x in dirs if x != "logs"]
+        for n in files:
+            if n.endswith(".html") or n == "robots.txt":
+                p = os.path.join(d, n)
+                with open(p, "rb") as f:
+                    out[os.path.relpath(p, site).replace(os.sep, "/")] = f.read()
+    return out
+
+def manifest_pages(site):
+    with open(os.path.join(site, ".nb_gen_manifest.json"), encoding="utf-8") as f:
+        return json.load(f)["pages"]
+
+def test_workers_output_is_byte_identical(tmp_path):
+    base = make_site(str(tmp_path / "base"))
+    seq, par = str(tmp_path / "seq"), str(tmp_path / "par")
+    shutil.copytree(base, seq)
+    shutil.copytree(base, par)
+    run_2222(seq, "--workers", "1")
+    run_2222(par, "--workers", "2")
+    a, b = snapshot(seq), snapshot(par)
+    assert len(a) == PAGES + 1          # + robots.txt
+    assert a == b
+    assert manifest_pages(seq) == manifest_pages(par)
+
+# ===== 增量清单 =====
+@pytest.fixture
+def gen(tmp_path, monkeypatch):
+    """在临时站点里导入 2222.py（它在导入时读 cwd 的 config.json）；run() 返回本轮写了哪些页面。"""
+    site = make_site(str(tmp_path / "site"))
+    monkeypatch.chdir(site)
+    mod = load_script("pages_2222_inc", "2222.py")
+    written = []
+    real = mod.write_page
+    monkeypatch.setattr(mod, "write_page", lambda path, text: (written.append(str(path)), real(path, text)))
+
+    def run(**kw):
+        del written[:]
+        mod.generate_pages_and_images(**kw)
+        return sorted(written)
+    run.mod = mod
+    return run
+
+def _img(cat, i, ci):
+    return os.path.join(cat, f"20250101_{i:06d}_{ci:02d}.jpg")
+
+def test_unchanged_rerun_writes_nothing(gen):
+    first = gen()
+    assert len(first) == PAGES
+    assert gen() == []
+    assert len(gen(full=True)) == len(first)
+
+def test_changed_image_or_keyword_rerenders_only_that_page(gen):
+    gen()
+    with open(_img("bedroom", 7, 1), "ab") as f:
+        f.write(b"more")
+    assert gen() == ["bedroom/20250101_000007_01.html"]
+    path = os.path.join("keywords", "dark.txt")
+    with open(path, encoding="utf-8") as f:
+        kws = f.read().splitlines()
+    kws[30] = "brand new keyword"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(kws) + "\n")
+    # 关键词只进本页，上下页链接用的是文件名，列表页也不含关键词
+    assert gen() == ["dark/20250101_000030_02.html"]
+
+def test_new_image_rerenders_neighbours_and_listing(gen):
+    gen()
+    with open(_img("bedroom", 45, 1), "wb") as f:      # 排在最后：第 3 页（原来 5 张）多一张
+        f.write(b"new")
+    assert gen() == ["bedroom/20250101_000044_01.html",     # 上一张：多了 Next 链接
+                     "bedroom/20250101_000045_01.html",     # 新图
+                     "bedroom/page3.html"]
+    with open(os.path.join("bedroom", "20250101_000044_01.html"), encoding="utf-8") as f:
+        assert 'href="20250101_000045_01.html">Next' in f.read()
+
+def test_render_key_change_rerenders_everything(gen):
+    first = gen()
+    gen.mod.config["ads_code"] = ADS + ['<div class="ad2">x</div>']
+    gen.mod._TPL = None
+    assert gen() == first
+    assert gen() == []
+    gen.mod.domain = "https://other.example.com"
+    gen.mod._TPL = None
+    assert len(gen()) == len(first)
+
+def test_deleted_image_drops_manifest_entry(gen):
+    gen()
+    os.remove(_img("office", 4, 3))
+    written = gen()
+    assert written == ["office/20250101_000003_03.html", "office/page1.html"]
+    with open(gen.mod.MANIFEST, encoding="utf-8") as f:
+        m = json.load(f)
+    assert "office/20250101_000004_03.jpg" not in m["images"]
+    assert "office/20250101_000004_03.html" not in m["pages"]
+    assert "office/20250101_000003_03.jpg" in m["images"]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""patch_nb_variants：重跑不改页面；目录里多一个页面时，只有少数同目录页面的模块跟着变。"""
+import os, sys, shutil, subprocess
+import pytest
+from conftest import ROOT
+import nb_bench
+
+PAGES = 600          # 6 个分类目录，每个约 100 个详情页
+
+def _run(site):
+    r = subprocess.run([sys.executable, os.path.join(ROOT, "patch_nb_variants.py"), "--site-root", site],
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert r.returncode == 0, r.stdout.decode("utf-8", "ignore")
+
+def _snapshot(site):
+    out = {}
+    for d, dirs, files in os.walk(site):
+        dirs[:] = [x for x in dirs if not x.startswith(".") and x != "logs"]
+        for n in files:
+            if n.endswith(".html"):
+                p = os.path.join(d, n)
+                with open(p, "rb") as f:
+                    out[os.path.relpath(p, site).replace(os.sep, "/")] = f.read()
+    return out
+
+@pytest.fixture(scope="module")
+def patched(tmp_path_factory):
+    site = str(tmp_path_factory.mktemp("variants") / "site")
+    nb_bench.synth_site(site, PAGES, seed=5)
+    _run(site)
+    return site
+
+def test_rerun_changes_nothing(patched):
+    before = _snapshot(patched)
+    assert sum(b"nb-box" in v for v in before.values()) > PAGES // 2
+    _run(patched)
+    assert _snapshot(patched) == before
+
+def test_new_page_rewrites_few_pages(patched, tmp_path):
+    site = str(tmp_path / "site")
+    shutil.copytree(patched, site)
+    before = _snapshot(site)
+    cat = "bedroom"
+    details = sorted(n for n in before if n.startswith(cat + "/2025"))
+    shutil.copy(os.path.join(site, details[0]), os.path.join(site, cat, "20991231_235959_01.html"))
+    _run(site)
+    after = _snapshot(site)
+    changed = [n for n in before if before[n] != after[n]]
+    assert all(n.startswith(cat + "/") for n in changed)
+    # 每页取 20 个链接，约 100 页的目录里新页面只会排进约 20% 页面的前 20 名；按目录下标抽样时超过一半
+    assert len(changed) <= len(details) // 4
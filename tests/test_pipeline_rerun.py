@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""按流水线顺序（广告 → seo_fixer → v4_patch → nb 模块 → 关键词描述）跑两遍：第二遍哪个阶段都不改页面。"""
+import os, sys, json, glob, subprocess
+from conftest import ROOT
+import nb_bench
+
+PAGES = 300
+
+def _stages(site):
+    return [
+        ("ads_apply_all", ["ads_apply_all.py"]),
+        ("seo_fixer_v4", ["seo_fixer_v4.py", "--root", site]),
+        ("v4_patch_single_site", ["v4_patch_single_site.py", "--root", site, "--brand", "Bench"]),
+        ("patch_nb_variants", ["patch_nb_variants.py", "--site-root", site]),
+        ("kw_persist_and_fill", ["kw_persist_and_fill.py", "--root", site,
+                                 "--pool", os.path.join("keywords", "selected.txt"),
+                                 "--global-used", os.path.join(site, "used_global.txt")]),
+    ]
+
+def _run(site, run_id):
+    """依次跑各阶段，返回 {阶段: files_written}。"""
+    written = {}
+    for stage, args in _stages(site):
+        r = subprocess.run([sys.executable, os.path.join(ROOT, args[0])] + args[1:], cwd=site,
+                           env=dict(os.environ, NB_RUN_ID=run_id), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        assert r.returncode == 0, (stage, r.stdout.decode("utf-8", "ignore"))
+        with open(os.path.join(site, "logs", "metrics", run_id, f"{stage}.json"), encoding="utf-8") as f:
+            written[stage] = json.load(f)["counters"].get("files_written", 0)
+    return written
+
+def _pages(site):
+    out = {}
+    for p in glob.glob(os.path.join(site, "**", "*.html"), recursive=True):
+        with open(p, "rb") as f:
+            out[os.path.relpath(p, site)] = f.read()
+    return out
+
+def test_second_pipeline_run_changes_nothing(tmp_path):
+    site = str(tmp_path / "site")
+    nb_bench.synth_site(site, PAGES, seed=11)
+    first = _run(site, "r1")
+    assert all(first.values()), first
+    before = _pages(site)
+    second = _run(site, "r2")
+    changed = sorted(k for k, v in _pages(site).items() if before.get(k) != v)
+    assert not changed, (second, changed[:5])
+    assert not any(second.values()), second
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import os, sys, subprocess
+import pytest
+from conftest import ROOT
+
+@pytest.mark.parametrize("how", ["flag", "env"])
+def test_inject_keywords_profiles_like_other_stages(tmp_path, how):
+    env = dict(os.environ)
+    args = [sys.executable, os.path.join(ROOT, "inject_keywords.py"), "--workers", "1", "--profile-dir", "prof"]
+    if how == "flag":
+        args += ["--profile", "sample"]
+    else:
+        env["NB_PROFILE"] = "sample"
+    r = subprocess.run(args, cwd=str(tmp_path), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert r.returncode == 0, r.stdout.decode("utf-8", "ignore")
+    assert sorted(os.listdir(tmp_path / "prof")) == ["inject_keywords.collapsed", "inject_keywords.txt"]
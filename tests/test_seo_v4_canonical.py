@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""seo_fixer_v4 与 v4_patch 写的 canonical / JSON-LD url 一致（domain/相对路径），第二轮 v4 全部走预检跳过。"""
+import os, sys, json, glob, subprocess
+from bs4 import BeautifulSoup
+from conftest import ROOT
+import nb_bench, nb_regions
+
+DOMAIN = "https://bench.example.com"
+
+def _stage(site, script, run_id, *args):
+    r = subprocess.run([sys.executable, os.path.join(ROOT, script)] + list(args), cwd=site,
+                       env=dict(os.environ, NB_RUN_ID=run_id), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert r.returncode == 0, r.stdout.decode("utf-8", "ignore")
+    path, = glob.glob(os.path.join(site, "logs", "metrics", run_id, "*.json"))
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["counters"]
+
+def test_v4_skips_pages_after_seo_fixer(tmp_path):
+    site = str(tmp_path / "site")
+    pages = nb_bench.synth_site(site, 200, seed=2)
+    for n in (1, 2):
+        _stage(site, "seo_fixer_v4.py", f"seo{n}", "--root", site)
+        v4 = _stage(site, "v4_patch_single_site.py", f"v4_{n}", "--root", site, "--brand", "Bench")
+    # 第二轮：seo_fixer 不再把 canonical 改回 domain/文件名，v4 也就没什么要修的
+    assert v4.get("prescan_skip") == pages
+    assert not v4.get("files_written")
+
+    rel = "bedroom/page1.html"
+    with open(os.path.join(site, rel), encoding="utf-8") as f:
+        soup = BeautifulSoup(f.read(), "html.parser")
+    canons = soup.find_all("link", {"rel": "canonical"})
+    assert [c["href"] for c in canons] == [f"{DOMAIN}/{rel}"]
+    lds = [json.loads(s.string) for s in soup.find_all("script", {"type": "application/ld+json"})]
+    assert [o["url"] for o in lds] == [f"{DOMAIN}/{rel}"]
+
+def _related(html):
+    rg = nb_regions.Regions(html)
+    return rg.content(rg.get("SEO-RELATED"))
+
+def test_fallback_links_resolve_and_rerun_is_stable(tmp_path):
+    site = str(tmp_path / "site")
+    nb_bench.synth_site(site, 120, seed=5)
+    first = _stage(site, "seo_fixer_v4.py", "seo1", "--root", site)
+    assert first.get("files_written")
+    with open(os.path.join(site, "index.html"), encoding="utf-8") as f:
+        index = f.read()
+    # 根目录没有同目录页面，内链跨目录抽：href 要带上目录，且都指向真实文件
+    hrefs = [a["href"] for a in BeautifulSoup(index, "html.parser").select("div a") if "/" in a["href"]]
+    assert hrefs and all(os.path.isfile(os.path.join(site, h)) for h in hrefs)
+
+    _stage(site, "seo_fixer_v4.py", "seo2", "--root", site)
+    with open(os.path.join(site, "index.html"), encoding="utf-8") as f:
+        rerun = f.read()
+    assert _related(rerun) == _related(index)       # 链接都还在，不再每轮随机换一批
+    assert rerun == index                           # 两块插在同一处也不留 bs4 下一轮会并掉的空行
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+惰性遍历的内存不随全站页数增长：同样形状的子站 1 份（1 万页）和 10 份（10 万页）各走一遍，
+峰值内存（tracemalloc 峰值 + 子进程 ru_maxrss）应基本持平。单目录大小两边相同，只有总页数不同。
+"""
+import os, sys, json, subprocess
+import pytest
+from conftest import ROOT
+import nb_bench
+
+resource = pytest.importorskip("resource")
+
+SUB_PAGES = 10000
+
+# 模拟 patch_nb_variants 的访问方式：iter_pages 流式走全站，每页取同目录列表，外加一次蓄水池抽样
+WALK = r'''
+import os, sys, json, random, resource, tracemalloc
+sys.path.insert(0, sys.argv[1])
+from site_scan import iter_pages, DirPages, sample_pages
+root = sys.argv[2]
+tracemalloc.start()
+dp = DirPages(root)
+n = 0
+for e in iter_pages(root):
+    dp.get(os.path.dirname(e.rel))
+    n += 1
+sample_pages(root, 50, random.Random(1))
+peak = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+print(json.dumps({"pages": n, "peak": peak, "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+'''
+
+def _walk(root):
+    r = subprocess.run([sys.executable, "-c", WALK, ROOT, root], stdout=subprocess.PIPE, check=True)
+    return json.loads(r.stdout)
+
+@pytest.fixture(scope="module")
+def trees(tmp_path_factory):
+    base = tmp_path_factory.mktemp("walk")
+    small, large = str(base / "small"), str(base / "large")
+    nb_bench.synth_site(os.path.join(small, "site_0"), SUB_PAGES, seed=1)
+    for i in range(10):
+        nb_bench.synth_site(os.path.join(large, f"site_{i}"), SUB_PAGES, seed=i + 1)
+    return small, large
+
+def test_lazy_walk_memory_is_flat(trees):
+    small, large = _walk(trees[0]), _walk(trees[1])
+    assert large["pages"] >= 10 * SUB_PAGES
+    assert large["pages"] == 10 * small["pages"]
+    # 10 倍页数，Python 堆峰值增长不超过 25%（+64KB 余量），常驻内存增长不超过 4MB
+    assert large["peak"] <= small["peak"] * 1.25 + 64 * 1024, (small, large)
+    assert large["rss_kb"] - small["rss_kb"] <= 4 * 1024, (small, large)
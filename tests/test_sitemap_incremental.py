@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os, json, gzip
+from conftest import load_script, write_page
+import sitemap_fix
+from sitemap_fix import update_sitemaps, write_sitemaps, INDEX_NAME
+
+DOMAIN = "https://example.com"
+
+def _site(tmp_path):
+    root = str(tmp_path)
+    with open(os.path.join(root, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"domain": DOMAIN}, f)
+    write_page(root, "index.html")
+    write_page(root, "about.html")
+    for cat in ("bedroom", "dark"):
+        write_page(root, f"{cat}/page1.html")
+        write_page(root, f"{cat}/20250817_090303_01.html")
+    return root
+
+def _locs(root):
+    out = set()
+    for name in os.listdir(root):
+        if sitemap_fix.SHARD_RE.match(name):
+            with gzip.open(os.path.join(root, name), "rt", encoding="utf-8") as f:
+                out.update(l.strip()[5:-6] for l in f if l.strip().startswith("<loc>"))
+    return out
+
+def _snapshot(root):
+    return {n: open(os.path.join(root, n), "rb").read() for n in sorted(os.listdir(root))
+            if sitemap_fix.SHARD_RE.match(n) or n == INDEX_NAME}
+
+def test_second_run_writes_nothing(tmp_path):
+    root = _site(tmp_path)
+    _, written = update_sitemaps(root, DOMAIN)
+    assert written == 1
+    before = _snapshot(root)
+    _, written = update_sitemaps(root, DOMAIN)
+    assert written == 0
+    assert _snapshot(root) == before
+
+def test_overwritten_shard_is_rewritten(tmp_path):
+    root = _site(tmp_path)
+    update_sitemaps(root, DOMAIN)
+    full = _snapshot(root)
+    # 别的脚本用无状态写法只写了分类目录，把分片覆盖掉
+    write_sitemaps(root, DOMAIN, [(f"{DOMAIN}/bedroom/page1.html", "2025-01-01")])
+    assert len(_locs(root)) == 1
+    _, written = update_sitemaps(root, DOMAIN)
+    assert written == 1
+    assert _snapshot(root) == full
+    assert f"{DOMAIN}/about.html" in _locs(root)
+
+def test_missing_index_is_rewritten(tmp_path):
+    root = _site(tmp_path)
+    update_sitemaps(root, DOMAIN)
+    full = _snapshot(root)
+    os.remove(os.path.join(root, INDEX_NAME))
+    update_sitemaps(root, DOMAIN)
+    assert _snapshot(root) == full
+
+def test_changed_page_rewrites_its_shard(tmp_path):
+    root = _site(tmp_path)
+    update_sitemaps(root, DOMAIN)
+    path = os.path.join(root, "about.html")
+    write_page(root, "about.html", body="changed")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    store, written = update_sitemaps(root, DOMAIN)
+    assert written == 1 and store.stats["changed"] == 1
+
+def test_2222_uses_incremental_store(tmp_path, monkeypatch):
+    root = _site(tmp_path)
+    monkeypatch.chdir(root)
+    mod = load_script("pages_2222", "2222.py")
+    mod.generate_sitemap()
+    locs = _locs(root)
+    # 根目录页面也在，不再只有分类目录
+    assert f"{DOMAIN}/about.html" in locs and f"{DOMAIN}/dark/page1.html" in locs
+    assert os.path.exists(os.path.join(root, sitemap_fix.STATE_FILE))
+    before = _snapshot(root)
+    _, written = update_sitemaps(root, DOMAIN)
+    assert written == 0 and _snapshot(root) == before
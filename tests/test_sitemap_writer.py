@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""SitemapWriter：按条数 / 字节数换片，index 按顺序列出全部分片，多余的旧分片清掉。"""
+import os, re, gzip
+from sitemap_fix import SitemapWriter, write_sitemaps, url_entry, INDEX_NAME, LEGACY_NAME, XML_HEAD, URLSET_OPEN, URLSET_CLOSE
+
+DOMAIN = "https://example.com"
+
+def _entries(n):
+    return [(f"{DOMAIN}/p{i:03d}.html", f"2025-01-{i % 28 + 1:02d}") for i in range(n)]
+
+def _read(root, name):
+    if name.endswith(".gz"):
+        with gzip.open(os.path.join(root, name), "rt", encoding="utf-8") as f:
+            return f.read()
+    with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+def _locs(text):
+    return re.findall(r"<loc>([^<]*)</loc>", text)
+
+def _index(root):
+    text = _read(root, INDEX_NAME)
+    return _locs(text), re.findall(r"<lastmod>([^<]*)</lastmod>", text)
+
+def test_rollover_at_max_urls(tmp_path):
+    root = str(tmp_path)
+    entries = _entries(7)
+    w = write_sitemaps(root, DOMAIN, entries, max_urls=3)
+    assert [n for n, _ in w.shards] == ["sitemap-1.xml.gz", "sitemap-2.xml.gz", "sitemap-3.xml.gz"]
+    assert w.total == 7
+    got = [_locs(_read(root, n)) for n, _ in w.shards]
+    assert [len(x) for x in got] == [3, 3, 1]
+    assert sum(got, []) == [loc for loc, _ in entries]
+    locs, lastmods = _index(root)
+    assert locs == [f"{DOMAIN}/sitemap-{i}.xml.gz" for i in (1, 2, 3)]
+    assert lastmods == [max(l for _, l in entries[i:i + 3]) for i in (0, 3, 6)]
+    assert not [n for n in os.listdir(root) if n.endswith(".tmp")]
+
+def test_rollover_at_max_bytes(tmp_path):
+    root = str(tmp_path)
+    entries = _entries(10)
+    one = len(url_entry(*entries[0]).encode("utf-8"))
+    frame = len((XML_HEAD + URLSET_OPEN + URLSET_CLOSE).encode("utf-8"))
+    limit = frame + 4 * one                    # 每片正好放得下 4 条
+    w = write_sitemaps(root, DOMAIN, entries, use_gzip=False, max_bytes=limit)
+    assert [n for n, _ in w.shards] == ["sitemap-1.xml", "sitemap-2.xml", "sitemap-3.xml"]
+    for name, _ in w.shards:
+        assert len(_read(root, name).encode("utf-8")) <= limit
+    assert [len(_locs(_read(root, n))) for n, _ in w.shards] == [4, 4, 2]
+    assert _index(root)[0] == [f"{DOMAIN}/{n}" for n, _ in w.shards]
+
+def test_fewer_shards_prunes_stale_and_legacy(tmp_path):
+    root = str(tmp_path)
+    write_sitemaps(root, DOMAIN, _entries(9), max_urls=3)
+    with open(os.path.join(root, LEGACY_NAME), "w", encoding="utf-8") as f:
+        f.write("<urlset/>")
+    write_sitemaps(root, DOMAIN, _entries(4), max_urls=3)
+    names = sorted(n for n in os.listdir(root) if n != INDEX_NAME)
+    assert names == ["sitemap-1.xml.gz", "sitemap-2.xml.gz"]
+    assert len(_index(root)[0]) == 2
+
+def test_failed_run_keeps_old_sitemap(tmp_path):
+    root = str(tmp_path)
+    write_sitemaps(root, DOMAIN, _entries(5), max_urls=3)
+    before = {n: _read(root, n) for n in os.listdir(root)}
+    try:
+        with SitemapWriter(root, DOMAIN, max_urls=3) as w:
+            for loc, last in _entries(8):
+                w.add(loc, last)
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert {n: _read(root, n) for n in os.listdir(root)} == before
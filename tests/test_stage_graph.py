@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""stage_graph：首轮全跑、重跑全跳过、输入 / 共用模块变了只跑受影响的阶段及下游、--force、失败必重跑。"""
+import os
+import pytest
+from stage_graph import Stage, StageGraph, StageState, local_modules
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+@pytest.fixture
+def env(tmp_path):
+    tools, site = str(tmp_path / "tools"), str(tmp_path / "site")
+    _write(os.path.join(tools, "helper.py"), "X = 1\n")
+    _write(os.path.join(tools, "util.py"), "import helper\n")
+    _write(os.path.join(tools, "a.py"), "from util import *\n")
+    _write(os.path.join(tools, "b.py"), "def main():\n    import json\n")
+    _write(os.path.join(tools, "c.py"), "")
+    _write(os.path.join(site, "config.json"), "{}")
+    _write(os.path.join(site, "out.txt"), "")
+    graph = StageGraph([Stage("a", "a.py", inputs=["config.json"]),
+                        Stage("b", "b.py", deps=["a"], outputs=["out.txt"]),
+                        Stage("c", "c.py", inputs=["extra/*.txt"])])
+    return tools, site, graph
+
+def _run(graph, site, tools, fail=(), **kw):
+    ran = []
+    def execute(st):
+        ran.append(st.name)
+        return {"status": "failed" if st.name in fail else "ok"}
+    reports = graph.run(site, execute, lambda s, st: os.path.join(tools, st.script), **kw)
+    return ran, {r["stage"]: r.get("reason", r["status"]) for r in reports}
+
+def _plan(graph, site, tools, **kw):
+    return dict(graph.plan(site, script_path=lambda s, st: os.path.join(tools, st.script), **kw))
+
+def test_local_modules_follow_imports(env):
+    tools, _, _ = env
+    names = lambda s: [os.path.basename(p) for p in local_modules(os.path.join(tools, s))]
+    assert names("a.py") == ["helper.py", "util.py"]
+    assert names("b.py") == []            # 标准库不算
+
+def test_plan_then_skip(env):
+    tools, site, graph = env
+    assert _plan(graph, site, tools) == {"a": "never-ran", "b": "never-ran", "c": "never-ran"}
+    ran, _ = _run(graph, site, tools)
+    assert ran == ["a", "b", "c"]
+    assert _plan(graph, site, tools) == {"a": None, "b": None, "c": None}
+    ran, reasons = _run(graph, site, tools)
+    assert ran == [] and set(reasons.values()) == {"up-to-date"}
+
+def test_inputs_changed_reruns_downstream(env):
+    tools, site, graph = env
+    _run(graph, site, tools)
+    _write(os.path.join(site, "config.json"), '{"domain": "x"}')
+    ran, reasons = _run(graph, site, tools)
+    assert ran == ["a", "b"]
+    assert reasons == {"a": "inputs-changed", "b": "upstream:a", "c": "up-to-date"}
+    _write(os.path.join(site, "extra", "n.txt"), "new")       # glob 新匹配到的文件
+    assert _run(graph, site, tools)[0] == ["c"]
+
+def test_shared_module_change_reruns_importers(env):
+    tools, site, graph = env
+    _run(graph, site, tools)
+    _write(os.path.join(tools, "helper.py"), "X = 2\n")
+    ran, reasons = _run(graph, site, tools)
+    assert ran == ["a", "b"] and reasons["a"] == "inputs-changed"
+    assert _run(graph, site, tools)[0] == []
+
+def test_force_and_selected(env):
+    tools, site, graph = env
+    _run(graph, site, tools)
+    ran, reasons = _run(graph, site, tools, force={"c"})
+    assert ran == ["c"] and reasons["c"] == "forced"
+    ran, _ = _run(graph, site, tools, force={"a"}, selected={"a"})
+    assert ran == ["a"]
+
+def test_failure_and_missing_outputs_rerun(env):
+    tools, site, graph = env
+    _run(graph, site, tools, fail={"b"})
+    assert "b" not in StageState(site).data["stages"]
+    ran, reasons = _run(graph, site, tools)
+    assert ran == ["b"] and reasons["b"] == "never-ran"
+    os.remove(os.path.join(site, "out.txt"))
+    ran, reasons = _run(graph, site, tools)
+    assert ran == ["b"] and reasons["b"] == "outputs-missing"
+
+def test_cycle_and_unknown_dep_rejected():
+    with pytest.raises(ValueError):
+        StageGraph([Stage("a", deps=["b"]), Stage("b", deps=["a"])])
+    with pytest.raises(ValueError):
+        StageGraph([Stage("a", deps=["nope"])])
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""nb_textgen 的输出必须与拆出来之前各脚本里的实现逐字节一致（否则已生成的页面会被整站改写）。"""
+import hashlib
+import nb_textgen as tg
+
+# 拆分前 v4_patch_single_site.gen_* 与 kw_persist_and_fill.seeded_random_text 在同一组输入上的输出摘要
+GOLDEN = "2f9f1dd449af03cb4cfd51c762804c0efcceb86a5cc5d28e7df6bd355203e39d"
+
+def test_output_matches_pre_refactor_golden():
+    h = hashlib.sha256()
+    for i in range(500):
+        kw = ["soft light", "dark mirror portrait", "a", "uniform office style look %d" % i][i % 4]
+        seed = f"/site/cat{i % 7}/2025010{i % 9}_00000{i % 10}_{i:02d}.html"
+        for v in (tg.title(kw, "Brand", seed, 45, 60), tg.desc(kw, seed, 130, 155), tg.para(kw, seed, 200, 300),
+                  tg.long_text(seed, kw, "category" if i % 3 == 0 else "image", 100, 180),
+                  tg.long_text(seed, kw, "image", 20, 40)):
+            h.update(v.encode("utf-8") + b"\0")
+    assert h.hexdigest() == GOLDEN
+
+def test_long_text_bounds_and_keyword():
+    for i in range(200):
+        text = tg.long_text(f"https://example.com/p{i}.html", "zebra print", "image", 100, 180)
+        assert "zebra print" in text.lower()
+        assert len(text.split()) >= 100
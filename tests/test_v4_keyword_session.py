@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""KeywordSession 与拆分前逐页读写 used_keywords.json 的 assign_primary_kw 分配结果一致；崩溃后日志回放不丢不重。"""
+import json, shutil
+from pathlib import Path
+import pytest
+import v4_patch_single_site as v4
+from v4_patch_single_site import KeywordSession
+
+# ===== 拆分前的实现（原样照抄，只作对照） =====
+def _old_pick_pool_for(rel_dir, kw_dir):
+    parts = [p.lower() for p in Path(rel_dir).parts if p not in (".", "")]
+    for name in reversed(parts):
+        f = kw_dir / f"{name}.txt"
+        if f.exists(): return v4._read_lines(f)
+    return v4._read_lines(kw_dir / "all.txt")
+
+def _old_save_used(kw_dir, used):
+    (kw_dir / "used_keywords.json").write_text(json.dumps(used, ensure_ascii=False, indent=2), encoding="utf-8")
+
+def old_assign_primary_kw(root_dir, abs_filepath):
+    kw_dir = root_dir / "keywords"
+    kw_dir.mkdir(exist_ok=True)
+    used = v4._load_used(kw_dir)
+    site_key = str(root_dir.resolve())
+    used.setdefault(site_key, {"map": {}, "used_set": []})
+    rel_path = str(abs_filepath.resolve().relative_to(root_dir.resolve()))
+    rel_dir = str(Path(rel_path).parent)
+    if rel_path in used[site_key]["map"]:
+        return used[site_key]["map"][rel_path]
+    pool = _old_pick_pool_for(rel_dir, kw_dir)
+    if not pool:
+        return None
+    r = v4._rng("kw::" + rel_path)
+    start = r.randrange(0, len(pool))
+    used_set = set(used[site_key]["used_set"])
+    pick = None
+    for i in range(len(pool)):
+        kw = pool[(start + i) % len(pool)]
+        if kw not in used_set: pick = kw; break
+    if pick is None: pick = pool[start % len(pool)]
+    used[site_key]["map"][rel_path] = pick
+    used[site_key]["used_set"].append(pick)
+    _old_save_used(kw_dir, used)
+    return pick
+
+# ===== 测试站点 =====
+def _site(root):
+    kw = root / "keywords"
+    kw.mkdir(parents=True)
+    # bedroom 词池有重复词、比页面少（会用完）；dark 没有自己的词池走 all.txt，与 bedroom 共用几个词
+    (kw / "bedroom.txt").write_text("\n".join(["soft", "warm", "soft", "linen", "lamp", "shared a", "pillow"]) + "\n",
+                                    encoding="utf-8")
+    (kw / "all.txt").write_text("\n".join(["shared a", "shared b", "night", "mirror"]) + "\n", encoding="utf-8")
+    (kw / "empty.txt").write_text("\n", encoding="utf-8")
+    pages = []
+    for i in range(12):
+        pages.append(root / "bedroom" / f"p{i}.html")
+        if i < 7: pages.append(root / "dark" / f"d{i}.html")
+    pages += [root / "bedroom" / "sub" / "x.html", root / "empty" / "e.html", root / "index.html"]
+    pages.insert(5, pages[2])                        # 已分配过的页面再来一次
+    return pages
+
+def _entry(root):
+    used = json.loads((root / "keywords" / "used_keywords.json").read_text(encoding="utf-8"))
+    return used[str(root.resolve())]
+
+@pytest.fixture
+def sites(tmp_path):
+    a, b = tmp_path / "old", tmp_path / "new"
+    pages_a, pages_b = _site(a), _site(b)
+    return (a, pages_a), (b, pages_b)
+
+def test_session_matches_old_assign(sites):
+    (a, pages_a), (b, pages_b) = sites
+    old = [old_assign_primary_kw(a, p) for p in pages_a]
+    with KeywordSession(b, flush_every=4) as kws:
+        new = [kws.assign(p) for p in pages_b]
+    assert new == old
+    assert None in old and len(set(k for k in old if k)) == 9      # 池子用完后开始复用
+    assert _entry(b) == _entry(a)
+    assert not (b / "keywords" / KeywordSession.JOURNAL).exists()
+    # 第二轮：全部命中已有分配
+    with KeywordSession(b) as kws:
+        assert [kws.assign(p) for p in pages_b] == old
+
+def _crash(kws):
+    """模拟进程被杀：日志已经逐行 flush，占用表没来得及整表写回。"""
+    kws._journal.close()
+    kws._journal = None
+
+def test_journal_replay_after_crash(sites):
+    (a, pages_a), (b, pages_b) = sites
+    expected = [old_assign_primary_kw(a, p) for p in pages_a]
+
+    kws = KeywordSession(b, flush_every=5)
+    first = [kws.assign(p) for p in pages_b[:8]]       # 7 次新分配（有一页重复）：前 5 条落过盘，后 2 条只在日志里
+    _crash(kws)
+    journal = b / "keywords" / KeywordSession.JOURNAL
+    assert len(journal.read_text(encoding="utf-8").splitlines()) == 2
+    with journal.open("a", encoding="utf-8") as f:
+        f.write('{"site": "' + str(b.resolve()))      # 崩溃时写了半行
+    assert len(_entry(b)["map"]) == 5
+
+    with KeywordSession(b, flush_every=5) as kws:
+        assert not journal.exists()                     # 打开时已回放并落盘
+        assert len(_entry(b)["map"]) == 7
+        rest = [kws.assign(p) for p in pages_b]
+    assert first + rest[8:] == expected
+    assert rest[:8] == first
+    assert _entry(b) == _entry(a)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""快速预检路径与全量 DOM 路径逐字节一致：同一批页面各跑一遍 main()，输出必须完全相同。"""
+import os, sys, json, shutil
+import pytest
+from bs4 import BeautifulSoup
+import v4_patch_single_site as v4
+
+DOMAIN = "https://example.com"
+TITLE = "Soft evening light portrait gallery for quiet bedroom moods"
+DESC = ("Soft evening light portrait gallery with calm bedroom tones, vintage lace, warm window light "
+        "and natural poses for a quiet mood.")
+BODY = ("This portrait highlights the theme of soft evening light, combining aesthetic elements, lighting, "
+        "and emotional resonance. Visitors often appreciate unique imagery, artistic expression, and refined taste.")
+
+def _page(rel, title=TITLE, desc=DESC, body=BODY, canon=None, ld_url=None, raw=False, doctype=False):
+    url = f"{DOMAIN}/{rel}"
+    canon = url if canon is None else canon
+    ld_url = url if ld_url is None else ld_url
+    ld = json.dumps({"@context": "https://schema.org", "@type": "WebPage", "name": "x", "url": ld_url})
+    html = (f'<html><head><title>{title}</title><meta content="{desc}" name="description"/>'
+            f'<link href="{canon}" rel="canonical"/><script type="application/ld+json">{ld}</script></head>'
+            f'<body><h1>soft evening light</h1><p>{body}</p></body></html>')
+    if not raw:
+        html = str(BeautifulSoup(html, "html.parser"))   # 页面本身就是 bs4 定型输出
+    return ("<!DOCTYPE html>" if doctype else "") + html
+
+def _fixture(root):
+    pages = {
+        "bedroom/ok.html": _page("bedroom/ok.html"),
+        "bedroom/doctype.html": _page("bedroom/doctype.html", doctype=True),
+        "bedroom/doctype_bs4.html": _page("bedroom/doctype_bs4.html", doctype=True).replace(
+            "<!DOCTYPE html>", "<!DOCTYPE html>\n\n"),
+        "bedroom/short_title.html": _page("bedroom/short_title.html", title="Too short"),
+        "bedroom/short_desc.html": _page("bedroom/short_desc.html", desc="short"),
+        "bedroom/short_body.html": _page("bedroom/short_body.html", body="tiny"),
+        "bedroom/wrong_canon.html": _page("bedroom/wrong_canon.html", canon=f"{DOMAIN}/old.html"),
+        "bedroom/wrong_ld.html": _page("bedroom/wrong_ld.html", ld_url=f"{DOMAIN}/old.html"),
+        "bedroom/amp_title.html": _page("bedroom/amp_title.html", title=TITLE.replace(" for ", " &amp; ")),
+        "bedroom/nbsp.html": _page("bedroom/nbsp.html", body=BODY.replace(" ", "&nbsp;", 3), raw=True),
+        "bedroom/raw.html": _page("bedroom/raw.html", raw=True).replace("<title>", "<TITLE>").replace("</title>", "</TITLE>"),
+        "dark/comment_title.html": _page("dark/comment_title.html").replace(
+            f"<title>{TITLE}</title>", f"<title>{TITLE}<!--x--></title>"),
+        "dark/comment_body.html": _page("dark/comment_body.html").replace("<h1>", "<!-- note --><h1>"),
+        "dark/attr_order.html": _page("dark/attr_order.html", raw=True).replace(
+            '<link href="', '<link rel="canonical" data-x="1" href="').replace(' rel="canonical"/>', "/>", 1),
+        "index.html": _page("index.html"),
+    }
+    with open(os.path.join(root, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"domain": DOMAIN}, f)
+    for rel, html in pages.items():
+        p = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p, "w", encoding="utf-8") as f:
+            f.write(html)
+    return sorted(pages)
+
+def _run(root, monkeypatch, dom_only):
+    """返回走了快速路径（没进 DOM）的页数。"""
+    skipped = []
+    real = v4.is_compliant
+    def check(info, expected):
+        ok = not dom_only and real(info, expected)
+        skipped.append(ok)
+        return ok
+    with monkeypatch.context() as m:
+        m.setattr(v4, "is_compliant", check)
+        m.setattr(sys, "argv", ["v4_patch_single_site.py", "--root", root, "--brand", "Brand"])
+        v4.main()
+    return sum(skipped)
+
+def _read(root, rels):
+    out = {}
+    for rel in rels:
+        with open(os.path.join(root, rel), "rb") as f:
+            out[rel] = f.read()
+    return out
+
+def test_fast_path_matches_dom_path(tmp_path, monkeypatch):
+    # 文案按页面绝对路径取种子，两条路径在同一个目录上各跑一遍
+    root = str(tmp_path / "site")
+    out = {}
+    for dom_only in (False, True):
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        rels = _fixture(root)
+        fast = _run(root, monkeypatch, dom_only)
+        out[dom_only] = _read(root, rels)
+        if not dom_only:
+            assert fast >= 4     # ok / doctype_bs4 / amp_title / comment_body / index 不进 DOM
+    assert out[False] == out[True]
+
+def test_comment_in_title_is_not_compliant():
+    html = _page("dark/a.html").replace(f"<title>{TITLE}</title>", f"<title>{TITLE}<!--x--></title>")
+    assert v4.prescan(html) is None
+    info = v4.prescan(_page("dark/a.html"))
+    assert v4.is_compliant(info, f"{DOMAIN}/dark/a.html")
+
+def test_domain_is_read_once(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    _fixture(root)
+    calls = []
+    real = v4._read_domain
+    monkeypatch.setattr(v4, "_read_domain", lambda r: calls.append(r) or real(r))
+    _run(root, monkeypatch, dom_only=True)
+    assert len(calls) == 1
@@ -4,43 +4,21 @@
 # 2) 无论是否修内容，都把 canonical 和 JSON-LD 的 url 修正为：domain/相对路径（从 config.json 读取）
 # 不做：生成/修改 sitemap、不做 ping、不做上传
 
-import argparse, re, json, hashlib, random, sys
+import argparse, re, os, json, bisect, sys
 from pathlib import Path
 from bs4 import BeautifulSoup
+from site_scan import iter_pages
+from page_writer import PageWriter
+import nb_metrics, nb_profile
+import nb_textgen as tg
 
 # ===== 可调阈值 =====
 TARGET_TITLE = (45, 60)
 TARGET_DESC  = (130, 155)
 MIN_BODY     = 200
 
-# ===== 槽位词池 =====
-STYLES = ["modern","vintage","minimal","urban","cinematic","natural","studio","retro"]
-MOODS  = ["elegant","playful","moody","romantic","calm","bold","warm","cool"]
-LIGHTS = ["soft lighting","golden-hour glow","window light","neon lights","backlight","overcast"]
-COMPS  = ["close-up","rule-of-thirds","symmetry","leading lines","wide shot"]
-WEARS  = ["casual","streetwear","office","evening dress","sporty","retro"]
-BACKS  = ["urban backdrop","nature scene","indoor studio","minimal set","bedroom scene"]
-
 # ===== 小工具 =====
-def _rng(seed: str):
-    import hashlib, random
-    h = hashlib.md5(seed.encode("utf-8")).hexdigest()
-    return random.Random(int(h[:8], 16))
-
-def _facets(r):
-    return dict(style=r.choice(STYLES), mood=r.choice(MOODS), light=r.choice(LIGHTS),
-                comp=r.choice(COMPS), wear=r.choice(WEARS), back=r.choice(BACKS))
-
-def _clamp(s: str, mx: int):
-    if len(s) <= mx: return s
-    cut = s[:mx].rsplit(" ", 1)[0]
-    return cut if len(cut) >= int(mx*0.8) else s[:mx]
-
-def _pad_to(s: str, mn: int, r, pads: list):
-    t = s
-    while len(t) < mn and pads:
-        t += " — " + r.choice(pads); pads.pop(0)
-    return t
+_rng = tg.md5_rng
 
 def _read_lines(p: Path):
     if not p.exists(): return []
@@ -55,7 +33,7 @@ def _site_root_auto():
         for _ in range(4):
             if cur in seen: break
             seen.add(cur)
-            if (cur/"keywords").exists() or (cur/"index.html").exists() or (cur/"sitemap.xml").exists():
+            if (cur/"keywords").exists() or (cur/"index.html").exists() or (cur/"sitemap_index.xml").exists():
                 return cur
             cur = cur.parent
     return Path(__file__).resolve().parent
@@ -79,13 +57,6 @@ def _body_len(soup: BeautifulSoup):
     return len(re.sub(r"\s+"," ", soup.get_text(" ", strip=True)))
 
 # ===== 关键词池：目录名.txt（无则 all.txt）+ 唯一分配 =====
-def _pick_pool_for(rel_dir: str, kw_dir: Path):
-    parts = [p.lower() for p in Path(rel_dir).parts if p not in (".","")]
-    for name in reversed(parts):
-        f = kw_dir / f"{name}.txt"
-        if f.exists(): return _read_lines(f)
-    return _read_lines(kw_dir / "all.txt")
-
 def _load_used(kw_dir: Path):
     up = kw_dir / "used_keywords.json"
     if up.exists():
@@ -94,44 +65,149 @@ def _load_used(kw_dir: Path):
     return {}
 
 def _save_used(kw_dir: Path, used: dict):
-    (kw_dir / "used_keywords.json").write_text(
-        json.dumps(used, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    # 先写临时文件再替换：写到一半崩了也不会把占用表写坏
+    tmp = kw_dir / "used_keywords.json.tmp"
+    tmp.write_text(json.dumps(used, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, kw_dir / "used_keywords.json")
+
+class _FreeSlots:
+    """一个词池里还没被占用的下标（有序）；找“从 start 起第一个空位”用二分，不再逐个探测。"""
+    def __init__(self, pool, used_set):
+        self.pool = pool
+        self.pos = {}
+        for i, kw in enumerate(pool):
+            self.pos.setdefault(kw, []).append(i)
+        self.free = [i for i, kw in enumerate(pool) if kw not in used_set]
+
+    def first_from(self, start):
+        if not self.free: return None
+        j = bisect.bisect_left(self.free, start)
+        return self.pool[self.free[j % len(self.free)]]
+
+    def take(self, kw):
+        for i in self.pos.get(kw, ()):
+            j = bisect.bisect_left(self.free, i)
+            if j < len(self.free) and self.free[j] == i:
+                del self.free[j]
+
+class KeywordSession:
+    """
+    主关键词分配会话：整轮只读一次 used_keywords.json 和各词池，占用集合常驻内存（带下标），
+    每次分配追加一行到 used_keywords.journal（预写日志），攒满 flush_every 条或结束时才整表写回。
+    中途崩溃：下次打开会先把日志回放进占用表，已分配的词不会丢、也不会重复分配。
+    分配结果与旧的逐页读写版本完全一致。
+    """
+    JOURNAL = "used_keywords.journal"
+
+    def __init__(self, root_dir: Path, flush_every: int = 2000):
+        self.root_dir = root_dir.resolve()
+        self.kw_dir = self.root_dir / "keywords"
+        self.kw_dir.mkdir(exist_ok=True)
+        self.flush_every = flush_every
+        self.site_key = str(self.root_dir)
+        self.used = _load_used(self.kw_dir)
+        self._replay()
+        entry = self.used.setdefault(self.site_key, {"map": {}, "used_set": []})
+        self.map, self.used_list = entry["map"], entry["used_set"]
+        self.used_set = set(self.used_list)
+        self._pools = {}         # 词池文件 -> _FreeSlots
+        self._dir_pool = {}      # rel_dir -> 词池文件（None 表示没有词池）
+        self._journal = None
+        self._miss = None
+        self._pending = 0
+
+    def _replay(self):
+        jp = self.kw_dir / self.JOURNAL
+        if not jp.exists(): return
+        n = 0
+        for ln in jp.read_text(encoding="utf-8").splitlines():
+            try: rec = json.loads(ln)
+            except ValueError: continue          # 崩溃时写了半行
+            e = self.used.setdefault(rec["site"], {"map": {}, "used_set": []})
+            if rec["path"] not in e["map"]:
+                e["map"][rec["path"]] = rec["kw"]
+                e["used_set"].append(rec["kw"])
+                n += 1
+        if n:
+            print(f"[KW] 从日志恢复 {n} 条未落盘的关键词分配")
+            _save_used(self.kw_dir, self.used)
+        jp.unlink()
+
+    def _pool_for(self, rel_dir: str):
+        if rel_dir not in self._dir_pool:
+            parts = [p.lower() for p in Path(rel_dir).parts if p not in (".", "")]
+            cands = [self.kw_dir / f"{name}.txt" for name in reversed(parts)] + [self.kw_dir / "all.txt"]
+            f = next((c for c in cands if c.exists()), None)
+            if f is not None and f not in self._pools:
+                pool = _read_lines(f)
+                self._pools[f] = _FreeSlots(pool, self.used_set) if pool else None
+            self._dir_pool[rel_dir] = f
+        f = self._dir_pool[rel_dir]
+        return self._pools.get(f) if f is not None else None
+
+    def assign(self, abs_filepath: Path):
+        rel_path = str(abs_filepath.resolve().relative_to(self.root_dir))
+        hit = self.map.get(rel_path)
+        if hit is not None:
+            return hit
+
+        slots = self._pool_for(str(Path(rel_path).parent))
+        if slots is None:
+            if self._miss is None:
+                miss = self.root_dir / "logs" / "kw_miss.txt"
+                miss.parent.mkdir(parents=True, exist_ok=True)
+                self._miss = miss.open("a", encoding="utf-8")
+            self._miss.write(rel_path + "\n")
+            return None
+
+        r = _rng("kw::"+rel_path)
+        start = r.randrange(0, len(slots.pool))
+        pick = slots.first_from(start)
+        if pick is None: pick = slots.pool[start % len(slots.pool)]  # 词不够允许复用
+
+        self.map[rel_path] = pick
+        self.used_list.append(pick)
+        if pick not in self.used_set:
+            self.used_set.add(pick)
+            for other in self._pools.values():
+                if other is not None: other.take(pick)
+        self._log(rel_path, pick)
+        return pick
+
+    def _log(self, rel_path, kw):
+        if self._journal is None:
+            self._journal = (self.kw_dir / self.JOURNAL).open("a", encoding="utf-8")
+        self._journal.write(json.dumps({"site": self.site_key, "path": rel_path, "kw": kw}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """整表写回 used_keywords.json，然后清空日志。"""
+        if not self._pending: return
+        _save_used(self.kw_dir, self.used)
+        self._journal.close()
+        self._journal = None
+        (self.kw_dir / self.JOURNAL).unlink()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        if self._miss is not None:
+            self._miss.close(); self._miss = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # 出异常也落盘：已经写进页面暂存区的分配要和占用表保持一致
+        self.close()
 
 def assign_primary_kw(root_dir: Path, abs_filepath: Path):
-    kw_dir = root_dir / "keywords"
-    kw_dir.mkdir(exist_ok=True)
-    used = _load_used(kw_dir)
-    site_key = str(root_dir.resolve())
-    used.setdefault(site_key, {"map": {}, "used_set": []})
-
-    rel_path = str(abs_filepath.resolve().relative_to(root_dir.resolve()))
-    rel_dir  = str(Path(rel_path).parent)
-
-    if rel_path in used[site_key]["map"]:
-        return used[site_key]["map"][rel_path]
-
-    pool = _pick_pool_for(rel_dir, kw_dir)
-    if not pool:
-        miss = root_dir / "logs" / "kw_miss.txt"
-        miss.parent.mkdir(parents=True, exist_ok=True)
-        miss.open("a", encoding="utf-8").write(rel_path + "\n")
-        return None
-
-    r = _rng("kw::"+rel_path)
-    start = r.randrange(0, len(pool))
-    used_set = set(used[site_key]["used_set"])
-
-    pick = None
-    for i in range(len(pool)):
-        kw = pool[(start + i) % len(pool)]
-        if kw not in used_set: pick = kw; break
-    if pick is None: pick = pool[start % len(pool)]  # 词不够允许复用
-
-    used[site_key]["map"][rel_path] = pick
-    used[site_key]["used_set"].append(pick)
-    _save_used(kw_dir, used)
-    return pick
+    """单页入口（兼容旧调用）；批量处理请用 KeywordSession。"""
+    with KeywordSession(root_dir) as kws:
+        return kws.assign(abs_filepath)
 
 def _infer_kw(soup: BeautifulSoup, filepath: Path):
     h1 = soup.find("h1")
@@ -149,9 +225,8 @@ def _read_domain(root_dir: Path):
     except Exception:
         return None
 
-def fix_canonical_and_schema(soup: BeautifulSoup, filepath: Path, root_dir: Path):
-    """把 canonical 与 JSON-LD 的 url 修成 domain/相对路径（保留子目录）。读不到 domain 则跳过。"""
-    domain = _read_domain(root_dir)
+def fix_canonical_and_schema(soup: BeautifulSoup, filepath: Path, root_dir: Path, domain):
+    """把 canonical 与 JSON-LD 的 url 修成 domain/相对路径（保留子目录）。domain 由调用方整轮读一次，为空则跳过。"""
     if not domain: return False
     rel = str(filepath.resolve().relative_to(root_dir.resolve())).replace("\\", "/")
     expected = f"{domain}/{rel}"
@@ -186,43 +261,114 @@ def fix_canonical_and_schema(soup: BeautifulSoup, filepath: Path, root_dir: Path
         head.append(sc2); changed = True
     return changed
 
-# ===== 文案生成 =====
+# ===== 快速预检：合格页面不进 DOM =====
+# 只有同时满足两点才跳过 BeautifulSoup：
+#   1) 页面本身就是 bs4 序列化后的样子（标签小写、属性按字母序且都带双引号、空元素写成 <x/>、
+#      标签严格配对、文本里只有 &amp; &lt; &gt; 三种实体、没有裸的 < >、纯空白文本段只有单个空格或换行）
+#      ——这样解析再输出一定原样不变；
+#   2) title / description / 正文长度 / canonical / JSON-LD url 都已合格，两个修复函数什么都不会改。
+# 任何一项拿不准就返回 None，老老实实走 DOM；结果与全量走 DOM 逐字节一致。
+_VOID = {"area","base","br","col","embed","hr","img","input","link","meta","param","source","track","wbr"}
+_RE_BLOCK = re.compile(r"<(script|style)((?: [^\s=\"'/<>]+=\"[^\"<>]*\")*)>(.*?)</\1>|<!--.*?-->", re.S)
+_RE_TAG = re.compile(r"<([a-z][a-z0-9]*)((?: [^\s=\"'/<>]+=\"[^\"<>]*\")*)(/?)>|</([a-z][a-z0-9]*)>")
+_RE_ATTR = re.compile(r' ([^\s=\"\'/<>]+)="([^"<>]*)"')
+_RE_BAD_AMP = re.compile(r"&(?!amp;|lt;|gt;)")
+_RE_WS = re.compile(r"\s+")
+_ASCII_WS = " \n\t\f\r"
+_MULTI = {"class","rel","rev","accept-charset","headers","accesskey","dropzone"}   # bs4 按空白拆分再用单空格拼回
+TEXT_MARGIN = 20   # 正文长度离阈值太近的页面仍走 DOM
+
+def _unesc(s: str):
+    return s.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+
+def _attrs(raw: str):
+    """属性串 -> dict；不是 bs4 的写法（乱序 / 重名）返回 None。"""
+    pairs = _RE_ATTR.findall(raw)
+    names = [n for n, _ in pairs]
+    if names != sorted(set(names)) or any(n != n.lower() for n in names): return None
+    if any(n in _MULTI and v != " ".join(v.split()) for n, v in pairs): return None
+    return {n: _unesc(v) for n, v in pairs}
+
+def _ws_ok(seg: str):
+    # bs4 会把只含 ASCII 空白的文本段压成一个换行（含换行时）或一个空格
+    return not seg or seg.strip(_ASCII_WS) != "" or seg in (" ", "\n")
+
+def prescan(html: str):
+    """字节级抽出 title / description / canonical / JSON-LD / 正文长度；页面不是 bs4 定型输出时返回 None。"""
+    if html.startswith("<!DOCTYPE"):
+        # bs4 输出 doctype 后固定补一个换行，再接压缩过的空白段：只有紧跟 "\n\n" 的写法解析再输出不变
+        if not html.startswith("<!DOCTYPE html>\n\n<"): return None
+        html = html[len("<!DOCTYPE html>\n\n"):]
+    if "\x00" in html: return None
+    ld = []
+    for m in _RE_BLOCK.finditer(html):
+        if m.group(1) is None:                   # 注释
+            if not _ws_ok(m.group(0)[4:-3]): return None
+            continue
+        if not _ws_ok(m.group(3)) or _RE_BAD_AMP.search(m.group(2)): return None
+        at = _attrs(m.group(2))
+        if at is None: return None
+        if m.group(1) == "script" and at.get("type") == "application/ld+json":
+            ld.append(m.group(3))
+    rest = _RE_BLOCK.sub("\x00", html)           # 脚本/样式/注释各自是独立的文本段，用占位符隔开
+    if "<!" in rest or _RE_BAD_AMP.search(rest): return None
+
+    stack, n_tags, info = [], 0, {"html": False, "head": False, "body": False}
+    title = desc = canon = None
+    text, pos = [], 0
+    for m in _RE_TAG.finditer(rest):
+        n_tags += 1
+        text.append(rest[pos:m.start()]); pos = m.end()
+        name, raw, slash, close = m.groups()
+        if close:
+            if close in _VOID or not stack or stack.pop() != close: return None
+            if close == "title" and title is None: title = rest[title_at:m.start()]
+            continue
+        if (name in _VOID) != bool(slash): return None
+        at = _attrs(raw)
+        if at is None: return None
+        if name in info: info[name] = True
+        if name not in _VOID: stack.append(name)
+        if name == "title" and title is None: title_at = m.end()
+        elif name == "meta" and desc is None and at.get("name") == "description":
+            desc = at.get("content") or ""
+        elif name == "link" and canon is None and "canonical" in at.get("rel", "").split():
+            canon = at.get("href")
+    text.append(rest[pos:])
+    if stack or not all(info.values()): return None
+    if not all(_ws_ok(seg) for t in text for seg in t.split("\x00")): return None
+    if rest.count("<") != n_tags or rest.count(">") != n_tags: return None
+    # title 里夹了注释（被换成 \x00）时 bs4 的 soup.title.string 是 None，DOM 路径会当成空标题重写
+    if title is not None and ("<" in title or "\x00" in title): return None
+
+    url = None
+    for raw in ld:
+        try: obj = json.loads(raw)
+        except Exception: continue
+        if isinstance(obj, dict) and obj.get("@type") in ("WebPage","CollectionPage","ItemPage"):
+            url = obj.get("url"); break
+    return {"title": _unesc(title or ""), "desc": desc or "", "canonical": canon, "ld_url": url,
+            "text_len": len(_RE_WS.sub(" ", _unesc(" ".join(text).replace("\x00", " "))).strip())}
+
+def is_compliant(info, expected):
+    """预检结果是否说明两个修复函数都不会动这一页；expected 为 None 表示读不到 domain（不修 canonical）。"""
+    if info is None: return False
+    if len(info["title"]) < 30 or len(info["desc"]) < 110 or info["text_len"] < MIN_BODY + TEXT_MARGIN:
+        return False
+    return expected is None or (info["canonical"] == expected and info["ld_url"] == expected)
+
+# ===== 文案生成（nb_textgen：预编译模板） =====
 def gen_title(keyword: str, brand: str, seed: str):
-    r = _rng("t::"+seed); f = _facets(r)
-    cands = [
-        f"{keyword} {f['style']} portraits | {brand}",
-        f"{keyword} gallery — {f['mood']} tone | {brand}",
-        f"{keyword} photos, {f['light']} | {brand}",
-        f"High-quality {keyword} images — {f['comp']} | {brand}",
-        f"{keyword} {f['mood']} lookbook | {brand}",
-    ]
-    t = r.choice(cands)
-    if len(t) < TARGET_TITLE[0]: t += f" — {f['mood']} {f['style']}"
-    return _clamp(t, TARGET_TITLE[1])
+    return tg.title(keyword, brand, seed, *TARGET_TITLE)
 
 def gen_desc(keyword: str, seed: str):
-    r = _rng("d::"+seed); f = _facets(r)
-    base = (f"Explore {keyword} in {f['style']} style with {f['mood']} vibe, "
-            f"{f['light']}, and {f['comp']} framing. Curated images on a fast, clean page.")
-    pads = [f"{f['wear']} looks and {f['back']}",
-            "Simple navigation helps discovery",
-            "Mobile-friendly layout for smooth viewing",
-            "Short notes keep context clear",
-            "Clean typography keeps focus on the visuals"]
-    s = _pad_to(base, TARGET_DESC[0], r, pads)
-    return _clamp(s, TARGET_DESC[1])
+    return tg.desc(keyword, seed, *TARGET_DESC)
 
 def gen_para(keyword: str, seed: str):
-    r = _rng("p::"+seed); f = _facets(r)
-    s = (f"This set explores {keyword} through {f['style']} aesthetics and {f['mood']} tone under {f['light']}. "
-         f"Compositions use {f['comp']} with {f['back']}, keeping focus clear and tidy. "
-         f"Details like {f['wear']} styling and balanced colors make browsing easy.")
-    if len(s) < MIN_BODY:
-        s += " Pages load quickly and related links help deeper viewing."
-    return _clamp(s, 300)
+    return tg.para(keyword, seed, MIN_BODY, 300)
 
 # ===== 只修不合格的内容 =====
-def enhance_content_if_needed(soup: BeautifulSoup, filepath: Path, brand: str, root_dir: Path):
+def enhance_content_if_needed(soup: BeautifulSoup, filepath: Path, brand: str, root_dir: Path, kws: KeywordSession = None):
     title_now = (soup.title.string if soup.title and soup.title.string else "")
     mdesc = soup.find("meta", {"name":"description"})
     desc_now = (mdesc.get("content") if mdesc else "") or ""
@@ -231,7 +377,7 @@ def enhance_content_if_needed(soup: BeautifulSoup, filepath: Path, brand: str, r
     need = (len(title_now) < 30) or (len(desc_now) < 110) or (body_len < MIN_BODY)
     if not need: return False
 
-    kw = assign_primary_kw(root_dir, filepath) or _infer_kw(soup, filepath)
+    kw = (kws.assign(filepath) if kws else assign_primary_kw(root_dir, filepath)) or _infer_kw(soup, filepath)
     seed = str(filepath)
 
     new_title = gen_title(kw, brand, seed)
@@ -268,30 +414,52 @@ def main():
     if not root.exists(): print(f"[FATAL] 根目录不存在：{root}"); sys.exit(2)
 
     (root/"logs").mkdir(exist_ok=True)
-    html_files = list(root.rglob("*.html"))
+    metrics = nb_metrics.start("v4_patch_single_site", root)
     fixed_content = fixed_canonical = 0
-
-    for i, fp in enumerate(html_files, 1):
-        try:
-            html = fp.read_text(encoding="utf-8")
-        except Exception:
-            html = fp.read_text(errors="ignore")
-        soup = BeautifulSoup(html, "html.parser")
-
-        if enhance_content_if_needed(soup, fp, brand, root):
-            fixed_content += 1
-
-        if fix_canonical_and_schema(soup, fp, root):
-            fixed_canonical += 1
-
-        new_html = str(soup)
-        if new_html != html:
-            fp.write_text(new_html, encoding="utf-8")
-
-        if i % 500 == 0:
-            print(f"[PROGRESS] {i}/{len(html_files)} ; content_fixed={fixed_content} ; canonical_fixed={fixed_canonical}")
-
-    print(f"[DONE] root={root} ; total={len(html_files)} ; content_fixed={fixed_content} ; canonical_fixed={fixed_canonical}")
+    domain = _read_domain(root)
+    i = 0
+
+    # 写回走事务层：整轮结束才原子替换，崩溃不会留下半改的站
+    # 流式遍历（不建全站清单），每页处理完 decompose() 拆 DOM，页面循环本身不随页数涨内存；
+    # 关键词占用表由 KeywordSession 整轮只读一次、结束时写回一次
+    with PageWriter(root, stage="v4_patch_single_site") as pw, KeywordSession(root) as kws:
+        for i, entry in enumerate(iter_pages(root), 1):
+            fp = Path(entry.path)
+            try:
+                html = fp.read_text(encoding="utf-8")
+            except Exception:
+                html = fp.read_text(errors="ignore")
+            metrics.read(html)
+            if i % 500 == 0:
+                print(f"[PROGRESS] {i} ; content_fixed={fixed_content} ; canonical_fixed={fixed_canonical}")
+            with metrics.timer("prescan"):
+                rel = str(fp.resolve().relative_to(root)).replace("\\", "/")
+                ok = is_compliant(prescan(html), f"{domain}/{rel}" if domain else None)
+            if ok:
+                metrics.count("prescan_skip")
+                metrics.skipped()
+                continue
+            with metrics.timer("parse"):
+                soup = BeautifulSoup(html, "html.parser")
+            metrics.count("files_parsed")
+
+            with metrics.timer("content"):
+                if enhance_content_if_needed(soup, fp, brand, root, kws):
+                    fixed_content += 1
+
+            with metrics.timer("canonical"):
+                if fix_canonical_and_schema(soup, fp, root, domain):
+                    fixed_canonical += 1
+
+            with metrics.timer("serialize"):
+                new_html = str(soup)
+            soup.decompose()
+            if new_html != html:
+                pw.write(fp, new_html)
+            else:
+                metrics.skipped()
+
+    print(f"[DONE] root={root} ; total={i} ; content_fixed={fixed_content} ; canonical_fixed={fixed_canonical}")
 
 if __name__ == "__main__":
-    main()
+    nb_profile.run_main("v4_patch_single_site", main)
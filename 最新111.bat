@@ -54,14 +54,14 @@ if exist "%~dp0v4_patch_single_site.py" (
   echo ❌ 未找到补丁：%~dp0v4_patch_single_site.py
 )
 
-REM ===== 6) 生成/重建正确的 sitemap.xml（新加） =====
-echo 🗺️ 正在重建 sitemap.xml...
+REM ===== 6) 生成/重建 sitemap 分片 + sitemap_index.xml（新加） =====
+echo 🗺️ 正在重建 sitemap（分片 + index）...
 python "%~dp0sitemap_fix.py"
 
-REM 强制把 sitemap.xml 纳入版本控制（防止被 .gitignore 忽略）
+REM 强制把 sitemap_index.xml 及分片纳入版本控制（防止被 .gitignore 忽略）
 where git >nul 2>nul && (
   git rev-parse --is-inside-work-tree >nul 2>nul && (
-    git add -f sitemap.xml >nul 2>nul
+    git add -f sitemap_index.xml sitemap-*.xml.gz >nul 2>nul
   )
 )
 
@@ -80,12 +80,12 @@ if "%DOMAIN%"=="" (
   goto :END
 )
 
-set "SITEMAP_URL=%DOMAIN%/sitemap.xml"
+set "SITEMAP_URL=%DOMAIN%/sitemap_index.xml"
 echo 🌍 准备 Ping：%SITEMAP_URL%
 
 REM 没有本地 sitemap 就不 Ping（理论上上一步已生成，这里只是兜底）
-if not exist "%~dp0sitemap.xml" (
-  echo ⚠️ 本地未发现 sitemap.xml，跳过 Ping。
+if not exist "%~dp0sitemap_index.xml" (
+  echo ⚠️ 本地未发现 sitemap_index.xml，跳过 Ping。
   goto :END
 )
 